@@ -1,11 +1,71 @@
 # backend/ai_enhancer.py
-import requests
-from typing import List
+import re
+import json
+import asyncio
+import httpx
+from typing import Dict, List, Optional, Tuple
+
+from deadline import Deadline, DeadlineExceeded
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+
+# اتصالات keep-alive مشتركة بين كل الطلبات (بدلاً من اتصال جديد لكل استدعاء)
+POOL_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+# انتظار اتصال حر من المجمع منفصل عن مهلة الطلب نفسه
+POOL_TIMEOUT_SECONDS = 30.0
+# حد إجابة التصنيف الجماعي (حد مخرجات DeepSeek)
+BATCH_MAX_TOKENS = 8192
+# زوج "مفتاح": "قيمة" مكتمل داخل JSON (لاستخراج ما وصل من إجابة مقطوعة)
+_JSON_PAIR = re.compile(r'"((?:[^"\\]|\\.)*)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
 
 class AIEnhancer:
-    def __init__(self, api_key: str, provider: str = "deepseek"):
+    def __init__(self, api_key: str, provider: str = "deepseek", base_url: str = DEEPSEEK_BASE_URL,
+                 client: Optional[httpx.AsyncClient] = None):
         self.api_key = api_key
         self.provider = provider.lower()
+        self.base_url = base_url.rstrip("/")
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """عميل HTTP غير متزامن واحد لكل مُحسِّن (يُنشأ عند أول استخدام)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=POOL_LIMITS, timeout=self._timeout(10.0))
+        return self._client
+
+    @staticmethod
+    def _timeout(seconds: float) -> httpx.Timeout:
+        return httpx.Timeout(seconds, connect=min(5.0, seconds), pool=min(POOL_TIMEOUT_SECONDS, seconds))
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+
+    async def _chat(self, prompt: str, temperature: float, max_tokens: int, timeout: float,
+                    json_output: bool = False, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """استدعاء chat completions؛ يعيد النص أو None إذا لم تكن الاستجابة 200"""
+        if deadline is not None:
+            if deadline.expired():
+                raise DeadlineExceeded("request deadline exceeded")
+            timeout = deadline.timeout(timeout)
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        json_body = {
+            "model": "deepseek-chat",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if json_output:
+            json_body["response_format"] = {"type": "json_object"}
+        response = await self.client.post(f"{self.base_url}/chat/completions", headers=headers,
+                                          json=json_body, timeout=self._timeout(timeout))
+        if response.status_code != 200:
+            return None
+        return response.json()["choices"][0]["message"]["content"].strip()
 
     def _get_classification_prompt(self, domain: str, categories: List[str]) -> str:
         categories_str = "\n".join(f"- {cat}" for cat in categories)
@@ -19,54 +79,143 @@ Choose the SINGLE most appropriate category from the following list:
 Respond ONLY with the exact category name. Do not add explanations, punctuation, or extra text.
 If none match perfectly, choose the closest one."""
 
-    def classify_domain(self, domain: str, categories: List[str]) -> str:
+    async def classify_domain(self, domain: str, categories: List[str], deadline: Optional[Deadline] = None) -> str:
         if not self.api_key:
             return "Generic"
         try:
             prompt = self._get_classification_prompt(domain, categories)
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            json_body = {
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.0,
-                "max_tokens": 30
-            }
-            response = requests.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                headers=headers,
-                json=json_body,
-                timeout=8
-            )
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"].strip()
-                # تنظيف الإجابة بشكل أفضل
-                cleaned = content.strip('"\'').strip('.,!?;:').strip()
-                if cleaned in categories:
-                    return cleaned
-                else:
-                    # محاولة مطابقة جزئية
-                    for category in categories:
-                        if cleaned.lower() in category.lower() or category.lower() in cleaned.lower():
-                            return category
-                    return "Generic"
-            else:
+            content = await self._chat(prompt, temperature=0.0, max_tokens=30, timeout=8, deadline=deadline)
+            if content is None:
                 return "Generic"
+            return self._match_category(content, categories) or "Generic"
         except Exception as e:
-            print(f"⚠️ AI Classification failed: {e}")
+            if deadline is not None and deadline.expired():
+                deadline.degrade("classification")
+            else:
+                print(f"⚠️ AI Classification failed: {e}")
             return "Generic"
 
-    def get_insight(self, appraisal_result: dict) -> str:
-        """نفس الكود الحالي - يبقى دون تغيير"""
+    @staticmethod
+    def _match_category(answer: str, categories: List[str]) -> Optional[str]:
+        """مطابقة إجابة النموذج مع قائمة الفئات (تطابق تام ثم جزئي)؛ None إذا لم تطابق"""
+        # تنظيف الإجابة بشكل أفضل
+        cleaned = answer.strip().strip('"\'').strip('.,!?;:').strip()
+        if not cleaned:
+            return None
+        if cleaned in categories:
+            return cleaned
+        # محاولة مطابقة جزئية
+        for category in categories:
+            if cleaned.lower() in category.lower() or category.lower() in cleaned.lower():
+                return category
+        return None
+
+    def _get_batch_classification_prompt(self, domains: List[str], categories: List[str]) -> str:
+        categories_str = "\n".join(f"- {cat}" for cat in categories)
+        return f"""You are a domain name expert in 2025.
+For EACH domain name below, choose the SINGLE most appropriate category from this list:
+
+{categories_str}
+
+Domains (JSON array): {json.dumps(domains)}
+
+Respond ONLY with a JSON object mapping every domain exactly as given to its exact category name,
+for example {{"example.com": "Finance"}}. If none match perfectly, choose the closest one."""
+
+    @staticmethod
+    def _batch_max_tokens(domains: List[str], categories: List[str]) -> int:
+        """
+        ميزانية الإجابة من أطوال النطاقات وأطول فئة: كل مدخل '"domain": "Category", '
+        بتقدير 3 أحرف لكل token (النطاقات تُقسم إلى tokens أقصر من الكلمات العادية)
+        """
+        longest_category = max((len(category) for category in categories), default=0)
+        chars = sum(len(json.dumps(domain)) + longest_category + 6 for domain in domains)
+        return min(40 + chars // 3 + len(domains), BATCH_MAX_TOKENS)
+
+    @staticmethod
+    def _parse_batch_answer(content: str) -> Dict[str, str]:
+        """
+        استخراج كائن JSON من الإجابة (مع تجاهل ```json ... ``` إن وجد).
+        إذا قُطعت الإجابة في منتصف JSON تُحفظ الأزواج المكتملة فقط.
+        """
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        parsed = None
+        if match:
+            try:
+                parsed = json.loads(match.group(0))
+            except ValueError:
+                parsed = None
+        if not isinstance(parsed, dict):
+            parsed = {}
+            for key, value in _JSON_PAIR.findall(content):
+                try:
+                    parsed[json.loads(f'"{key}"')] = json.loads(f'"{value}"')
+                except ValueError:
+                    continue
+        return {str(k).strip().lower(): v for k, v in parsed.items() if isinstance(v, str)}
+
+    async def _classify_batch(self, domains: List[str], categories: List[str],
+                              deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """دفعة واحدة في طلب واحد؛ يعيد فقط النطاقات التي وردت إجاباتها صالحة"""
+        prompt = self._get_batch_classification_prompt(domains, categories)
+        content = await self._chat(prompt, temperature=0.0, max_tokens=self._batch_max_tokens(domains, categories),
+                                   timeout=30, json_output=True, deadline=deadline)
+        if content is None:
+            return {}
+        answers = self._parse_batch_answer(content)
+        results = {}
+        for domain in domains:
+            answer = answers.get(domain.lower())
+            if answer is not None:
+                results[domain] = self._match_category(answer, categories) or "Generic"
+        return results
+
+    async def classify_domains(self, domains: List[str], categories: List[str], batch_size: int = 40,
+                               max_concurrency: int = 4, max_retries: int = 2,
+                               deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """
+        تصنيف عدة نطاقات: عشرات النطاقات في كل طلب (إجابة JSON) وقائمة الفئات مرة واحدة لكل دفعة.
+        الدفعات تعمل بالتوازي بحد أقصى max_concurrency، ويُعاد إرسال النطاقات التي لم تُفهم إجابتها فقط.
+        عند نفاد deadline تتوقف الإعادة وتصبح النطاقات المتبقية "Generic".
+        """
+        pending = list(dict.fromkeys(domains))
+        if not self.api_key:
+            return {domain: "Generic" for domain in pending}
+        results: Dict[str, str] = {}
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(batch: List[str]) -> Dict[str, str]:
+            async with semaphore:
+                try:
+                    return await self._classify_batch(batch, categories, deadline)
+                except Exception as e:
+                    if deadline is None or not deadline.expired():
+                        print(f"⚠️ AI batch classification failed ({len(batch)} domains): {e}")
+                    return {}
+
+        for _ in range(max_retries + 1):
+            if not pending:
+                break
+            if deadline is not None and deadline.expired():
+                deadline.degrade("classification")
+                break
+            batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+            for answered in await asyncio.gather(*(run(batch) for batch in batches)):
+                results.update(answered)
+            pending = [domain for domain in pending if domain not in results]
+
+        for domain in pending:
+            results[domain] = "Generic"
+        return results
+
+    async def get_insight(self, appraisal_result: dict, deadline: Optional[Deadline] = None) -> str:
         try:
             atom_context = ""
             if appraisal_result.get("atom_listings"):
                 listings = appraisal_result["atom_listings"][:2]
                 names = [f"{l['domain']} (${l['price']:,})" for l in listings]
                 atom_context = f" Similar domains are currently listed on Atom: {', '.join(names)}."
-            
+
             prompt = f"""You are a domain name valuation expert in 2025.
 The domain "{appraisal_result['domain']}" belongs to the "{appraisal_result.get('category', 'General')}" category.
 Key factors: {', '.join(appraisal_result['reasons'])}.{atom_context}
@@ -75,25 +224,33 @@ Provide a short paragraph (30–50 words) explaining:
 - Which industry or use case it best fits
 - Do not mention the price. Be realistic and professional.
 """
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            json_body = {
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": prompt.strip()}],
-                "temperature": 0.7,
-                "max_tokens": 100
-            }
-            response = requests.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                headers=headers,
-                json=json_body,
-                timeout=10
-            )
-            if response.status_code == 200:
-                return response.json()['choices'][0]['message']['content'].strip()
+            content = await self._chat(prompt.strip(), temperature=0.7, max_tokens=100, timeout=10, deadline=deadline)
+            if content is not None:
+                return content
             else:
                 return "Insight not available at this time."
         except Exception as e:
-            return "Failed to load AI insight."
\ No newline at end of file
+            if deadline is not None and deadline.expired():
+                # الرؤية اختيارية: لا نؤخر الاستجابة بسببها
+                deadline.degrade("insight")
+                return ""
+            return "Failed to load AI insight."
+
+
+# مُحسِّن مشترك لكل (مفتاح، مزود، عنوان) حتى يُعاد استخدام نفس مجمع الاتصالات بين الطلبات
+_enhancers: Dict[Tuple[str, str, str], AIEnhancer] = {}
+
+
+def get_ai_enhancer(api_key: str, provider: str = "deepseek", base_url: str = DEEPSEEK_BASE_URL) -> AIEnhancer:
+    key = (api_key, provider.lower(), base_url)
+    enhancer = _enhancers.get(key)
+    if enhancer is None:
+        enhancer = _enhancers[key] = AIEnhancer(api_key, provider=provider, base_url=base_url)
+    return enhancer
+
+
+async def close_ai_enhancers() -> None:
+    """إغلاق كل الاتصالات المفتوحة (عند إيقاف التطبيق)"""
+    for enhancer in list(_enhancers.values()):
+        await enhancer.aclose()
+    _enhancers.clear()
@@ -1,13 +1,18 @@
 # backend/appraisal_engine.py
 import os
 import re
-import joblib
+import json
+import hashlib
 import numpy as np
+from types import MappingProxyType
 from typing import Dict, List, Any, Optional
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, "model", "domain_valuation_model.pkl")
-FEATURE_NAMES_PATH = os.path.join(BASE_DIR, "model", "feature_names.pkl")
+from model_registry import BASE_DIR, MODEL_PATH, FEATURE_NAMES_PATH, ModelRegistry, model_registry
+from keyword_matcher import KeywordMatcher
+from classification_cache import ClassificationCache, categories_version
+from local_classifier import LocalClassifier
+from deadline import Deadline
+from feature_store import FEATURE_STORE_FORMAT_VERSION, FeatureStore, get_default_feature_store
 
 # قائمة الفئات الرسمية من Atom (للاستخدام في حالة فشل AI)
 ATOM_CATEGORIES = [
@@ -39,8 +44,19 @@ ATOM_CATEGORIES = [
     "Pharma", "Office & Business Supplies", "Podcast", "Oil and Gas"
 ]
 
+# يتغير عند تعديل قائمة الفئات (جزء من مفتاح كاش التصنيفات)
+ATOM_CATEGORIES_VERSION = categories_version(ATOM_CATEGORIES)
+ATOM_CATEGORIES_SET = frozenset(ATOM_CATEGORIES)
+
+# أقل ثقة للمصنف المحلي قبل اللجوء إلى AI
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = 0.8
+
+def _deadline_kwargs(deadline: Optional[Deadline]) -> Dict[str, Any]:
+    """تمرير deadline إلى مُحسِّن AI فقط عند وجوده (المُحسِّنات القديمة لا تقبله)"""
+    return {"deadline": deadline} if deadline is not None else {}
+
 # نظام الكلمات المفتاحية المحسن
-KEYWORD_CATEGORY_MAP = {
+_KEYWORD_CATEGORY_MAP = {
     # Tech & AI
     'ai': 'Bots & AI', 'bot': 'Bots & AI', 'tech': 'Tech, Internet, Software',
     'app': 'Mobile App', 'cloud': 'Tech, Internet, Software', 'data': 'Analytics',
@@ -121,20 +137,263 @@ KEYWORD_CATEGORY_MAP = {
     'sport': 'Sports', 'fitness': 'Fitness & Gym', 'workout': 'Fitness & Gym',
     'gym': 'Fitness & Gym', 'fit': 'Fitness & Gym',
 }
+# للقراءة فقط: التعديل عبر reload_keyword_map وحدها (حتى يُعاد بناء المطابق وتتغير بصمة الميزات)
+KEYWORD_CATEGORY_MAP = MappingProxyType(_KEYWORD_CATEGORY_MAP)
+
+# الكلمات عالية القيمة المستخدمة في keyword_score
+HIGH_VALUE_KEYWORDS = frozenset({
+    'ai', 'agent', 'cloud', 'medic', 'lean', 'glitch', 'content',
+    'digital', 'smart', 'tech', 'app', 'crypto', 'nft', 'blockchain'
+})
+
+# المطابق المترجم (Aho-Corasick) يُبنى مرة واحدة ويُعاد بناؤه عند تغير خريطة الكلمات
+_keyword_matcher: Optional[KeywordMatcher] = None
+_keyword_matcher_key: Optional[int] = None
+_keyword_map_version = 0
+
+
+def reload_keyword_map(new_map: Optional[Dict[str, str]] = None) -> None:
+    """استبدال/تحديث خريطة الكلمات المفتاحية وإجبار إعادة بناء المطابق"""
+    global _keyword_map_version
+    if new_map is not None:
+        _KEYWORD_CATEGORY_MAP.clear()
+        _KEYWORD_CATEGORY_MAP.update(new_map)
+    _keyword_map_version += 1
+
+
+def keyword_map_version() -> int:
+    """يزداد مع كل reload_keyword_map (جزء من جيل البيانات لكاش النتائج)"""
+    return _keyword_map_version
+
+
+def get_keyword_matcher() -> KeywordMatcher:
+    """المطابق الحالي (يُعاد بناؤه بعد reload_keyword_map، الطريقة الوحيدة لتغيير الخريطة)"""
+    global _keyword_matcher, _keyword_matcher_key
+    key = _keyword_map_version
+    if _keyword_matcher is None or _keyword_matcher_key != key:
+        _keyword_matcher = KeywordMatcher(KEYWORD_CATEGORY_MAP, HIGH_VALUE_KEYWORDS)
+        _keyword_matcher_key = key
+    return _keyword_matcher
+
+
+# أوزان خوارزمية التشابه (نفس الأوزان المستخدمة في _calculate_similarity)
+SIMILARITY_WEIGHTS = {
+    'length': 0.2,        # زيادة وزن الطول
+    'tld_score': 0.15,    # تقليل وزن TLD
+    'has_hyphen': 0.1,
+    'has_digits': 0.1,
+    'keyword_score': 0.2,  # تقليل وزن الكلمات
+    'vowel_ratio': 0.15,   # زيادة وزن النطق
+    'is_brandable': 0.1   # زيادة وزن القابلية للبرندة
+}
+
+# الميزات العددية التي يُدرَّب عليها النموذج وتُخزن في مخزن الميزات (بنفس ترتيب _build_features)
+FEATURE_COLUMNS = ('length', 'tld_score', 'has_hyphen', 'has_digits', 'digit_count',
+                   'vowel_ratio', 'keyword_score', 'is_brandable')
+_SIMILARITY_COLUMN_INDICES = [FEATURE_COLUMNS.index(name) for name in SIMILARITY_WEIGHTS]
+
+# عدد البتات المفعلة لكل بايت (لحساب تقاطع الـ bitset)
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class FeatureMatrix:
+    """
+    مصفوفة ميزات عمودية لمجموعة من النطاقات (مبيعات أو عروض) + bitset للكلمات المفتاحية.
+    تُبنى مرة واحدة عند تحميل البيانات، ثم يُحسب التشابه لكل السجلات دفعة واحدة.
+    """
+
+    def __init__(self, records: List[Dict], columns: np.ndarray, keyword_bits: np.ndarray,
+                 keyword_counts: np.ndarray, vocabulary: Dict[str, int], positions: np.ndarray):
+        self.records = records
+        self.positions = positions          # مواقع السجلات في القائمة الأصلية
+        self.columns = columns              # (n, len(SIMILARITY_WEIGHTS)) float64
+        self.keyword_bits = keyword_bits    # (n, ceil(len(vocabulary) / 8)) uint8
+        self.keyword_counts = keyword_counts
+        self.vocabulary = vocabulary
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @classmethod
+    def from_records(cls, records: List[Dict], engine: "AppraisalEngine",
+                     required_fields: tuple = ('domain',)) -> "FeatureMatrix":
+        """بناء المصفوفة من قائمة سجلات تحتوي على 'domain' (يتم تخطي السجلات غير الصالحة)"""
+        vocabulary = {keyword: i for i, keyword in enumerate(KEYWORD_CATEGORY_MAP)}
+        if engine.feature_store is not None:
+            return cls._from_store(records, engine, required_fields, vocabulary)
+        kept, positions, rows, keyword_rows = [], [], [], []
+        for position, record in enumerate(records):
+            try:
+                if any(field not in record for field in required_fields):
+                    continue
+                features, keywords = engine._analyze_domain(record['domain'])
+            except Exception:
+                continue
+            kept.append(record)
+            positions.append(position)
+            rows.append([features[name] for name in SIMILARITY_WEIGHTS])
+            keyword_rows.append([vocabulary[k] for k in keywords if k in vocabulary])
+
+        columns = np.array(rows, dtype=np.float64).reshape(len(kept), len(SIMILARITY_WEIGHTS))
+        membership = np.zeros((len(kept), len(vocabulary)), dtype=bool)
+        for i, indices in enumerate(keyword_rows):
+            membership[i, indices] = True
+        keyword_counts = membership.sum(axis=1)
+        keyword_bits = np.packbits(membership, axis=1)
+        return cls(kept, columns, keyword_bits, keyword_counts, vocabulary,
+                   np.array(positions, dtype=np.int64))
+
+    @classmethod
+    def _from_store(cls, records: List[Dict], engine: "AppraisalEngine", required_fields: tuple,
+                    vocabulary: Dict[str, int]) -> "FeatureMatrix":
+        """نفس from_records لكن الميزات تُقرأ من مخزن الميزات (وتُحسب فقط للنطاقات الجديدة)"""
+        candidates, domains = [], []
+        for position, record in enumerate(records):
+            try:
+                if any(field not in record for field in required_fields) or not isinstance(record['domain'], str):
+                    continue
+            except Exception:
+                continue
+            candidates.append(position)
+            domains.append(record['domain'])
+
+        values, keyword_bits, valid = engine.feature_rows(domains)
+        positions = np.array(candidates, dtype=np.int64)[valid]
+        keyword_bits = keyword_bits[valid]
+        return cls([records[p] for p in positions], values[valid][:, _SIMILARITY_COLUMN_INDICES], keyword_bits,
+                   _POPCOUNT_TABLE[keyword_bits].sum(axis=1, dtype=np.int64), vocabulary, positions)
+
+    def take(self, indices) -> "FeatureMatrix":
+        """مصفوفة جديدة بالسجلات المحددة وبالترتيب المعطى"""
+        indices = np.asarray(indices, dtype=np.int64)
+        return FeatureMatrix([self.records[i] for i in indices], self.columns[indices], self.keyword_bits[indices],
+                             self.keyword_counts[indices], self.vocabulary, np.arange(len(indices), dtype=np.int64))
+
+    @staticmethod
+    def concat(first: "FeatureMatrix", second: "FeatureMatrix") -> Optional["FeatureMatrix"]:
+        """دمج مصفوفتين بنفس قاموس الكلمات (None إذا اختلف القاموس)"""
+        if first.vocabulary != second.vocabulary:
+            return None
+        return FeatureMatrix(first.records + second.records,
+                             np.concatenate([first.columns, second.columns]),
+                             np.concatenate([first.keyword_bits, second.keyword_bits]),
+                             np.concatenate([first.keyword_counts, second.keyword_counts]),
+                             first.vocabulary, np.arange(len(first) + len(second), dtype=np.int64))
+
+    def basic_similarity(self, features: Dict[str, Any]) -> np.ndarray:
+        """نسخة متجهة من _calculate_similarity لكل السجلات (نفس ترتيب العمليات لنتائج مطابقة)"""
+        return self.basic_similarity_many([features])[0]
+
+    def basic_similarity_many(self, features_list: List[Dict[str, Any]]) -> np.ndarray:
+        """التشابه الأساسي لعدة نطاقات دفعة واحدة: مصفوفة (عدد النطاقات، عدد السجلات)"""
+        queries = np.array([[float(f.get(feature, 0)) for feature in SIMILARITY_WEIGHTS] for f in features_list],
+                           dtype=np.float64).reshape(len(features_list), len(SIMILARITY_WEIGHTS))
+        similarity = np.zeros((len(features_list), len(self.records)), dtype=np.float64)
+        total_weight = 0.0
+        for j, weight in enumerate(SIMILARITY_WEIGHTS.values()):
+            column = self.columns[:, j][np.newaxis, :]
+            value = queries[:, j][:, np.newaxis]
+            max_val = np.maximum(np.maximum(np.abs(column), np.abs(value)), 1.0)
+            diff = np.abs(value - column) / max_val
+            similarity += weight * (1 - diff)
+            total_weight += weight
+        return np.clip(similarity / total_weight, 0.0, 1.0)
+
+    def keyword_similarity(self, keywords: List[str]) -> np.ndarray:
+        """نسخة متجهة من _calculate_keyword_similarity (Jaccard) باستخدام الـ bitset"""
+        return self.keyword_similarity_many([keywords])[0]
+
+    def keyword_similarity_many(self, keywords_list: List[List[str]]) -> np.ndarray:
+        """تشابه الكلمات المفتاحية لعدة نطاقات دفعة واحدة: مصفوفة (عدد النطاقات، عدد السجلات)"""
+        similarity = np.zeros((len(keywords_list), len(self.records)), dtype=np.float64)
+        valid = self.keyword_counts > 0
+        for q, keywords in enumerate(keywords_list):
+            query = set(keywords)
+            if not query or not len(self.records):
+                continue
+            membership = np.zeros(len(self.vocabulary), dtype=bool)
+            for keyword in query:
+                index = self.vocabulary.get(keyword)
+                if index is not None:
+                    membership[index] = True
+            query_bits = np.packbits(membership)
+            intersection = _POPCOUNT_TABLE[self.keyword_bits & query_bits].sum(axis=1, dtype=np.int64)
+            union = self.keyword_counts + len(query) - intersection
+            similarity[q, valid] = intersection[valid] / union[valid]
+        return similarity
+
+
+class AtomIndex:
+    """
+    لقطة مفهرسة لعروض Atom تُبنى مرة واحدة عند التحميل:
+    العروض مقسمة حسب الفئة (كل قسم FeatureMatrix بميزات محسوبة مسبقاً) + جدول كلمة مفتاحية -> فئة
+    + مصنف محلي مدرب على (الفئة، النطاق) من نفس العروض.
+    """
+
+    LISTING_FIELDS = ('domain', 'price', 'page_url', 'category')
+
+    def __init__(self, listings: List[Dict], partitions: Dict[str, FeatureMatrix],
+                 keyword_categories: Dict[str, str], classifier: Optional[LocalClassifier] = None):
+        self.listings = listings
+        self.partitions = partitions
+        self.keyword_categories = keyword_categories
+        self.classifier = classifier
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    @classmethod
+    def from_listings(cls, listings: List[Dict], engine: "AppraisalEngine") -> "AtomIndex":
+        groups: Dict[str, List[int]] = {}
+        for position, listing in enumerate(listings):
+            groups.setdefault(listing.get('category'), []).append(position)
+
+        partitions = {}
+        for category, group_positions in groups.items():
+            matrix = FeatureMatrix.from_records([listings[p] for p in group_positions], engine,
+                                                required_fields=cls.LISTING_FIELDS)
+            # تحويل المواقع إلى مواقع في القائمة الكاملة (للحفاظ على ترتيب النتائج الأصلي)
+            matrix.positions = np.array(group_positions, dtype=np.int64)[matrix.positions]
+            partitions[category] = matrix
+
+        keyword_categories = {k: c for k, c in KEYWORD_CATEGORY_MAP.items() if c in partitions}
+        classifier = LocalClassifier.from_listings(
+            [l for l in listings if l.get('category') in ATOM_CATEGORIES_SET])
+        return cls(listings, partitions, keyword_categories, classifier)
+
+    def partition(self, category: str) -> Optional[FeatureMatrix]:
+        return self.partitions.get(category)
+
 
 class AppraisalEngine:
-    def __init__(self):
-        self.model = None
-        self.feature_names = None
-        self._load_model()
+    def __init__(self, load_model: bool = True, registry: Optional[ModelRegistry] = None,
+                 classification_cache: Optional[ClassificationCache] = None,
+                 local_min_confidence: float = LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+                 feature_store: Optional[FeatureStore] = None):
+        # النموذج مشترك على مستوى العملية عبر السجل (لا يُعاد تحميله لكل طلب)
+        self.registry = (registry or model_registry) if load_model else None
+        # كاش تصنيفات AI (اختياري): لا نعيد سؤال النموذج اللغوي عن نفس الاسم
+        self.classification_cache = classification_cache
+        self.local_min_confidence = local_min_confidence
+        # مخزن الميزات الدائم (اختياري): المخزن الافتراضي للعملية إذا لم يُمرر مخزن
+        self.feature_store = feature_store or get_default_feature_store()
+        self._schema_version: Optional[tuple] = None
+        if load_model:
+            self._load_model()
 
     def _load_model(self):
-        """تحميل النموذج المدرب - يبقى كما هو"""
-        if os.path.exists(MODEL_PATH) and os.path.exists(FEATURE_NAMES_PATH):
-            self.model = joblib.load(MODEL_PATH)
-            self.feature_names = joblib.load(FEATURE_NAMES_PATH)
-        else:
-            print("Warning: Model not found.")
+        """تحميل النموذج المدرب مرة واحدة عبر سجل النماذج المشترك"""
+        self.registry.ensure_loaded()
+
+    @property
+    def model(self):
+        loaded = self.registry.get() if self.registry else None
+        return loaded.model if loaded else None
+
+    @property
+    def feature_names(self):
+        loaded = self.registry.get() if self.registry else None
+        return loaded.feature_names if loaded else None
 
     def get_realistic_tld_scores(self) -> Dict[str, float]:
         """إرجاع TLD scores معدلة بشكل واقعي"""
@@ -154,14 +413,16 @@ class AppraisalEngine:
 
     def extract_features(self, domain: str) -> Dict[str, Any]:
         """استخراج الميزات - معدل مع TLD الجديد"""
+        return self._analyze_domain(domain)[0]
+
+    def _analyze_domain(self, domain: str) -> tuple:
+        """الميزات + الكلمات المفتاحية في مسح واحد للمطابق"""
         name, tld = self._split_domain(domain)
+        keywords, _, keyword_score = get_keyword_matcher().analyze(name.lower())
+        return self._build_features(name, tld, keyword_score), keywords
+
+    def _build_features(self, name: str, tld: str, keyword_score: int) -> Dict[str, Any]:
         tld_scores = self.get_realistic_tld_scores()
-        
-        high_value_keywords = {
-            'ai', 'agent', 'cloud', 'medic', 'lean', 'glitch', 'content',
-            'digital', 'smart', 'tech', 'app', 'crypto', 'nft', 'blockchain'
-        }
-        keyword_score = sum(1 for kw in high_value_keywords if kw.lower() in name.lower())
         vowel_ratio = len([c for c in name if c.lower() in 'aeiou']) / max(len(name), 1)
         has_hyphen = 1 if '-' in name else 0
         has_digits = 1 if any(c.isdigit() for c in name) else 0
@@ -180,6 +441,45 @@ class AppraisalEngine:
             'tld': tld.lower()
         }
 
+    def feature_schema_version(self) -> str:
+        """
+        بصمة كل ما يحدد قيم الميزات المخزنة: الأعمدة، خريطة الكلمات (وترتيبها = ترتيب البتات)،
+        الكلمات عالية القيمة ودرجات TLD. تتغير مع reload_keyword_map فتُستخدم مجموعة ميزات جديدة.
+        """
+        key = _keyword_map_version
+        if self._schema_version is None or self._schema_version[0] != key:
+            schema = [FEATURE_STORE_FORMAT_VERSION, list(FEATURE_COLUMNS), list(KEYWORD_CATEGORY_MAP.items()),
+                      sorted(HIGH_VALUE_KEYWORDS), sorted(self.get_realistic_tld_scores().items())]
+            digest = hashlib.sha256(json.dumps(schema, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+            self._schema_version = (key, digest)
+        return self._schema_version[1]
+
+    def _compute_feature_rows(self, domains: List[str]) -> tuple:
+        """(values, keyword_bits, valid) محسوبة مباشرة؛ النطاقات التي يفشل تحليلها valid=False"""
+        vocabulary = {keyword: i for i, keyword in enumerate(KEYWORD_CATEGORY_MAP)}
+        values = np.zeros((len(domains), len(FEATURE_COLUMNS)), dtype=np.float64)
+        membership = np.zeros((len(domains), len(vocabulary)), dtype=bool)
+        valid = np.zeros(len(domains), dtype=bool)
+        for i, domain in enumerate(domains):
+            try:
+                features, keywords = self._analyze_domain(domain)
+                values[i] = [features[name] for name in FEATURE_COLUMNS]
+            except Exception:
+                continue
+            membership[i, [vocabulary[k] for k in keywords if k in vocabulary]] = True
+            valid[i] = True
+        return values, np.packbits(membership, axis=1), valid
+
+    def feature_rows(self, domains: List[str]) -> tuple:
+        """
+        ميزات FEATURE_COLUMNS + bitset الكلمات لكل نطاق: (values, keyword_bits, valid).
+        مع مخزن الميزات تُقرأ النطاقات المحسوبة سابقاً ولا يُحلَّل إلا الجديد منها.
+        """
+        if self.feature_store is None:
+            return self._compute_feature_rows(domains)
+        return self.feature_store.get_or_compute(domains, self.feature_schema_version(), FEATURE_COLUMNS,
+                                                 (len(KEYWORD_CATEGORY_MAP) + 7) // 8, self._compute_feature_rows)
+
     def _split_domain(self, domain: str) -> tuple:
         """تقسيم النطاق - يبقى كما هو"""
         parts = domain.lower().rsplit('.', 1)
@@ -190,13 +490,7 @@ class AppraisalEngine:
     def _extract_keywords(self, domain: str) -> List[str]:
         """استخراج الكلمات المفتاحية من النطاق"""
         name = self._split_domain(domain)[0].lower()
-        keywords_found = []
-        
-        for keyword in KEYWORD_CATEGORY_MAP.keys():
-            if keyword in name:
-                keywords_found.append(keyword)
-        
-        return keywords_found
+        return get_keyword_matcher().analyze(name)[0]
 
     def _calculate_keyword_similarity(self, keywords1: List[str], keywords2: List[str]) -> float:
         """حساب تشابه الكلمات المفتاحية"""
@@ -211,134 +505,236 @@ class AppraisalEngine:
         
         return intersection / union if union > 0 else 0.0
 
-    def enhanced_classification(self, domain: str, use_ai: bool = True, ai_engine=None) -> str:
-        """تصنيف محسن يجمع بين الكلمات المفتاحية والذكاء الاصطناعي"""
+    def keyword_category(self, domain: str) -> Optional[str]:
+        """الفئة من الكلمات المفتاحية (أول تطابق بترتيب الخريطة) أو None"""
         name = self._split_domain(domain)[0].lower()
-        
+        return get_keyword_matcher().analyze(name)[1]
+
+    def enhanced_classification(self, domain: str, use_ai: bool = True, ai_engine=None,
+                                atom_index: Optional[AtomIndex] = None,
+                                min_confidence: Optional[float] = None) -> str:
+        """
+        تصنيف محسن: الكلمات المفتاحية، ثم المصنف المحلي، ثم تصنيفات AI المخزنة في الكاش.
+        مُحسِّن AI غير متزامن فلا يُستدعى من هذا المسار المتزامن؛ استدعاؤه عبر enhanced_classification_async.
+        """
         # البحث في الكلمات المفتاحية أولاً
-        for keyword, category in KEYWORD_CATEGORY_MAP.items():
-            if keyword in name:
-                return category
+        category = self.keyword_category(domain)
+        if category:
+            return category
+
+        # المصنف المحلي المدرب على Atom (بدون أي استدعاء خارجي)
+        category = self.local_classification(domain, atom_index, min_confidence)
+        if category:
+            return category
         
-        # إذا فشل الكلمات المفتاحية، نستخدم الذكاء الاصطناعي (إذا متوفر)
+        # تصنيف AI سابق من الكاش (إذا كان AI مفعلاً)
         if use_ai and ai_engine:
-            ai_category = ai_engine.classify_domain(domain, ATOM_CATEGORIES)
-            if ai_category != "Generic":
-                return ai_category
+            cached = self._cached_classification(domain)
+            if cached:
+                return cached
         
         # Fallback نهائي
         return "Generic"
 
-    def find_comparable_sales_enhanced(self, domain: str, all_sales: List[Dict], top_k: int = 5) -> List[Dict]:
-        """بحث محسن في المبيعات التاريخية يستخدم الكلمات المفتاحية"""
-        domain_features = self.extract_features(domain)
-        domain_keywords = self._extract_keywords(domain)
-        
+    async def enhanced_classification_async(self, domain: str, ai_engine=None,
+                                            atom_index: Optional[AtomIndex] = None,
+                                            min_confidence: Optional[float] = None,
+                                            deadline: Optional[Deadline] = None) -> str:
+        """
+        نفس enhanced_classification لكن مع مُحسِّن AI غير متزامن (لا يحجز حلقة الأحداث).
+        عند نفاد deadline يبقى التصنيف محلياً فقط (كلمات مفتاحية + المصنف المحلي).
+        """
+        category = self.keyword_category(domain) or self.local_classification(domain, atom_index, min_confidence)
+        if category:
+            return category
+        if ai_engine:
+            cached = (await self._cached_classifications_async([domain])).get(domain)
+            if cached:
+                return cached
+            if deadline is not None and deadline.expired():
+                deadline.degrade("classification")
+                return "Generic"
+            ai_category = await ai_engine.classify_domain(domain, ATOM_CATEGORIES, **_deadline_kwargs(deadline))
+            if ai_category != "Generic":
+                await self._store_classification_async(domain, ai_category)
+                return ai_category
+        return "Generic"
+
+    async def enhanced_classifications_async(self, domains: List[str], ai_engine=None,
+                                             atom_index: Optional[AtomIndex] = None,
+                                             min_confidence: Optional[float] = None,
+                                             deadline: Optional[Deadline] = None) -> List[str]:
+        """
+        تصنيف قائمة نطاقات بنفس ترتيب enhanced_classification_async، لكن النطاقات التي تحتاج AI
+        تُرسل معاً عبر ai_engine.classify_domains (عدة نطاقات في كل طلب).
+        """
+        categories: List[Optional[str]] = [
+            self.keyword_category(domain) or self.local_classification(domain, atom_index, min_confidence)
+            for domain in domains]
+        needs_ai: Dict[str, List[int]] = {}
+        if ai_engine:
+            unresolved = [domain for domain, category in zip(domains, categories) if not category]
+            cached = await self._cached_classifications_async(unresolved)
+            for i, domain in enumerate(domains):
+                if not categories[i]:
+                    categories[i] = cached.get(domain)
+                    if not categories[i]:
+                        needs_ai.setdefault(domain, []).append(i)
+        categories = [category or "Generic" for category in categories]
+
+        if needs_ai and deadline is not None and deadline.expired():
+            deadline.degrade("classification")
+        elif needs_ai:
+            answers = await ai_engine.classify_domains(list(needs_ai), ATOM_CATEGORIES, **_deadline_kwargs(deadline))
+            for domain, positions in needs_ai.items():
+                ai_category = answers.get(domain, "Generic")
+                if ai_category != "Generic":
+                    await self._store_classification_async(domain, ai_category)
+                for i in positions:
+                    categories[i] = ai_category
+        return categories
+
+    def local_classification(self, domain: str, atom_index: Optional[AtomIndex],
+                             min_confidence: Optional[float] = None) -> Optional[str]:
+        """فئة المصنف المحلي إذا كانت ثقته >= الحد، وإلا None"""
+        if atom_index is None or atom_index.classifier is None:
+            return None
+        category, confidence = atom_index.classifier.predict(domain)
+        threshold = self.local_min_confidence if min_confidence is None else min_confidence
+        return category if confidence >= threshold else None
+
+    def _cached_classification(self, domain: str) -> Optional[str]:
+        if self.classification_cache is None:
+            return None
+        return self.classification_cache.get(domain, ATOM_CATEGORIES_VERSION)
+
+    async def _cached_classifications_async(self, domains: List[str]) -> Dict[str, str]:
+        """نفس _cached_classification لعدة نطاقات دون حجز حلقة الأحداث على القرص"""
+        if self.classification_cache is None or not domains:
+            return {}
+        return await self.classification_cache.aget_many(domains, ATOM_CATEGORIES_VERSION)
+
+    async def _store_classification_async(self, domain: str, category: str) -> None:
+        if self.classification_cache is not None:
+            await self.classification_cache.aput(domain, ATOM_CATEGORIES_VERSION, category)
+
+    def _store_classification(self, domain: str, category: str) -> None:
+        # "Generic" لا يُخزن: غالباً يعني فشل الاستدعاء وليس تصنيفاً حقيقياً
+        if self.classification_cache is not None:
+            self.classification_cache.put(domain, ATOM_CATEGORIES_VERSION, category)
+
+    def build_sales_matrix(self, all_sales: List[Dict]) -> FeatureMatrix:
+        """بناء مصفوفة ميزات المبيعات (تُستدعى مرة واحدة لكل تحميل بيانات)"""
+        return FeatureMatrix.from_records(all_sales, self, required_fields=('domain', 'price', 'venue'))
+
+    def find_comparable_sales_enhanced(self, domain: str, all_sales: List[Dict], top_k: int = 5,
+                                       sales_matrix: Optional[FeatureMatrix] = None) -> List[Dict]:
+        """بحث محسن في المبيعات التاريخية يستخدم الكلمات المفتاحية (حساب متجه لكل المبيعات)"""
+        if sales_matrix is None:
+            sales_matrix = self.build_sales_matrix(all_sales)
+        return self._find_comparable_sales_many([self._analyze_domain(domain)], sales_matrix, top_k)[0]
+
+    def _find_comparable_sales_many(self, analyzed: List[tuple], sales_matrix: FeatureMatrix,
+                                    top_k: int = 5, chunk_cells: int = 4_000_000) -> List[List[Dict]]:
+        """المماثلات لعدة نطاقات (features, keywords) دفعة واحدة، مقسمة لتحديد استهلاك الذاكرة"""
+        if not len(sales_matrix):
+            return [[] for _ in analyzed]
+        chunk = max(1, chunk_cells // len(sales_matrix))
+        results = []
+        for start in range(0, len(analyzed), chunk):
+            batch = analyzed[start:start + chunk]
+            # التشابه الأساسي (50%) + تشابه الكلمات المفتاحية (50%)
+            basic_similarity = sales_matrix.basic_similarity_many([f for f, _ in batch])
+            keyword_similarity = sales_matrix.keyword_similarity_many([k for _, k in batch])
+            total_similarity = (basic_similarity * 0.5) + (keyword_similarity * 0.5)
+            for q in range(len(batch)):
+                results.append(self._select_comparable_sales(
+                    total_similarity[q], keyword_similarity[q], sales_matrix, top_k))
+        return results
+
+    def _select_comparable_sales(self, total_similarity: np.ndarray, keyword_similarity: np.ndarray,
+                                 sales_matrix: FeatureMatrix, top_k: int) -> List[Dict]:
+        # عتبة أقل لتحسين التغطية، ثم ترتيب مستقر تنازلي (نفس ترتيب sort الأصلي)
+        candidates = np.flatnonzero(total_similarity > 0.4)
+        order = candidates[np.argsort(-total_similarity[candidates], kind='stable')][:top_k]
+
         comparables = []
-        for sale in all_sales:
-            try:
-                sale_features = self.extract_features(sale['domain'])
-                
-                # التشابه الأساسي (50%)
-                basic_similarity = self._calculate_similarity(domain_features, sale_features)
-                
-                # تشابه الكلمات المفتاحية (50%)
-                sale_keywords = self._extract_keywords(sale['domain'])
-                keyword_similarity = self._calculate_keyword_similarity(domain_keywords, sale_keywords)
-                
-                # الدمج
-                total_similarity = (basic_similarity * 0.5) + (keyword_similarity * 0.5)
-                
-                if total_similarity > 0.4:  # عتبة أقل لتحسين التغطية
-                    comparables.append({
-                        'domain': sale['domain'],
-                        'price': sale['price'],
-                        'similarity': total_similarity,
-                        'venue': sale['venue'],
-                        'keyword_match': keyword_similarity > 0.6
-                    })
-            except Exception as e:
-                continue
-        
-        comparables.sort(key=lambda x: x['similarity'], reverse=True)
-        return comparables[:top_k]
+        for i in order:
+            sale = sales_matrix.records[i]
+            comparables.append({
+                'domain': sale['domain'],
+                'price': sale['price'],
+                'similarity': float(total_similarity[i]),
+                'venue': sale['venue'],
+                'keyword_match': bool(keyword_similarity[i] > 0.6)
+            })
+        return comparables
+
+    def build_atom_index(self, atom_listings: List[Dict]) -> AtomIndex:
+        """بناء فهرس عروض Atom (يُستدعى مرة واحدة لكل تحميل بيانات)"""
+        return AtomIndex.from_listings(atom_listings, self)
+
+    def find_comparable_listings_enhanced(self, domain: str, atom_listings: List[Dict], category: str, top_k: int = 5,
+                                          atom_index: Optional[AtomIndex] = None) -> List[Dict]:
+        """بحث محسن في أتوم مع شبكة أمان بالكلمات المفتاحية (يمر فقط على أقسام الفئات المعنية)"""
+        if atom_index is None:
+            atom_index = self.build_atom_index(atom_listings)
+        domain_features, domain_keywords = self._analyze_domain(domain)
+        same_category = atom_index.partition(category)
+        similarity = same_category.basic_similarity(domain_features) if same_category is not None else None
+        return self._rank_listings(domain_features, domain_keywords, category, atom_index, similarity, top_k)
+
+    def _rank_listings(self, domain_features: Dict[str, Any], domain_keywords: List[str], category: str,
+                       atom_index: AtomIndex, same_category_similarity: Optional[np.ndarray],
+                       top_k: int) -> List[Dict]:
+        # كل مرشح: (التشابه، المرحلة، الموقع الأصلي، العرض، نوع التطابق)
+        candidates = []
 
-    def find_comparable_listings_enhanced(self, domain: str, atom_listings: List[Dict], category: str, top_k: int = 5) -> List[Dict]:
-        """بحث محسن في أتوم مع شبكة أمان بالكلمات المفتاحية"""
-        domain_features = self.extract_features(domain)
-        
         # المرحلة 1: البحث في نفس الفئة
-        same_category = [l for l in atom_listings if l['category'] == category]
-        comparables = []
-        
-        for listing in same_category:
-            try:
-                listing_features = self.extract_features(listing['domain'])
-                similarity = self._calculate_similarity(domain_features, listing_features)
-                if similarity > 0.4:
-                    comparables.append({
-                        'domain': listing['domain'],
-                        'price': listing['price'],
-                        'page_url': listing['page_url'],
-                        'similarity': similarity,
-                        'category': listing['category'],
-                        'match_type': 'same_category'
-                    })
-            except:
-                continue
-        
+        same_category = atom_index.partition(category)
+        if same_category is not None and len(same_category):
+            similarity = same_category_similarity
+            for i in np.flatnonzero(similarity > 0.4):
+                candidates.append((float(similarity[i]), 0, int(same_category.positions[i]),
+                                   same_category.records[i], 'same_category'))
+
         # إذا لم نجد كفاية في نفس الفئة، نبحث في فئات مشابهة بالكلمات المفتاحية
-        if len(comparables) < 3:
-            domain_keywords = self._extract_keywords(domain)
-            similar_categories = self._find_categories_by_keywords(domain_keywords, atom_listings)
-            
-            for listing in similar_categories:
-                if listing['category'] != category:  # نتجنب التكرار
-                    try:
-                        listing_features = self.extract_features(listing['domain'])
-                        similarity = self._calculate_similarity(domain_features, listing_features)
-                        if similarity > 0.4:
-                            comparables.append({
-                                'domain': listing['domain'],
-                                'price': listing['price'],
-                                'page_url': listing['page_url'],
-                                'similarity': similarity * 0.8,  # تخفيض لأن الفئة مختلفة
-                                'category': listing['category'],
-                                'match_type': 'keyword_category'
-                            })
-                    except:
-                        continue
-        
-        comparables.sort(key=lambda x: x['similarity'], reverse=True)
-        return comparables[:top_k]
+        if len(candidates) < 3:
+            for related in self._find_categories_by_keywords(domain_keywords, atom_index):
+                if related == category:  # نتجنب التكرار
+                    continue
+                partition = atom_index.partition(related)
+                similarity = partition.basic_similarity(domain_features)
+                for i in np.flatnonzero(similarity > 0.4):
+                    # تخفيض لأن الفئة مختلفة
+                    candidates.append((float(similarity[i]) * 0.8, 1, int(partition.positions[i]),
+                                       partition.records[i], 'keyword_category'))
 
-    def _find_categories_by_keywords(self, keywords: List[str], atom_listings: List[Dict]) -> List[Dict]:
-        """إيجاد فئات مشابهة بناءً على الكلمات المفتاحية"""
-        if not keywords:
-            return []
-        
-        relevant_categories = set()
+        # نفس ترتيب الفرز المستقر الأصلي: التشابه تنازلياً ثم المرحلة ثم الترتيب في القائمة
+        candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+        return [{
+            'domain': listing['domain'],
+            'price': listing['price'],
+            'page_url': listing['page_url'],
+            'similarity': similarity,
+            'category': listing['category'],
+            'match_type': match_type
+        } for similarity, _, _, listing, match_type in candidates[:top_k]]
+
+    def _find_categories_by_keywords(self, keywords: List[str], atom_index: AtomIndex) -> List[str]:
+        """إيجاد فئات مشابهة (الموجودة في الفهرس) بناءً على الكلمات المفتاحية"""
+        relevant_categories = []
         for keyword in keywords:
-            category = KEYWORD_CATEGORY_MAP.get(keyword)
-            if category:
-                relevant_categories.add(category)
-        
-        return [l for l in atom_listings if l['category'] in relevant_categories]
+            category = atom_index.keyword_categories.get(keyword)
+            if category and category not in relevant_categories:
+                relevant_categories.append(category)
+        return relevant_categories
 
     def _calculate_similarity(self, feat1: Dict, feat2: Dict) -> float:
         """خوارزمية التشابه الحالية (محفوظة مع تعديل الأوزان)"""
-        weights = {
-            'length': 0.2,        # زيادة وزن الطول
-            'tld_score': 0.15,    # تقليل وزن TLD
-            'has_hyphen': 0.1,
-            'has_digits': 0.1,
-            'keyword_score': 0.2,  # تقليل وزن الكلمات
-            'vowel_ratio': 0.15,   # زيادة وزن النطق
-            'is_brandable': 0.1   # زيادة وزن القابلية للبرندة
-        }
         similarity = 0.0
         total_weight = 0.0
-        for feature, weight in weights.items():
+        for feature, weight in SIMILARITY_WEIGHTS.items():
             val1 = feat1.get(feature, 0)
             val2 = feat2.get(feature, 0)
             if isinstance(val1, (int, float)) and isinstance(val2, (int, float)):
@@ -443,13 +839,15 @@ class AppraisalEngine:
         return reasons[:5]
 
     # الحفاظ على الدوال القديمة للتتوافق مع main.py
-    def find_comparable_sales(self, domain: str, all_sales: List[Dict], top_k: int = 5) -> List[Dict]:
+    def find_comparable_sales(self, domain: str, all_sales: List[Dict], top_k: int = 5,
+                              sales_matrix: Optional[FeatureMatrix] = None) -> List[Dict]:
         """الدالة القديمة للحفاظ على التوافق - تستخدم النظام المحسن"""
-        return self.find_comparable_sales_enhanced(domain, all_sales, top_k)
+        return self.find_comparable_sales_enhanced(domain, all_sales, top_k, sales_matrix=sales_matrix)
 
-    def find_comparable_listings(self, domain: str, atom_listings: List[Dict], category: str, top_k: int = 3) -> List[Dict]:
+    def find_comparable_listings(self, domain: str, atom_listings: List[Dict], category: str, top_k: int = 3,
+                                 atom_index: Optional[AtomIndex] = None) -> List[Dict]:
         """الدالة القديمة للحفاظ على التوافق - تستخدم النظام المحسن"""
-        return self.find_comparable_listings_enhanced(domain, atom_listings, category, top_k)
+        return self.find_comparable_listings_enhanced(domain, atom_listings, category, top_k, atom_index=atom_index)
 
     def calculate_confidence(self, sales_comparables: List[Dict], atom_comparables: List[Dict]) -> float:
         """الدالة القديمة للحفاظ على التوافق - تستخدم النظام المحسن"""
@@ -459,24 +857,108 @@ class AppraisalEngine:
         """الدالة القديمة للحفاظ على التوافق - تستخدم النظام المحسن"""
         return self.generate_enhanced_reasons(features, sales_comparables, atom_comparables, category)
 
-    def appraise(self, domain: str, all_sales: List[Dict], atom_listings: List[Dict], ai_engine=None) -> Dict[str, Any]:
-        """الدالة الرئيسية المحسنة مع الحفاظ على التوافق"""
-        features = self.extract_features(domain)
+    def predict_base_prices(self, features_list: List[Dict[str, Any]]) -> List[float]:
+        """السعر الأساسي من النموذج لعدة نطاقات باستدعاء predict واحد على المصفوفة كاملة"""
+        # نأخذ لقطة واحدة حتى لا يتغير النموذج أثناء الطلب
+        loaded = self.registry.get() if self.registry else None
+        if not (loaded and loaded.model and loaded.feature_names) or not features_list:
+            return [100.0] * len(features_list)
+        X = np.array([[f.get(name, 0) for name in loaded.feature_names] for f in features_list], dtype=np.float64)
+        # الـ backend (المسطح مثلاً) يتجنب تحقق sklearn وتوزيع threads
+        predict = loaded.backend.predict if loaded.backend is not None else loaded.model.predict
+        return [float(p) for p in predict(X)]
+
+    def appraise(self, domain: str, all_sales: List[Dict], atom_listings: List[Dict], ai_engine=None,
+                 sales_matrix: Optional[FeatureMatrix] = None,
+                 atom_index: Optional[AtomIndex] = None, category: Optional[str] = None) -> Dict[str, Any]:
+        """الدالة الرئيسية المحسنة مع الحفاظ على التوافق (category جاهزة تتخطى التصنيف)"""
+        prepared = self.prepare_appraisal(domain, all_sales, sales_matrix=sales_matrix)
+        if atom_index is None:
+            atom_index = self.build_atom_index(atom_listings)
         
         # التصنيف المحسن
-        category = self.enhanced_classification(domain, use_ai=True, ai_engine=ai_engine)
-        
-        # البحث عن مماثلات محسن
-        sales_comparables = self.find_comparable_sales_enhanced(domain, all_sales)
-        atom_comparables = self.find_comparable_listings_enhanced(domain, atom_listings, category)
-
-        # السعر الأساسي من النموذج
-        if self.model and self.feature_names:
-            X = [features.get(name, 0) for name in self.feature_names]
-            base_price = float(self.model.predict([X])[0])
-        else:
-            base_price = 100.0
+        if category is None:
+            category = self.enhanced_classification(domain, use_ai=True, ai_engine=ai_engine, atom_index=atom_index)
+        return self.complete_appraisal(prepared, category, atom_listings, atom_index=atom_index)
+
+    def prepare_appraisal(self, domain: str, all_sales: List[Dict],
+                          sales_matrix: Optional[FeatureMatrix] = None) -> Dict[str, Any]:
+        """
+        الجزء الذي لا يعتمد على الفئة: الميزات، مماثلات المبيعات، والسعر الأساسي.
+        يمكن تشغيله بالتوازي مع التصنيف ثم إكماله بـ complete_appraisal.
+        """
+        if sales_matrix is None:
+            sales_matrix = self.build_sales_matrix(all_sales)
+        features, keywords = self._analyze_domain(domain)
+        return {
+            "domain": domain,
+            "features": features,
+            "keywords": keywords,
+            # البحث عن مماثلات محسن
+            "sales_comparables": self._find_comparable_sales_many([(features, keywords)], sales_matrix)[0],
+            # السعر الأساسي من النموذج
+            "base_price": self.predict_base_prices([features])[0],
+        }
+
+    def complete_appraisal(self, prepared: Dict[str, Any], category: str, atom_listings: List[Dict],
+                           atom_index: Optional[AtomIndex] = None) -> Dict[str, Any]:
+        """إكمال التقييم بعد معرفة الفئة: مماثلات Atom ثم السعر النهائي"""
+        if atom_index is None:
+            atom_index = self.build_atom_index(atom_listings)
+        features = prepared["features"]
+        same_category = atom_index.partition(category)
+        similarity = same_category.basic_similarity(features) if same_category is not None else None
+        atom_comparables = self._rank_listings(features, prepared["keywords"], category, atom_index,
+                                               similarity, top_k=5)
+        return self._build_result(prepared["domain"], features, category, prepared["base_price"],
+                                  prepared["sales_comparables"], atom_comparables)
+
+    def appraise_many(self, domains: List[str], all_sales: List[Dict], atom_listings: List[Dict], ai_engine=None,
+                      sales_matrix: Optional[FeatureMatrix] = None,
+                      atom_index: Optional[AtomIndex] = None,
+                      categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        تقييم قائمة نطاقات دفعة واحدة: استخراج الميزات للجميع، predict واحد على المصفوفة،
+        وبحث مماثلات مجمّع. كل نتيجة مطابقة لنتيجة appraise للنطاق نفسه.
+        """
+        if sales_matrix is None:
+            sales_matrix = self.build_sales_matrix(all_sales)
+        if atom_index is None:
+            atom_index = self.build_atom_index(atom_listings)
+
+        analyzed = [self._analyze_domain(domain) for domain in domains]
+        features_list = [features for features, _ in analyzed]
+        if categories is None:
+            categories = [self.enhanced_classification(domain, use_ai=True, ai_engine=ai_engine, atom_index=atom_index)
+                          for domain in domains]
+
+        base_prices = self.predict_base_prices(features_list)
+        sales_comparables = self._find_comparable_sales_many(analyzed, sales_matrix)
+
+        # المرحلة الأولى في Atom: حساب التشابه لكل فئة مرة واحدة لجميع النطاقات التابعة لها
+        same_category_similarity: List[Optional[np.ndarray]] = [None] * len(domains)
+        by_category: Dict[str, List[int]] = {}
+        for i, category in enumerate(categories):
+            by_category.setdefault(category, []).append(i)
+        for category, members in by_category.items():
+            partition = atom_index.partition(category)
+            if partition is None:
+                continue
+            similarity = partition.basic_similarity_many([features_list[i] for i in members])
+            for row, i in enumerate(members):
+                same_category_similarity[i] = similarity[row]
+
+        results = []
+        for i, domain in enumerate(domains):
+            features, keywords = analyzed[i]
+            atom_comparables = self._rank_listings(features, keywords, categories[i], atom_index,
+                                                   same_category_similarity[i], top_k=5)
+            results.append(self._build_result(domain, features, categories[i], base_prices[i],
+                                              sales_comparables[i], atom_comparables))
+        return results
 
+    def _build_result(self, domain: str, features: Dict[str, Any], category: str, base_price: float,
+                      sales_comparables: List[Dict], atom_comparables: List[Dict]) -> Dict[str, Any]:
         # السعر النهائي المحسن
         final_price = self.calculate_final_price_enhanced(base_price, sales_comparables, atom_comparables)
         
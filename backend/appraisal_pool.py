@@ -0,0 +1,230 @@
+# backend/appraisal_pool.py
+import os
+import time
+import pickle
+import shutil
+import asyncio
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from appraisal_engine import AppraisalEngine, AtomIndex, FeatureMatrix
+from model_registry import ModelRegistry
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+class AppraisalData(NamedTuple):
+    """لقطة بيانات للقراءة فقط يُقيَّم عليها (واحدة لكل جيل بيانات)"""
+    generation: str
+    sales: List[Dict]
+    atom_listings: List[Dict]
+    sales_matrix: Optional[FeatureMatrix]
+    atom_index: Optional[AtomIndex]
+
+
+# حالة عملية العامل: محرك خاص + نسخة من لقطة البيانات (من initializer، ثم من ملف عند كل تحديث)
+_worker_engine: Optional[AppraisalEngine] = None
+_worker_data: Optional[AppraisalData] = None
+_worker_data_file: Optional[str] = None
+
+
+def _init_worker(model_path: str, feature_names_path: str, backend: Optional[str], data: AppraisalData) -> None:
+    global _worker_engine, _worker_data
+    # بدون إعادة تحميل تلقائي: تغيّر النموذج يغيّر مفتاح المجمع (key) فيُعاد إنشاؤه كاملاً
+    registry = ModelRegistry(model_path, feature_names_path, check_interval=float("inf"), backend=backend)
+    _worker_engine = AppraisalEngine(registry=registry)
+    _worker_data = data
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _prepare(engine: AppraisalEngine, data: AppraisalData, domain: str) -> Dict[str, Any]:
+    return engine.prepare_appraisal(domain, data.sales, sales_matrix=data.sales_matrix)
+
+
+def _complete(engine: AppraisalEngine, data: AppraisalData, prepared: Dict[str, Any], category: str) -> Dict[str, Any]:
+    return engine.complete_appraisal(prepared, category, data.atom_listings, atom_index=data.atom_index)
+
+
+def _appraise_many(engine: AppraisalEngine, data: AppraisalData, domains: List[str],
+                   categories: List[str]) -> List[Dict[str, Any]]:
+    return engine.appraise_many(domains, data.sales, data.atom_listings, sales_matrix=data.sales_matrix,
+                                atom_index=data.atom_index, categories=categories)
+
+
+def _in_worker(data_file: Optional[str], fn, *args):
+    global _worker_data, _worker_data_file
+    if data_file != _worker_data_file:
+        # المجمع حدّث اللقطة (update_data): تُقرأ مرة واحدة لكل عملية
+        with open(data_file, "rb") as f:
+            _worker_data = pickle.load(f)
+        _worker_data_file = data_file
+    return fn(_worker_engine, _worker_data, *args)
+
+
+class AppraisalPool:
+    """
+    ينفذ الجزء الحسابي من التقييم (الميزات، التشابه، predict) خارج حلقة الأحداث:
+    - inline: مباشرة في حلقة الأحداث (للتشخيص)
+    - thread: في threadpool باستخدام المحرك المشترك (مقيد بـ GIL)
+    - process: في عمليات منفصلة، لكل منها محرك ونسخة للقراءة فقط من لقطة البيانات
+    تحديث المبيعات أو Atom يستبدل اللقطة داخل المجمع (update_data) دون إعادة إنشاء العمليات؛
+    المجمع نفسه يُستبدل فقط عند تغيّر key (طريقة التنفيذ، النموذج...): كل طلب يحجزه
+    (acquire/release)، والمجمع المستبدل (retire) لا يُغلق إلا بعد انتهاء آخر طلب يستخدمه.
+    """
+
+    def __init__(self, engine: AppraisalEngine, data: AppraisalData, mode: str = "thread",
+                 workers: Optional[int] = None, start_method: str = "spawn", key: Any = None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown appraisal executor mode: {mode}")
+        self.engine = engine
+        self.data = data
+        self.mode = mode
+        self.key = key
+        self.workers = workers or os.cpu_count() or 1
+        self.created_at = time.time()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stats = {"tasks": 0, "failures": 0, "busy_seconds": 0.0, "data_updates": 0}
+        self._lock = threading.Lock()
+        self._leases = 0
+        self._retired = False
+        # process: ملف اللقطة الحالية (None = لقطة initializer) والمهام الجارية على كل ملف
+        self._data_dir: Optional[str] = None
+        self._data_file: Optional[str] = None
+        self._data_file_tasks: Dict[str, int] = {}
+        if mode == "process":
+            registry = engine.registry or ModelRegistry()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(start_method),
+                initializer=_init_worker,
+                initargs=(registry.model_path, registry.feature_names_path, registry.backend, data),
+            )
+
+    @property
+    def generation(self) -> str:
+        return self.data.generation
+
+    def acquire(self) -> bool:
+        """حجز المجمع لطلب (False إذا استُبدل: يجب طلب المجمع الحالي)"""
+        with self._lock:
+            if self._retired:
+                return False
+            self._leases += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._leases -= 1
+            done = self._retired and self._leases == 0
+        if done:
+            self.shutdown()
+
+    def retire(self) -> None:
+        """استبدال المجمع: لا حجوزات جديدة، والإغلاق عند انتهاء آخر طلب جارٍ"""
+        with self._lock:
+            self._retired = True
+            done = self._leases == 0
+        if done:
+            self.shutdown()
+
+    def update_data(self, data: AppraisalData) -> None:
+        """
+        استبدال لقطة البيانات لجيل جديد. في process تُكتب اللقطة مرة واحدة إلى ملف
+        وتقرؤه كل عملية عند أول مهمة بعد التحديث (بدل إعادة تشغيل العمليات ونسخ اللقطة لكل منها).
+        """
+        data_file = None
+        if self._executor is not None:
+            with self._lock:
+                if self._data_dir is None:
+                    self._data_dir = tempfile.mkdtemp(prefix="appraisal-pool-")
+                self._stats["data_updates"] += 1
+                data_file = os.path.join(self._data_dir, f"data-{self._stats['data_updates']}.pkl")
+            with open(data_file, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            previous = self._data_file
+            self.data, self._data_file = data, data_file
+            if self._executor is None:
+                self._stats["data_updates"] += 1
+        self._discard_data_file(previous)
+
+    def _discard_data_file(self, data_file: Optional[str]) -> None:
+        """حذف ملف لقطة قديمة إذا لم تعد أي مهمة جارية تحتاجه"""
+        with self._lock:
+            if data_file is None or data_file == self._data_file or self._data_file_tasks.get(data_file):
+                return
+            self._data_file_tasks.pop(data_file, None)
+        try:
+            os.remove(data_file)
+        except OSError:
+            pass
+
+    async def _call(self, fn, *args):
+        started = time.perf_counter()
+        with self._lock:
+            data, data_file = self.data, self._data_file
+            if data_file is not None:
+                self._data_file_tasks[data_file] = self._data_file_tasks.get(data_file, 0) + 1
+        try:
+            if self.mode == "inline":
+                return fn(self.engine, data, *args)
+            if self.mode == "thread":
+                return await run_in_threadpool(fn, self.engine, data, *args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, _in_worker, data_file, fn, *args)
+        except Exception:
+            with self._lock:
+                self._stats["failures"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["tasks"] += 1
+                self._stats["busy_seconds"] += time.perf_counter() - started
+                if data_file is not None:
+                    self._data_file_tasks[data_file] -= 1
+            self._discard_data_file(data_file)
+
+    async def prepare(self, domain: str) -> Dict[str, Any]:
+        """الجزء المستقل عن الفئة (يعمل بالتوازي مع التصنيف)"""
+        return await self._call(_prepare, domain)
+
+    async def complete(self, prepared: Dict[str, Any], category: str) -> Dict[str, Any]:
+        return await self._call(_complete, prepared, category)
+
+    async def appraise_many(self, domains: List[str], categories: List[str]) -> List[Dict[str, Any]]:
+        return await self._call(_appraise_many, domains, categories)
+
+    def warm_up(self) -> None:
+        """تشغيل كل العمليات مسبقاً (تحميل النموذج ونسخ اللقطة) حتى لا يدفعها أول طلب"""
+        if self._executor is not None:
+            try:
+                futures = [self._executor.submit(_worker_ready) for _ in range(self.workers)]
+            except RuntimeError:
+                return  # استُبدل وأُغلق قبل اكتمال التسخين
+            for future in futures:
+                future.result()
+
+    def shutdown(self, wait: bool = False) -> None:
+        """إيقاف المجمع؛ المهام الجارية تكتمل قبل خروج العمليات"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+        if self._data_dir is not None:
+            shutil.rmtree(self._data_dir, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["busy_seconds"] = round(stats["busy_seconds"], 4)
+        with self._lock:
+            stats.update(leases=self._leases, retired=self._retired)
+        stats.update(mode=self.mode, workers=self.workers if self.mode == "process" else None,
+                     generation=self.generation, age_seconds=round(time.time() - self.created_at, 1))
+        return stats
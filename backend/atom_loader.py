@@ -3,73 +3,124 @@ import time
 import os
 import re
 from typing import List, Dict, Optional
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 
-# كاش عالمي
-_cached_atom_listings: Optional[List[Dict]] = None
-_cache_timestamp: float = 0
+import sheets_client
+from snapshot_cache import SnapshotCache
+from deadline import Deadline
+from data_snapshot import load_snapshot, save_snapshot
+
+# لقطة Atom: (قائمة العروض، AtomIndex) تُستبدل معاً بشكل ذري
+_atom_cache = SnapshotCache("atom")
+_disk_restore_attempted = False
+
+# أعمدة اللقطة المحفوظة على القرص
+ATOM_COLUMNS = {'category': str, 'domain': str, 'price': float, 'page_url': str}
 
 def load_atom_listings(
     spreadsheet_id: str,
     sheet_name: str = "Atom",
-    cache_ttl: int = 3600  # ساعة واحدة
+    cache_ttl: int = 3600,  # ساعة واحدة
+    deadline: Optional[Deadline] = None
 ) -> List[Dict]:
     """
     يحمل عروض النطاقات من جدول Atom في Google Sheets.
     الأعمدة المتوقعة: Category, Domain, Price, PageURL
+    يعيد اللقطة الحالية فوراً، وعند انتهاء صلاحيتها يتم التحديث في الخلفية.
     """
-    global _cached_atom_listings, _cache_timestamp
-    current_time = time.time()
-    if _cached_atom_listings is not None and (current_time - _cache_timestamp) < cache_ttl:
-        return _cached_atom_listings.copy()
+    if _atom_cache.snapshot is None:
+        restore_from_disk(spreadsheet_id, sheet_name)
+    snapshot = _atom_cache.get(atom_fetcher(spreadsheet_id, sheet_name), cache_ttl,
+                               max_wait=deadline.remaining() if deadline else None)
+    return snapshot[0].copy() if snapshot else []
 
-    try:
-        creds_path = os.path.join(os.path.dirname(__file__), "..", "config", "credentials.json")
-        creds = Credentials.from_service_account_file(
-            creds_path,
-            scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
-        )
-        service = build("sheets", "v4", credentials=creds)
-        sheet = service.spreadsheets()
-        range_name = f"'{sheet_name}'!A:D"  # 4 أعمدة: A=Category, B=Domain, C=Price, D=PageURL
-        result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-        values = result.get("values", [])
-
-        if not values or len(values) < 2:
-            print("⚠️ Atom sheet is empty or missing headers.")
-            return []
-
-        headers = values[0]
-        expected = ["Category", "Domain", "Price", "PageURL"]
-        if headers != expected:
-            raise ValueError(f"Atom sheet headers mismatch. Expected: {expected}, Got: {headers}")
-
-        listings = []
-        for row in values[1:]:
-            # ملء الصفوف الناقصة
-            while len(row) < 4:
-                row.append("")
-            category = str(row[0]).strip()
-            domain = str(row[1]).strip().lower()
-            price = _parse_price(row[2])
-            page_url = str(row[3]).strip()
-
-            if price and _is_valid_domain(domain):
-                listings.append({
-                    "category": category,
-                    "domain": domain,
-                    "price": price,
-                    "page_url": page_url
-                })
-
-        _cached_atom_listings = listings
-        _cache_timestamp = current_time
-        return listings.copy()
 
+def atom_fetcher(spreadsheet_id: str, sheet_name: str):
+    """دالة التحديث التي تُمرر إلى SnapshotCache"""
+    return lambda: _fetch_atom_snapshot(spreadsheet_id, sheet_name)
+
+
+def next_sync_range(sheet_name: str) -> str:
+    """النطاق الذي سيطلبه التحديث القادم (للجلب المسبق المجمّع عبر batchGet)"""
+    return f"'{sheet_name}'!A:D"  # 4 أعمدة: A=Category, B=Domain, C=Price, D=PageURL
+
+
+def _fetch_atom_snapshot(spreadsheet_id: str, sheet_name: str) -> tuple:
+    listings = _fetch_atom_listings(spreadsheet_id, sheet_name)
+    _save_to_disk(listings, spreadsheet_id, sheet_name)
+    return listings, _build_atom_index(listings)
+
+
+def restore_from_disk(spreadsheet_id: str, sheet_name: str) -> bool:
+    """بدء دافئ من آخر لقطة محفوظة؛ عمرها الحقيقي يُحترم فتُحدّث في الخلفية إذا كانت قديمة"""
+    global _disk_restore_attempted
+    if _disk_restore_attempted:
+        return False
+    _disk_restore_attempted = True
+    restored = load_snapshot("atom", ATOM_COLUMNS, f"{spreadsheet_id}:{sheet_name}")
+    if not restored:
+        return False
+    listings, meta = restored
+    _atom_cache.set((listings, _build_atom_index(listings)), timestamp=meta["saved_at"])
+    print(f"✅ تم استرجاع {len(listings)} عرضاً من لقطة Atom المحفوظة (الإصدار {meta['data_version']})")
+    return True
+
+
+def _save_to_disk(listings: List[Dict], spreadsheet_id: str, sheet_name: str) -> None:
+    try:
+        save_snapshot("atom", listings, ATOM_COLUMNS, f"{spreadsheet_id}:{sheet_name}")
     except Exception as e:
-        print(f"❌ Error loading Atom listings: {e}")
-        return _cached_atom_listings or []
+        print(f"⚠️ تعذر حفظ لقطة Atom: {e}")
+
+
+def _fetch_atom_listings(spreadsheet_id: str, sheet_name: str) -> List[Dict]:
+    values = sheets_client.get_values(spreadsheet_id, next_sync_range(sheet_name))
+
+    if not values or len(values) < 2:
+        raise ValueError("Atom sheet is empty or missing headers.")
+
+    headers = values[0]
+    expected = ["Category", "Domain", "Price", "PageURL"]
+    if headers != expected:
+        raise ValueError(f"Atom sheet headers mismatch. Expected: {expected}, Got: {headers}")
+
+    listings = []
+    for row in values[1:]:
+        # ملء الصفوف الناقصة
+        while len(row) < 4:
+            row.append("")
+        category = str(row[0]).strip()
+        domain = str(row[1]).strip().lower()
+        price = _parse_price(row[2])
+        page_url = str(row[3]).strip()
+
+        if price and _is_valid_domain(domain):
+            listings.append({
+                "category": category,
+                "domain": domain,
+                "price": price,
+                "page_url": page_url
+            })
+    return listings
+
+
+def get_atom_index():
+    """الفهرس المقسم حسب الفئة للعروض المحملة حالياً (أو None قبل أول تحميل)"""
+    snapshot = _atom_cache.snapshot
+    return snapshot[1] if snapshot else None
+
+
+def get_cache() -> SnapshotCache:
+    return _atom_cache
+
+
+def get_refresh_metrics() -> Dict:
+    """مقاييس التحديث: المدة، عدد مرات الفشل، عمر اللقطة"""
+    return _atom_cache.metrics()
+
+
+def _build_atom_index(listings: List[Dict]):
+    from appraisal_engine import AppraisalEngine
+    return AppraisalEngine(load_model=False).build_atom_index(listings)
 
 
 def _is_valid_domain(domain: str) -> bool:
@@ -0,0 +1,75 @@
+# backend/bench_appraisal_pool.py
+"""
+قياس إنتاجية التقييم المتزامن حسب وضع التنفيذ وعدد العمليات:
+- inline: الحساب داخل حلقة الأحداث (كل الطلبات متسلسلة)
+- thread: threadpool بمحرك مشترك (مقيد بـ GIL)
+- process: عمليات منفصلة بعدد 1, 2, 4 ... حتى عدد الأنوية
+
+الاستخدام: python bench_appraisal_pool.py [--sales 20000] [--requests 64] [--max-workers N]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from appraisal_engine import AppraisalEngine, ATOM_CATEGORIES
+from appraisal_pool import AppraisalData, AppraisalPool
+from sample_data import random_sales
+
+
+def build_data(engine: AppraisalEngine, sales_count: int) -> AppraisalData:
+    sales = random_sales(sales_count)
+    listings = [{"domain": sale["domain"], "price": sale["price"], "page_url": "",
+                 "category": ATOM_CATEGORIES[i % len(ATOM_CATEGORIES)]}
+                for i, sale in enumerate(random_sales(sales_count // 4, seed=3))]
+    return AppraisalData("bench", sales, listings, engine.build_sales_matrix(sales), engine.build_atom_index(listings))
+
+
+async def run(pool: AppraisalPool, domains):
+    async def one(domain):
+        prepared = await pool.prepare(domain)
+        return await pool.complete(prepared, "Generic")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(domain) for domain in domains))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sales", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    engine = AppraisalEngine()
+    data = build_data(engine, args.sales)
+    domains = [f"{sale['domain'].split('.')[0]}{i}.com" for i, sale in enumerate(data.sales[:args.requests])]
+
+    configs = [("inline", 1), ("thread", 1)]
+    workers = 1
+    while workers <= args.max_workers:
+        configs.append(("process", workers))
+        workers *= 2
+    if configs[-1][1] != args.max_workers:
+        configs.append(("process", args.max_workers))
+
+    print(f"{args.requests} concurrent appraisals over {args.sales} sales, {os.cpu_count()} cores")
+    baseline = None
+    for mode, count in configs:
+        pool = AppraisalPool(engine, data, mode=mode, workers=count)
+        try:
+            pool.warm_up()  # تشغيل العمليات ونسخ اللقطة خارج القياس
+            elapsed = asyncio.run(run(pool, domains))
+        finally:
+            pool.shutdown(wait=True)
+        baseline = baseline or elapsed
+        label = f"{mode}" + (f" x{count}" if mode == "process" else "")
+        print(f"{label:>12}: {args.requests / elapsed:8.1f} req/s  ({elapsed * 1000:.0f} ms, "
+              f"{baseline / elapsed:.2f}x vs inline)")
+
+
+if __name__ == "__main__":
+    main()
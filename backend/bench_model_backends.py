@@ -0,0 +1,74 @@
+# backend/bench_model_backends.py
+"""
+مقارنة backends النموذج على نفس البيانات:
+زمن الاستدلال لصف واحد (p50/p99) ولدفعة، حجم النموذج في الذاكرة، و MAE على بيانات الاختبار.
+
+الاستخدام: python bench_model_backends.py [--sales 5000] [--calls 2000] [--batch 32]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+
+from model_backends import load_backend
+from sample_data import random_sales
+from train_model import export_flat_forest, prepare_training_data, save_models, train_xgboost, _evaluate
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sales", type=int, default=5000)
+    parser.add_argument("--calls", type=int, default=2000, help="عدد استدعاءات الصف الواحد")
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+
+    df = prepare_training_data(random_sales(args.sales))
+    X, y = df.drop('price', axis=1), df['price']
+    feature_names = list(X.columns)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    # نفس إعدادات train_model
+    model = RandomForestRegressor(n_estimators=200, max_depth=12, min_samples_split=5, random_state=42, n_jobs=-1)
+    model.fit(X_train, y_train)
+    flat = export_flat_forest(model, X_test, model.predict(X_test))
+    booster = train_xgboost(X_train, y_train)
+
+    test_rows = X_test.to_numpy(dtype=np.float64)
+    with tempfile.TemporaryDirectory() as model_dir:
+        manifest = save_models(model_dir, feature_names, model, flat, booster, {"flat": {"mae": 0.0}})
+        print(f"{len(X_train)} train / {len(X_test)} test rows, {len(feature_names)} features")
+        print(f"{'backend':>8} {'p50 1row':>10} {'p99 1row':>10} {'p50 batch':>10} {'memory':>10} {'MAE':>10}")
+        for name in ("sklearn", "flat", "xgboost"):
+            backend = load_backend(model_dir, manifest, name)
+            mae = _evaluate(y_test, backend.predict(test_rows))["mae"]
+
+            single = []
+            for i in range(args.calls):
+                row = test_rows[i % len(test_rows)][None, :]
+                started = time.perf_counter()
+                backend.predict(row)
+                single.append(time.perf_counter() - started)
+
+            batches = []
+            for i in range(max(1, args.calls // 10)):
+                start = (i * args.batch) % max(1, len(test_rows) - args.batch)
+                started = time.perf_counter()
+                backend.predict(test_rows[start:start + args.batch])
+                batches.append(time.perf_counter() - started)
+
+            print(f"{name:>8} {percentile_ms(single, 50):8.3f}ms {percentile_ms(single, 99):8.3f}ms "
+                  f"{percentile_ms(batches, 50):8.3f}ms {backend.memory_bytes() / 1e6:8.2f}MB {mae:10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# backend/bench_training_pipeline.py
+"""
+مقارنة تحضير بيانات التدريب على ملف CSV كبير:
+- rows: قراءة الملف كاملاً ثم prepare_training_data صفاً بصف (المسار القديم)
+- chunked: load_training_arrays بدفعات في نفس العملية
+- pool: load_training_arrays مع عمليات لحساب الميزات
+كل وضع يعمل في عملية مستقلة حتى تكون ذروة الذاكرة (ru_maxrss) خاصة به.
+
+الاستخدام: python bench_training_pipeline.py [--rows 1000000] [--chunk-rows 200000] [--workers N]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from sample_data import random_sales
+from training_pipeline import load_training_arrays, peak_rss_mb
+
+MODES = ("rows", "chunked", "pool")
+
+
+def write_dump(path: str, rows: int) -> None:
+    """ملف مبيعات اصطناعي بنفس أعمدة الجدول، يُكتب على دفعات"""
+    written = 0
+    while written < rows:
+        count = min(100_000, rows - written)
+        sales = random_sales(count, seed=written)
+        pd.DataFrame({"domain": [s["domain"] for s in sales], "price": [f"${s['price']:,.0f}" for s in sales],
+                      "date": "2024-01-01", "venue": [s["venue"] for s in sales]}).to_csv(
+            path, mode="a", header=written == 0, index=False)
+        written += count
+
+
+def run_mode(mode: str, path: str, chunk_rows: int, workers: int) -> None:
+    started = time.perf_counter()
+    if mode == "rows":
+        from sales_loader import _parse_sales_rows
+        from train_model import prepare_training_data
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        sales = _parse_sales_rows([list(row) + ["", ""] for row in df.itertuples(index=False)])
+        rows = len(prepare_training_data(sales))
+    else:
+        X, _, _ = load_training_arrays([path], chunk_rows=chunk_rows, workers=1 if mode == "chunked" else workers)
+        rows = len(X)
+    seconds = time.perf_counter() - started
+    print(f"{mode:>8} {rows:>10,} {seconds:8.2f}s {rows / seconds:12,.0f} {peak_rss_mb():9,.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.path, args.chunk_rows, args.workers)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sales.csv")
+        write_dump(path, args.rows)
+        print(f"{args.rows:,} rows, {os.path.getsize(path) / 1e6:.0f}MB CSV, "
+              f"chunk {args.chunk_rows:,}, {args.workers} workers")
+        print(f"{'mode':>8} {'rows':>10} {'time':>9} {'rows/s':>12} {'peak RSS':>11}")
+        for mode in MODES:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, "--path", path,
+                            "--chunk-rows", str(args.chunk_rows), "--workers", str(args.workers)], check=True)
+
+
+if __name__ == "__main__":
+    main()
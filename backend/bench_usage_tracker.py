@@ -0,0 +1,118 @@
+# backend/bench_usage_tracker.py
+"""
+مقارنة أداء تتبع الاستخدام تحت الحمل المتزامن:
+- legacy: اتصال جديد لكل طلب + SELECT ثم UPDATE/INSERT منفصلين (journal افتراضي)
+- pooled: UsageTracker مع limiter="sqlite" (مجمع اتصالات + WAL + UPSERT ذري لكل طلب)
+- memory: UsageTracker الافتراضي (عدادات مقسمة في الذاكرة + حفظ على دفعات)
+
+الاستخدام: python bench_usage_tracker.py [--threads 16] [--requests 200] [--users 50]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from usage_tracker import UsageTracker
+
+
+class LegacyUsageTracker:
+    """نفس منطق UsageTracker السابق (للمقارنة فقط)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS usage_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_hash TEXT NOT NULL, date TEXT NOT NULL,
+                request_count INTEGER DEFAULT 0, last_request TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_user_date ON usage_records(user_hash, date)')
+        conn.commit()
+        conn.close()
+
+    def can_make_request(self, ip: str, user_agent: str, daily_limit: int = 3):
+        user_hash = UsageTracker._get_user_hash(None, ip, user_agent)
+        today = datetime.now().strftime("%Y-%m-%d")
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            cursor = conn.cursor()
+            cursor.execute('SELECT request_count FROM usage_records WHERE user_hash = ? AND date = ?',
+                           (user_hash, today))
+            result = cursor.fetchone()
+            if result and result[0] >= daily_limit:
+                conn.close()
+                return {"allowed": False}
+            if result:
+                cursor.execute('UPDATE usage_records SET request_count = request_count + 1, last_request = ? '
+                               'WHERE user_hash = ? AND date = ?', (datetime.now().isoformat(), user_hash, today))
+            else:
+                cursor.execute('INSERT INTO usage_records (user_hash, date, request_count, last_request) '
+                               'VALUES (?, ?, 1, ?)', (user_hash, today, datetime.now().isoformat()))
+            conn.commit()
+            conn.close()
+            return {"allowed": True}
+        except sqlite3.OperationalError:
+            return {"allowed": True, "error": True}
+
+
+def run(tracker, threads: int, requests: int, users: int, daily_limit: int):
+    allowed = {}
+    errors = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(worker_id: int):
+        barrier.wait()
+        for i in range(requests):
+            ip = f"10.0.0.{(worker_id * requests + i) % users}"
+            result = tracker.can_make_request(ip, "bench", daily_limit)
+            with lock:
+                if result.get("error"):
+                    errors[0] += 1
+                if result["allowed"]:
+                    allowed[ip] = allowed.get(ip, 0) + 1
+
+    workers = [threading.Thread(target=worker, args=(w,)) for w in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    over_limit = sum(max(0, count - daily_limit) for count in allowed.values())
+    return elapsed, over_limit, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="طلبات لكل thread")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+    total = args.threads * args.requests
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, factory in (("legacy", LegacyUsageTracker),
+                              ("pooled", lambda path: UsageTracker(path, pool_size=args.threads, limiter="sqlite")),
+                              ("memory", lambda path: UsageTracker(path, pool_size=args.threads))):
+            tracker = factory(os.path.join(tmp, f"{name}.db"))
+            elapsed, over_limit, errors = run(tracker, args.threads, args.requests, args.users, args.limit)
+            if hasattr(tracker, "close"):
+                tracker.close()
+            results[name] = elapsed
+            print(f"{name:>7}: {total / elapsed:10.0f} req/s  ({elapsed * 1000:.0f} ms total, "
+                  f"{over_limit} allowed over limit, {errors} lock errors)")
+        print(f"speedup: pooled {results['legacy'] / results['pooled']:.1f}x, "
+              f"memory {results['legacy'] / results['memory']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# backend/classification_cache.py
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def normalize_name(domain: str) -> str:
+    """الاسم من المستوى الثاني بشكل موحد: Cloud.COM و www.cloud.io -> cloud"""
+    name = domain.strip().lower()
+    for prefix in ("https://", "http://"):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    name = name.split("/", 1)[0]
+    if name.startswith("www."):
+        name = name[4:]
+    return name.split(".", 1)[0]
+
+
+def categories_version(categories: List[str]) -> str:
+    """بصمة قائمة الفئات: تغيير القائمة يبطل التصنيفات المخزنة تلقائياً"""
+    return hashlib.sha256("\n".join(categories).encode("utf-8")).hexdigest()[:12]
+
+
+class ClassificationCache:
+    """
+    كاش تصنيفات AI بمستويين:
+    - LRU في الذاكرة للمدخلات الساخنة (حجم محدود)
+    - SQLite بجانب usage.db لكل المدخلات (اتصال WAL واحد، مع TTL وحد أقصى للحجم)
+    من حلقة الأحداث تُستخدم aget_many/aput: الذاكرة مباشرة، و SQLite في threadpool.
+    """
+
+    def __init__(self, db_path: str = "classification_cache.db", max_memory_entries: int = 2048,
+                 max_disk_entries: int = 200_000, ttl_seconds: float = 30 * 86400):
+        if not os.path.isabs(db_path):
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            self.db_path = os.path.join(base_dir, db_path)
+        else:
+            self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # الاتصال مشترك بين الـ threads: استخدام واحد في كل مرة
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0,
+                       "memory_evictions": 0, "disk_evictions": 0, "writes": 0}
+        self._init_db()
+
+    def _init_db(self):
+        try:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS classifications (
+                    name TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (name, version)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_classifications_created ON classifications(created_at)')
+            conn.commit()
+            self._conn = conn
+        except Exception as e:
+            print(f"❌ خطأ في تهيئة كاش التصنيفات: {e}")
+            self.db_path = None
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.db_path = None
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return now - created_at >= self.ttl_seconds
+
+    def _memory_get(self, key: Tuple[str, str], now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if not self._expired(entry[1], now):
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[0]
+            del self._memory[key]
+            self._stats["expired"] += 1
+            return None
+
+    def _disk_get_many(self, keys: List[Tuple[str, str]], now: float) -> Dict[Tuple[str, str], str]:
+        """البحث في SQLite عن مفاتيح غير موجودة في الذاكرة (مع تحديث الإحصائيات و LRU)"""
+        rows: Dict[Tuple[str, str], tuple] = {}
+        if self.db_path and keys:
+            try:
+                with self._db_lock:
+                    for key in keys:
+                        row = self._conn.execute(
+                            'SELECT category, created_at FROM classifications WHERE name = ? AND version = ?',
+                            key).fetchone()
+                        if row is not None:
+                            rows[key] = row
+            except Exception as e:
+                print(f"⚠️ خطأ في قراءة كاش التصنيفات: {e}")
+
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = rows.get(key)
+                if row is None or self._expired(row[1], now):
+                    if row is not None:
+                        self._stats["expired"] += 1
+                    self._stats["misses"] += 1
+                    continue
+                self._stats["disk_hits"] += 1
+                self._remember(key, row[0], row[1])
+                found[key] = row[0]
+        return found
+
+    def get(self, domain: str, version: str) -> Optional[str]:
+        key = (normalize_name(domain), version)
+        now = time.time()
+        category = self._memory_get(key, now)
+        if category is not None:
+            return category
+        return self._disk_get_many([key], now).get(key)
+
+    async def aget_many(self, domains: List[str], version: str) -> Dict[str, str]:
+        """التصنيفات المخزنة لعدة نطاقات: الذاكرة فوراً، والباقي من SQLite في threadpool دفعة واحدة"""
+        now = time.time()
+        found: Dict[str, str] = {}
+        missing: Dict[Tuple[str, str], List[str]] = {}
+        for domain in domains:
+            key = (normalize_name(domain), version)
+            category = self._memory_get(key, now) if key not in missing else None
+            if category is not None:
+                found[domain] = category
+            else:
+                missing.setdefault(key, []).append(domain)
+        if missing and self.db_path:
+            from_disk = await asyncio.to_thread(self._disk_get_many, list(missing), now)
+            for key, category in from_disk.items():
+                for domain in missing[key]:
+                    found[domain] = category
+        elif missing:
+            with self._lock:
+                self._stats["misses"] += len(missing)
+        return found
+
+    def _remember_write(self, key: Tuple[str, str], category: str, now: float) -> bool:
+        """تحديث الذاكرة لكتابة جديدة؛ يعيد True إذا حان وقت التنظيف"""
+        with self._lock:
+            self._remember(key, category, now)
+            self._stats["writes"] += 1
+            self._writes_since_prune += 1
+            prune = self._writes_since_prune >= 256
+            if prune:
+                self._writes_since_prune = 0
+        return prune
+
+    def _disk_put(self, key: Tuple[str, str], category: str, now: float, prune: bool) -> None:
+        if not self.db_path:
+            return
+        try:
+            with self._db_lock:
+                self._conn.execute('INSERT OR REPLACE INTO classifications (name, version, category, created_at) '
+                                   'VALUES (?, ?, ?, ?)', (*key, category, now))
+                self._conn.commit()
+            if prune:
+                self.prune()
+        except Exception as e:
+            print(f"⚠️ خطأ في حفظ كاش التصنيفات: {e}")
+
+    def put(self, domain: str, version: str, category: str) -> None:
+        key = (normalize_name(domain), version)
+        now = time.time()
+        self._disk_put(key, category, now, self._remember_write(key, category, now))
+
+    async def aput(self, domain: str, version: str, category: str) -> None:
+        """مثل put: الذاكرة فوراً (تراه الطلبات التالية)، والكتابة في SQLite في threadpool"""
+        key = (normalize_name(domain), version)
+        now = time.time()
+        prune = self._remember_write(key, category, now)
+        if self.db_path:
+            await asyncio.to_thread(self._disk_put, key, category, now, prune)
+
+    def _remember(self, key: Tuple[str, str], category: str, created_at: float) -> None:
+        """إضافة إلى LRU الذاكرة (يجب استدعاؤها مع القفل)"""
+        self._memory[key] = (category, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["memory_evictions"] += 1
+
+    def prune(self) -> int:
+        """حذف المدخلات المنتهية ثم الأقدم إذا تجاوز الحجم الحد الأقصى"""
+        if not self.db_path:
+            return 0
+        with self._db_lock:
+            cursor = self._conn.cursor()
+            cursor.execute('DELETE FROM classifications WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+            removed = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM classifications WHERE rowid IN (
+                    SELECT rowid FROM classifications ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_disk_entries,))
+            removed += cursor.rowcount
+            self._conn.commit()
+        with self._lock:
+            self._stats["disk_evictions"] += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = round(hits / lookups, 4) if lookups else None
+        return stats
+
+
+# إنشاء instance عالمي
+classification_cache = ClassificationCache()
@@ -1,14 +1,180 @@
 # backend/config_loader.py
 import json
 import os
-from typing import Dict, Any
-
-def get_settings() -> Dict[str, Any]:
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    CONFIG_PATH = os.path.join(BASE_DIR, "config", "app_settings.json")
-    
-    if not os.path.exists(CONFIG_PATH):
-        raise FileNotFoundError(f"ملف الإعدادات غير موجود: {CONFIG_PATH}")
-    
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(BASE_DIR, "config", "app_settings.json")
+
+_NUMBER = (int, float)
+_OPTIONAL_STR = (str, type(None))
+
+# الأنواع المقبولة للمفاتيح المعروفة (المفاتيح الأخرى تُقبل كما هي)
+SETTINGS_TYPES: Dict[str, tuple] = {
+    "google_sheets_csv_url": (str,),
+    "google_sheets_spreadsheet_id": (str,),
+    "google_sheets_sheet_name": (str,),
+    "atom_spreadsheet_id": (str,),
+    "atom_sheet_name": (str,),
+    "ai_api_key": _OPTIONAL_STR,
+    "ai_enabled": (bool,),
+    "sales_cache_ttl_seconds": _NUMBER,
+    "sales_incremental_sync": (bool,),
+    "sales_full_sync_interval_seconds": _NUMBER,
+    "atom_cache_ttl_seconds": _NUMBER,
+    "batch_max_domains": (int,),
+    "local_classifier_min_confidence": _NUMBER,
+    "request_deadline_seconds": _NUMBER,
+    "batch_deadline_seconds": _NUMBER,
+    "response_cache_max_entries": (int,),
+    "response_cache_spill_path": _OPTIONAL_STR,
+    "usage_retention_days": (int,),
+    "maintenance_off_peak_hours": (list, type(None)),
+    "maintenance_retention_interval_seconds": _NUMBER,
+    "maintenance_analyze_interval_seconds": _NUMBER,
+    "maintenance_vacuum_interval_seconds": _NUMBER,
+    "appraisal_executor": (str,),
+    "appraisal_workers": (int, type(None)),
+    "model_backend": _OPTIONAL_STR,
+    "feature_store_enabled": (bool,),
+    "feature_store_path": _OPTIONAL_STR,
+    # "memory" (افتراضي) يعد الطلبات لكل عملية على حدة؛ "sqlite" يشترك فيه كل الـ workers
+    "rate_limiter": (str,),
+}
+
+# قيم يجب أن تكون موجبة (صفر أو سالب يعطل الكاش أو الميزانية بصمت)
+_POSITIVE = {"batch_max_domains", "request_deadline_seconds", "batch_deadline_seconds",
+             "response_cache_max_entries", "usage_retention_days", "appraisal_workers"}
+_NON_NEGATIVE = {"sales_cache_ttl_seconds", "sales_full_sync_interval_seconds", "atom_cache_ttl_seconds"}
+
+
+class SettingsError(ValueError):
+    """ملف الإعدادات غير صالح (JSON أو أنواع القيم)"""
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def validate_settings(raw: Any) -> Mapping[str, Any]:
+    """التحقق من الأنواع والقيم ثم إرجاع نسخة غير قابلة للتعديل"""
+    if not isinstance(raw, dict):
+        raise SettingsError("settings must be a JSON object")
+    errors = []
+    for key, types in SETTINGS_TYPES.items():
+        if key not in raw:
+            continue
+        value = raw[key]
+        # bool فرع من int في بايثون: لا نقبل true مكان رقم
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            errors.append(f"{key}: expected {'/'.join(t.__name__ for t in types)}, got {type(value).__name__}")
+        elif key in _POSITIVE and value is not None and value <= 0:
+            errors.append(f"{key}: must be > 0")
+        elif key in _NON_NEGATIVE and value < 0:
+            errors.append(f"{key}: must be >= 0")
+    confidence = raw.get("local_classifier_min_confidence")
+    if isinstance(confidence, _NUMBER) and not 0 <= confidence <= 1:
+        errors.append("local_classifier_min_confidence: must be between 0 and 1")
+    if raw.get("appraisal_executor", "thread") not in ("inline", "thread", "process"):
+        errors.append("appraisal_executor: must be inline, thread or process")
+    if raw.get("rate_limiter", "memory") not in ("memory", "sqlite"):
+        errors.append("rate_limiter: must be memory or sqlite")
+    if raw.get("model_backend") not in (None, "sklearn", "flat", "xgboost"):
+        errors.append("model_backend: must be sklearn, flat or xgboost")
+    if errors:
+        raise SettingsError("; ".join(errors))
+    return _freeze(raw)
+
+
+class LoadedSettings(NamedTuple):
+    values: Mapping[str, Any]
+    version: int
+    loaded_at: str
+    file_stamp: tuple
+
+
+class SettingsProvider:
+    """
+    إعدادات مقروءة ومتحقق منها مرة واحدة ومشتركة بين كل الطلبات.
+    يُفحص الملف (mtime/الحجم) كل check_interval ثانية ويُستبدل ذرياً عند تغيّره؛
+    إذا كان الملف الجديد غير صالح تبقى الإعدادات الحالية.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._current: Optional[LoadedSettings] = None
+        self._last_check = 0.0
+        self._version = 0
+        self._rejected_stamp: Optional[tuple] = None  # ملف غير صالح لا نعيد تحليله حتى يتغير
+        self._reload_lock = threading.Lock()
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self) -> bool:
+        """إعادة قراءة الملف إذا تغيّر. عند الفشل تبقى الإعدادات الحالية."""
+        with self._reload_lock:
+            self._last_check = time.time()
+            stamp = self._file_stamp()
+            if stamp is None:
+                return False
+            if self._current is not None and self._current.file_stamp == stamp:
+                return True
+            if self._current is not None and stamp == self._rejected_stamp:
+                return False
+            try:
+                # utf-8-sig: ملفات محررة على Windows قد تبدأ بـ BOM
+                with open(self.path, "r", encoding="utf-8-sig") as f:
+                    values = validate_settings(json.load(f))
+            except (OSError, ValueError) as e:
+                if self._current is None:
+                    raise SettingsError(f"ملف الإعدادات غير صالح: {e}") from e
+                self._rejected_stamp = stamp
+                print(f"⚠️ ملف الإعدادات غير صالح (تبقى الإعدادات الحالية): {e}")
+                return False
+            self._version += 1
+            self._current = LoadedSettings(values, self._version,
+                                           time.strftime("%Y-%m-%dT%H:%M:%S"), stamp)
+            if self._version > 1:
+                print(f"✅ تم تحديث الإعدادات (الإصدار {self._version})")
+            return True
+
+    def get(self) -> Mapping[str, Any]:
+        """الإعدادات الحالية، مع فحص دوري (stat فقط) لتغيّر الملف"""
+        now = time.time()
+        current = self._current
+        if current is None or (now - self._last_check >= self.check_interval and not self._reload_lock.locked()):
+            self._last_check = now
+            stamp = self._file_stamp()
+            if stamp is None and current is None:
+                raise FileNotFoundError(f"ملف الإعدادات غير موجود: {self.path}")
+            if stamp is not None and (current is None or stamp not in (current.file_stamp, self._rejected_stamp)):
+                self.reload()
+        if self._current is None:
+            raise FileNotFoundError(f"ملف الإعدادات غير موجود: {self.path}")
+        return self._current.values
+
+    @property
+    def version(self) -> int:
+        """يزداد مع كل تبديل للإعدادات (0 قبل أول تحميل)"""
+        return self._version
+
+
+# instance عالمي مشترك بين كل الطلبات
+settings_provider = SettingsProvider()
+
+
+def get_settings() -> Mapping[str, Any]:
+    return settings_provider.get()
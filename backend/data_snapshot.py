@@ -0,0 +1,93 @@
+# backend/data_snapshot.py
+import os
+import json
+import time
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "data")
+
+# يُرفع عند تغيير شكل الملف حتى يتم تجاهل اللقطات القديمة
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+def snapshot_path(name: str, snapshot_dir: Optional[str] = None) -> str:
+    return os.path.join(snapshot_dir or SNAPSHOT_DIR, f"{name}_snapshot.npz")
+
+
+def data_version(records: List[Dict], columns: Dict[str, type]) -> str:
+    """بصمة محتوى البيانات (تتغير عند تغير أي قيمة)"""
+    digest = hashlib.sha256()
+    for record in records:
+        digest.update("\x1f".join(str(record.get(c, "")) for c in columns).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()[:16]
+
+
+def _encode_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    عمود نصي كبايتات UTF-8 متتالية + offsets (n + 1). مصفوفة np.str_ ثابتة العرض (UTF-32
+    بطول أطول قيمة) تجعل رابط source_url طويل واحد يضاعف حجم كل الصفوف في الذاكرة وعلى القرص.
+    """
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    blob = data.tobytes()
+    bounds = offsets.tolist()
+    return [blob[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+
+def save_snapshot(name: str, records: List[Dict], columns: Dict[str, type], source: str,
+                  snapshot_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    حفظ البيانات المحللة كملف عمودي مضغوط (npz): عمود لكل حقل + بيانات وصفية.
+    الكتابة ذرية (ملف مؤقت ثم استبدال).
+    """
+    path = snapshot_path(name, snapshot_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "data_version": data_version(records, columns),
+        "saved_at": time.time(),
+        "source": source,
+        "rows": len(records),
+    }
+    arrays = {"__meta__": np.array(json.dumps(meta))}
+    for column, kind in columns.items():
+        if kind is float:
+            arrays[column] = np.array([r[column] for r in records], dtype=np.float64)
+        else:
+            arrays[f"{column}__bytes"], arrays[f"{column}__offsets"] = _encode_strings(
+                [str(r[column]) for r in records])
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return meta
+
+
+def load_snapshot(name: str, columns: Dict[str, type], source: str,
+                  snapshot_dir: Optional[str] = None) -> Optional[Tuple[List[Dict], Dict[str, Any]]]:
+    """قراءة اللقطة إذا كانت موجودة ومتوافقة (نفس الإصدار ونفس مصدر البيانات)"""
+    path = snapshot_path(name, snapshot_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["__meta__"]))
+            if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION or meta.get("source") != source:
+                return None
+            values = {c: data[c].tolist() if kind is float else
+                      _decode_strings(data[f"{c}__bytes"], data[f"{c}__offsets"])
+                      for c, kind in columns.items()}
+    except Exception as e:
+        print(f"⚠️ تعذر قراءة لقطة {name}: {e}")
+        return None
+    records = [{c: values[c][i] for c in columns} for i in range(meta["rows"])]
+    return records, meta
@@ -0,0 +1,90 @@
+# backend/data_sources.py
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import sheets_client
+import sales_loader
+import atom_loader
+from deadline import Deadline
+
+
+def _sales_args(settings: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "spreadsheet_id": settings['google_sheets_spreadsheet_id'],
+        "sheet_name": settings.get('google_sheets_sheet_name', 'Domains'),
+        "incremental": settings.get('sales_incremental_sync', True),
+        "full_sync_interval": settings.get('sales_full_sync_interval_seconds', 21600),
+    }
+
+
+def _atom_args(settings: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "spreadsheet_id": settings['atom_spreadsheet_id'],
+        "sheet_name": settings.get('atom_sheet_name', 'Atom'),
+    }
+
+
+def load_all(settings: Dict[str, Any], deadline: Optional[Deadline] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    تحميل المبيعات وعروض Atom. عندما يحتاج المصدران إلى تحديث معاً، يتم جلب النطاقين
+    مسبقاً بطلب batchGet واحد لكل جدول بدل رحلتين منفصلتين.
+    مع deadline محدود لا ينتظر البدء البارد أكثر من الوقت المتبقي.
+    """
+    sales_args, atom_args = _sales_args(settings), _atom_args(settings)
+    sales_ttl = settings.get('sales_cache_ttl_seconds', 300)
+    atom_ttl = settings.get('atom_cache_ttl_seconds', 3600)
+    sales_cache, atom_cache = sales_loader.get_cache(), atom_loader.get_cache()
+
+    if sales_cache.snapshot is None:
+        sales_loader.restore_from_disk(sales_args["spreadsheet_id"], sales_args["sheet_name"])
+    if atom_cache.snapshot is None:
+        atom_loader.restore_from_disk(atom_args["spreadsheet_id"], atom_args["sheet_name"])
+
+    bounded = deadline is not None and deadline.remaining() is not None
+    if sales_cache.snapshot is None and atom_cache.snapshot is None:
+        if bounded:
+            # التحميل في الخلفية؛ المحملات تنتظره ضمن الوقت المتبقي فقط
+            _refresh_together_in_background(sales_args, atom_args)
+        else:
+            # بدء بارد للمصدرين: جلب مسبق متزامن ثم التحليل من القيم المجلوبة
+            _prefetch(sales_args, atom_args)
+    elif sales_cache.is_stale(sales_ttl) and atom_cache.is_stale(atom_ttl):
+        _refresh_together_in_background(sales_args, atom_args)
+
+    sales = sales_loader.load_sales_from_google_sheets(cache_ttl=sales_ttl, deadline=deadline, **sales_args)
+    atom_listings = atom_loader.load_atom_listings(cache_ttl=atom_ttl, deadline=deadline, **atom_args)
+    if deadline is not None and (sales_cache.snapshot is None or atom_cache.snapshot is None):
+        deadline.degrade("data")
+    return sales, atom_listings
+
+
+def _prefetch(sales_args: Dict[str, Any], atom_args: Dict[str, Any]) -> None:
+    try:
+        sheets_client.prefetch([
+            (sales_args["spreadsheet_id"], sales_loader.next_sync_range(**sales_args)),
+            (atom_args["spreadsheet_id"], atom_loader.next_sync_range(atom_args["sheet_name"])),
+        ])
+    except Exception as e:
+        # كل مصدر سيحاول الجلب بمفرده
+        print(f"⚠️ فشل الجلب المجمّع من Sheets: {e}")
+
+
+def _refresh_together_in_background(sales_args: Dict[str, Any], atom_args: Dict[str, Any]) -> bool:
+    sales_cache, atom_cache = sales_loader.get_cache(), atom_loader.get_cache()
+    if not sales_cache.begin_refresh():
+        return False
+    if not atom_cache.begin_refresh():
+        sales_cache.end_refresh()
+        return False
+
+    def _worker():
+        try:
+            _prefetch(sales_args, atom_args)
+            sales_cache.run_refresh(sales_loader.sales_fetcher(**sales_args))
+            atom_cache.run_refresh(atom_loader.atom_fetcher(**atom_args))
+        finally:
+            sales_cache.end_refresh()
+            atom_cache.end_refresh()
+
+    threading.Thread(target=_worker, name="sheets-refresh", daemon=True).start()
+    return True
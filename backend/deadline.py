@@ -0,0 +1,43 @@
+# backend/deadline.py
+import time
+from typing import List, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """نفدت ميزانية الطلب قبل بدء المرحلة"""
+
+
+class Deadline:
+    """
+    ميزانية زمنية لطلب واحد تُمرر إلى المحملات و AIEnhancer.
+    كل مرحلة تأخذ min(مهلتها الافتراضية، الوقت المتبقي)، وعند نفاد الميزانية
+    تتخطى المرحلة عملها الاختياري وتسجل سبب التدهور (degraded).
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.degraded_reasons: List[str] = []
+
+    def remaining(self) -> Optional[float]:
+        """الوقت المتبقي بالثواني (None = بدون حد)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout(self, default: float) -> float:
+        """مهلة مرحلة: الافتراضية أو الوقت المتبقي أيهما أقل"""
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def degrade(self, reason: str) -> None:
+        if reason not in self.degraded_reasons:
+            self.degraded_reasons.append(reason)
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.degraded_reasons)
@@ -0,0 +1,231 @@
+# backend/feature_store.py
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: قفل داخل العملية فقط
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATURE_STORE_DIR = os.path.join(BASE_DIR, "data", "features")
+
+# يُرفع عند تغيير شكل الملفات
+FEATURE_STORE_FORMAT_VERSION = 1
+
+# compute(domains) -> (values (n, columns) float64, keyword_bits (n, bytes) uint8, valid (n,) bool)
+ComputeFn = Callable[[List[str]], Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+
+class FeatureSegment:
+    """
+    ميزات إصدار مخطط واحد في مجلد خاص به، كملفات ثنائية تُضاف في نهايتها فقط:
+    values.f64 (n, columns) و keywords.u8 (n, bytes) تُقرأ عبر np.memmap، و domains.txt سطر لكل صف.
+    meta.json يسجل عدد الصفوف المكتملة (يُكتب آخراً)، فالصفوف الزائدة بعد انقطاع تُتجاهل.
+    """
+
+    def __init__(self, path: str, schema_version: str, columns: Sequence[str], keyword_bytes: int):
+        self.path = path
+        self.schema_version = schema_version
+        self.columns = list(columns)
+        self.keyword_bytes = keyword_bytes
+        self._index: Dict[str, int] = {}
+        self._count = 0
+        self._domains_bytes = 0
+        self._lock = threading.Lock()
+        self._maps: Optional[Tuple[int, np.ndarray, np.ndarray]] = None  # (count, values, bits)
+        os.makedirs(path, exist_ok=True)
+        with self._file_lock():
+            self._sync()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self):
+        """قفل بين العمليات (الخادم والتدريب قد يكتبان في نفس المجلد)"""
+        with open(self._file(".lock"), "a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Tuple[int, int]:
+        """(عدد الصفوف المكتملة، حجم domains.txt المقابل بالبايت)"""
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return 0, 0
+        if meta.get("format_version") != FEATURE_STORE_FORMAT_VERSION or meta.get("columns") != self.columns:
+            return 0, 0
+        return int(meta.get("rows", 0)), int(meta.get("domains_bytes", 0))
+
+    def _sync(self) -> None:
+        """قراءة الصفوف التي أضافتها عمليات أخرى (مثل التدريب) منذ آخر مزامنة"""
+        count, self._domains_bytes = self._read_meta()
+        if count == self._count:
+            return
+        if count < self._count:
+            # الملفات أُعيد إنشاؤها: نبدأ من جديد
+            self._index, self._count = {}, 0
+        with open(self._file("domains.txt"), "r", encoding="utf-8") as f:
+            added = {}
+            for row, line in enumerate(f):
+                if row >= count:
+                    break
+                if row >= self._count:
+                    added[line.rstrip("\n")] = row
+        # _count أولاً: أي رقم صف يظهر في _index يكون دائماً أقل من _count
+        self._count = count
+        self._index.update(added)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def lookup(self, domains: Sequence[str]) -> np.ndarray:
+        """رقم الصف لكل نطاق (‎-1 إذا لم يُحسب بعد)"""
+        index = self._index
+        return np.fromiter((index.get(d, -1) for d in domains), dtype=np.int64, count=len(domains))
+
+    def append(self, domains: List[str], values: np.ndarray, keyword_bits: np.ndarray) -> None:
+        """إضافة صفوف جديدة (يتجاهل النطاقات الموجودة مسبقاً)"""
+        with self._lock, self._file_lock():
+            self._sync()
+            keep = [i for i, d in enumerate(domains) if d not in self._index]
+            # تكرار داخل الدفعة نفسها
+            seen, unique = set(), []
+            for i in keep:
+                if domains[i] not in seen:
+                    seen.add(domains[i])
+                    unique.append(i)
+            if not unique:
+                return
+            values = np.ascontiguousarray(values[unique], dtype=np.float64)
+            keyword_bits = np.ascontiguousarray(keyword_bits[unique], dtype=np.uint8)
+            start = self._count
+            # قص أي بقايا كتابة منقطعة ثم الإضافة؛ meta.json يُكتب آخراً
+            lines = "".join(f"{domains[i]}\n" for i in unique).encode("utf-8")
+            for name, size, data in (("values.f64", start * 8 * len(self.columns), values.tobytes()),
+                                     ("keywords.u8", start * self.keyword_bytes, keyword_bits.tobytes()),
+                                     ("domains.txt", self._domains_bytes, lines)):
+                with open(self._file(name), "ab") as f:
+                    f.truncate(size)
+                    f.write(data)
+            self._write_meta(start + len(unique), self._domains_bytes + len(lines))
+            self._count = start + len(unique)
+            self._domains_bytes += len(lines)
+            for offset, i in enumerate(unique):
+                self._index[domains[i]] = start + offset
+
+    def _write_meta(self, rows: int, domains_bytes: int) -> None:
+        path = self._file("meta.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"format_version": FEATURE_STORE_FORMAT_VERSION, "schema_version": self.schema_version,
+                       "columns": self.columns, "keyword_bytes": self.keyword_bytes, "rows": rows,
+                       "domains_bytes": domains_bytes}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """الملفات كمصفوفات memmap للقراءة فقط (يُعاد فتحها بعد كل إضافة)"""
+        maps = self._maps
+        if maps is None or maps[0] != self._count:
+            if self._count == 0:
+                values = np.zeros((0, len(self.columns)), dtype=np.float64)
+                bits = np.zeros((0, self.keyword_bytes), dtype=np.uint8)
+            else:
+                values = np.memmap(self._file("values.f64"), dtype=np.float64, mode="r",
+                                   shape=(self._count, len(self.columns)))
+                bits = (np.memmap(self._file("keywords.u8"), dtype=np.uint8, mode="r",
+                                  shape=(self._count, self.keyword_bytes))
+                        if self.keyword_bytes else np.zeros((self._count, 0), dtype=np.uint8))
+            maps = self._maps = (self._count, values, bits)
+        return maps[1], maps[2]
+
+    def read(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(values, keyword_bits) للصفوف المطلوبة (نسخ في الذاكرة)"""
+        values, bits = self._arrays()
+        return np.asarray(values[rows]), np.asarray(bits[rows])
+
+    def fetch(self, domains: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(rows, values, keyword_bits) للنطاقات المخزنة، من حالة واحدة متسقة مع append المتزامن"""
+        with self._lock:
+            rows = self.lookup(domains)
+            values, bits = self.read(rows[rows >= 0])
+        return rows, values, bits
+
+
+class FeatureStore:
+    """
+    مخزن ميزات دائم مفتاحه (إصدار مخطط الميزات، النطاق): تُحسب ميزات كل نطاق مرة واحدة
+    ويُعاد استخدامها في التدريب وبناء مصفوفة المبيعات. تغيّر المخطط (الأعمدة، خريطة الكلمات،
+    درجات TLD) يعني مجلداً جديداً بدل خلط ميزات غير متوافقة.
+    """
+
+    def __init__(self, root: str = FEATURE_STORE_DIR):
+        self.root = root
+        self._segments: Dict[str, FeatureSegment] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "computed": 0}
+
+    def segment(self, schema_version: str, columns: Sequence[str], keyword_bytes: int) -> FeatureSegment:
+        with self._lock:
+            segment = self._segments.get(schema_version)
+            if segment is None:
+                segment = FeatureSegment(os.path.join(self.root, schema_version), schema_version,
+                                         columns, keyword_bytes)
+                self._segments[schema_version] = segment
+            return segment
+
+    def get_or_compute(self, domains: Sequence[str], schema_version: str, columns: Sequence[str],
+                       keyword_bytes: int, compute: ComputeFn) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (values, keyword_bits, valid) لكل النطاقات بالترتيب المعطى.
+        النطاقات غير المخزنة فقط تُحسب (دفعة واحدة) وتُضاف؛ valid=False للنطاقات التي فشل حسابها.
+        """
+        segment = self.segment(schema_version, columns, keyword_bytes)
+        domains = list(domains)
+        # بناء مصفوفة المبيعات وتحديث Atom قد يستدعيانها في نفس الوقت: القراءة تحت قفل المقطع
+        rows, stored_values, stored_bits = segment.fetch(domains)
+        values = np.zeros((len(domains), len(columns)), dtype=np.float64)
+        bits = np.zeros((len(domains), keyword_bytes), dtype=np.uint8)
+        valid = rows >= 0
+        if valid.any():
+            values[valid], bits[valid] = stored_values, stored_bits
+
+        missing_positions = np.flatnonzero(~valid)
+        if len(missing_positions):
+            missing = list(dict.fromkeys(domains[i] for i in missing_positions))
+            new_values, new_bits, new_valid = compute(missing)
+            order = {domain: i for i, domain in enumerate(missing)}
+            source = np.array([order[domains[i]] for i in missing_positions], dtype=np.int64)
+            values[missing_positions] = new_values[source]
+            bits[missing_positions] = new_bits[source]
+            valid[missing_positions] = new_valid[source]
+            # أسطر domains.txt: النطاقات التي تحتوي فواصل أسطر تُعاد دون تخزين
+            ok = [i for i in np.flatnonzero(new_valid) if "\n" not in missing[i] and "\r" not in missing[i]]
+            segment.append([missing[i] for i in ok], new_values[ok], new_bits[ok])
+            self.stats["computed"] += len(missing)
+        self.stats["hits"] += len(domains) - len(missing_positions)
+        return values, bits, valid
+
+
+_default_store: Optional[FeatureStore] = None
+
+
+def set_default_feature_store(store: Optional[FeatureStore]) -> None:
+    """المخزن الذي يستخدمه AppraisalEngine عند عدم تمرير مخزن صراحة (None يعطله)"""
+    global _default_store
+    _default_store = store
+
+
+def get_default_feature_store() -> Optional[FeatureStore]:
+    return _default_store
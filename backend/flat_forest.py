@@ -0,0 +1,101 @@
+# backend/flat_forest.py
+import os
+from typing import Optional
+
+import numpy as np
+
+FLAT_FOREST_FORMAT_VERSION = 1
+LEAF = -1
+
+
+class FlatForest:
+    """
+    غابة أشجار انحدار مسطحة في مصفوفات NumPy متصلة (عقد كل الأشجار متتالية):
+    feature / threshold / left / right / value لكل عقدة + جذر كل شجرة.
+    التقييم يمشي كل الأشجار لكل الصفوف معاً خطوة عمق في كل مرة،
+    بدون تحقق sklearn ولا توزيع threads (مناسب لصف واحد أو دفعات صغيرة).
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, max_depth: int, n_features: int):
+        self.feature = feature        # int32، الميزة المقارنة (0 للأوراق)
+        self.threshold = threshold    # float64، الذهاب يساراً إذا x <= threshold
+        self.left = left              # int32، فهرس عام؛ LEAF للأوراق
+        self.right = right
+        self.value = value            # float64، قيمة الورقة (متوسط الهدف)
+        self.roots = roots            # int32، فهرس جذر كل شجرة
+        self.max_depth = max_depth
+        self.n_features = n_features
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        """من RandomForestRegressor (أو أي مجموعة estimators_ بشجرة tree_) بمخرج واحد"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            if tree.n_outputs != 1:
+                raise ValueError("FlatForest supports single-output regressors only")
+            is_leaf = tree.children_left == LEAF
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, LEAF, tree.children_left + offset))
+            rights.append(np.where(is_leaf, LEAF, tree.children_right + offset))
+            values.append(tree.value[:, 0, 0])
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=int(max_depth),
+            n_features=int(model.n_features_in_),
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.value)
+
+    def predict(self, X) -> np.ndarray:
+        """متوسط الأشجار لكل صف؛ X بشكل (n, n_features) أو صف واحد (n_features,)"""
+        # sklearn يقارن بعد التحويل إلى float32 فنفعل المثل لتطابق المسارات حرفياً
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            if not (left != LEAF).any():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(left == LEAF, nodes, np.where(go_left, left, self.right[nodes]))
+        return self.value[nodes].sum(axis=1) / self.n_trees
+
+    def save(self, path: str) -> None:
+        """حفظ المصفوفات (npz بدون pickle) بكتابة ذرية"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 value=self.value, roots=self.roots,
+                 meta=np.array([FLAT_FOREST_FORMAT_VERSION, self.max_depth, self.n_features], dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["FlatForest"]:
+        with np.load(path, allow_pickle=False) as data:
+            version, max_depth, n_features = (int(v) for v in data["meta"])
+            if version != FLAT_FOREST_FORMAT_VERSION:
+                return None
+            return cls(data["feature"], data["threshold"], data["left"], data["right"], data["value"],
+                       data["roots"], max_depth, n_features)
@@ -0,0 +1,85 @@
+# backend/keyword_matcher.py
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class KeywordMatcher:
+    """
+    مطابق كلمات متعدد الأنماط (Aho-Corasick) يُبنى مرة واحدة من خريطة الكلمات المفتاحية.
+    يجد كل الكلمات الموجودة داخل الاسم في مسح خطي واحد بدل فحص كل كلمة على حدة.
+    ترتيب الأولوية هو ترتيب المفاتيح في الخريطة (أول تطابق في الخريطة يفوز كما في السابق).
+    """
+
+    def __init__(self, keyword_map: Dict[str, str], extra_keywords: Iterable[str] = ()):
+        self.keywords: List[str] = list(keyword_map)
+        self.categories: List[str] = [keyword_map[k] for k in self.keywords]
+        index = {k: i for i, k in enumerate(self.keywords)}
+        self.patterns: List[str] = list(self.keywords)
+        extra_ids = set()
+        for keyword in extra_keywords:
+            keyword = keyword.lower()
+            if keyword not in index:
+                index[keyword] = len(self.patterns)
+                self.patterns.append(keyword)
+            extra_ids.add(index[keyword])
+        self.extra_ids = frozenset(extra_ids)
+        self._build()
+
+    def _build(self):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Set[int]] = [set()]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append(set())
+                state = nxt
+            outputs[state].add(pattern_id)
+
+        # روابط الفشل بترتيب BFS ثم تحويلها إلى جدول انتقالات كامل (DFA)
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            delta[state] = dict(delta[fail[state]])
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+                delta[state][ch] = nxt
+                queue.append(nxt)
+
+        self._delta = delta
+        self._outputs = [tuple(sorted(o)) for o in outputs]
+
+    def scan(self, text: str) -> Set[int]:
+        """أرقام كل الأنماط الموجودة في النص (مسح خطي واحد)"""
+        delta = self._delta
+        outputs = self._outputs
+        matched: Set[int] = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                matched.update(outputs[state])
+        return matched
+
+    def analyze(self, text: str) -> Tuple[List[str], Optional[str], int]:
+        """
+        مسح واحد يعيد: (الكلمات المفتاحية بترتيب الخريطة، فئة أول تطابق، عدد الكلمات الإضافية)
+        """
+        matched = self.scan(text)
+        keyword_count = len(self.keywords)
+        keyword_ids = sorted(i for i in matched if i < keyword_count)
+        category = self.categories[keyword_ids[0]] if keyword_ids else None
+        extra_count = len(matched & self.extra_ids)
+        return [self.keywords[i] for i in keyword_ids], category, extra_count
+
+    def find_all(self, text: str) -> List[Tuple[str, str]]:
+        """كل التطابقات مع فئاتها بترتيب الأولوية"""
+        matched = self.scan(text)
+        return [(self.keywords[i], self.categories[i]) for i in sorted(matched) if i < len(self.keywords)]
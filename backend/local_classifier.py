@@ -0,0 +1,95 @@
+# backend/local_classifier.py
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from classification_cache import normalize_name
+
+
+def char_ngrams(name: str, ngram_range: Tuple[int, int] = (2, 4)) -> List[str]:
+    """n-grams حرفية مع علامات بداية/نهاية الاسم (^cloud$)"""
+    text = f"^{name}$"
+    low, high = ngram_range
+    return [text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1)]
+
+
+class LocalClassifier:
+    """
+    مصنف Naive Bayes متعدد الحدود على n-grams حرفية لاسم النطاق.
+    يُدرب من عروض Atom عند كل تحديث ويعيد (الفئة، الثقة) خلال ميكروثوانٍ.
+    الاحتمال البعدي لـ NB مبالغ فيه لأسماء لا علاقة لها بأي فئة (garden.net ← Health 0.99)،
+    لذلك تُخفض الثقة عندما تقل نسبة n-grams الطويلة (3+) التي ظهرت في أسماء الفئة عن min_coverage.
+    """
+
+    def __init__(self, categories: List[str], vocabulary: Dict[str, int], log_prior: np.ndarray,
+                 log_likelihood: np.ndarray, ngram_range: Tuple[int, int] = (2, 4), min_coverage: float = 0.25):
+        self.categories = categories
+        self.vocabulary = vocabulary
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood  # (عدد n-grams × عدد الفئات)
+        self.ngram_range = ngram_range
+        self.min_coverage = min_coverage
+        # n-gram لم تظهر مع الفئة في التدريب = قيمة التنعيم (أصغر قيمة في العمود)
+        self._unseen = log_likelihood.min(axis=0) + 1e-3
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    @classmethod
+    def fit(cls, names: Iterable[str], labels: Iterable[str], alpha: float = 0.5,
+            ngram_range: Tuple[int, int] = (2, 4)) -> Optional["LocalClassifier"]:
+        categories: Dict[str, int] = {}
+        vocabulary: Dict[str, int] = {}
+        rows, cols = [], []
+        label_ids = []
+        for name, label in zip(names, labels):
+            if not name or not label:
+                continue
+            c = categories.setdefault(label, len(categories))
+            label_ids.append(c)
+            for gram in char_ngrams(name, ngram_range):
+                rows.append(vocabulary.setdefault(gram, len(vocabulary)))
+                cols.append(c)
+        if len(categories) < 2:
+            return None
+
+        counts = np.zeros((len(vocabulary), len(categories)), dtype=np.float64)
+        np.add.at(counts, (np.array(rows), np.array(cols)), 1.0)
+        totals = counts.sum(axis=0) + alpha * len(vocabulary)
+        # float32 يكفي للدقة ويقلل حجم الجدول (n-grams × الفئات) إلى النصف
+        log_likelihood = (np.log(counts + alpha) - np.log(totals)).astype(np.float32)
+        class_counts = np.bincount(label_ids, minlength=len(categories)).astype(np.float64)
+        log_prior = np.log(class_counts / class_counts.sum())
+        return cls(list(categories), vocabulary, log_prior, log_likelihood, ngram_range)
+
+    @classmethod
+    def from_listings(cls, listings: List[Dict], **kwargs) -> Optional["LocalClassifier"]:
+        """تدريب من عروض Atom (الفئة + اسم النطاق)"""
+        usable = [l for l in listings if l.get('domain') and l.get('category')]
+        return cls.fit((normalize_name(l['domain']) for l in usable), (l['category'] for l in usable), **kwargs)
+
+    def predict(self, domain: str) -> Tuple[str, float]:
+        """الفئة الأكثر احتمالاً + الثقة (0..1): الاحتمال البعدي مضروباً في نسبة التغطية إذا قلت عن الحد"""
+        # n-grams غير الموجودة في التدريب تُتجاهل (لا تحمل معلومة عن الفئة)
+        vocabulary = self.vocabulary
+        grams = char_ngrams(normalize_name(domain), self.ngram_range)
+        known = [vocabulary[g] for g in grams if g in vocabulary]
+        scores = self.log_prior
+        if known:
+            scores = scores + self.log_likelihood[known].sum(axis=0)
+        best = int(np.argmax(scores))
+        posterior = 1.0 / float(np.exp(scores - scores[best]).sum())
+        coverage = self.coverage(grams, best)
+        if coverage < self.min_coverage:
+            posterior *= coverage / self.min_coverage
+        return self.categories[best], posterior
+
+    def coverage(self, grams: List[str], category: int) -> float:
+        """نسبة n-grams الطويلة (3+ أحرف) في الاسم التي ظهرت في أسماء الفئة أثناء التدريب"""
+        long_grams = [g for g in grams if len(g) >= 3]
+        if not long_grams:
+            return 0.0
+        vocabulary, unseen = self.vocabulary, self._unseen[category]
+        hits = sum(1 for g in long_grams
+                   if g in vocabulary and self.log_likelihood[vocabulary[g], category] > unseen)
+        return hits / len(long_grams)
@@ -1,21 +1,43 @@
 # backend/main.py
 import json
 import os
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query, Request  # ← أضف Request هنا
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
 
 # استيراد المكونات المحلية
-from config_loader import get_settings
-from sales_loader import load_sales_from_google_sheets
-from atom_loader import load_atom_listings
-from appraisal_engine import AppraisalEngine, ATOM_CATEGORIES
-from ai_enhancer import AIEnhancer
+from config_loader import get_settings, settings_provider
+import sales_loader
+import atom_loader
+from data_sources import load_all
+from appraisal_engine import AppraisalEngine, ATOM_CATEGORIES, keyword_map_version
+from ai_enhancer import get_ai_enhancer, close_ai_enhancers
 from usage_tracker import usage_tracker  
+from model_registry import model_registry
+from classification_cache import classification_cache
+from deadline import Deadline
+from singleflight import AsyncSingleFlight
+from response_cache import ResponseCache
+from maintenance import maintenance_scheduler
+from appraisal_pool import AppraisalData, AppraisalPool
+from feature_store import FEATURE_STORE_DIR, FeatureStore, get_default_feature_store, set_default_feature_store
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """بدء التشغيل والإيقاف (بدل on_event المهمل)"""
+    await load_model_on_startup()
+    try:
+        yield
+    finally:
+        await close_clients_on_shutdown()
 
 # إنشاء التطبيق
-app = FastAPI(title="Domain Appraisal API")
+app = FastAPI(title="Domain Appraisal API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -26,11 +48,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# محرك التقييم مشترك على مستوى العملية (يُنشأ عند بدء التشغيل)
+engine: Optional[AppraisalEngine] = None
+# دمج تقييمات النطاق نفسه الجارية في نفس الوقت
+appraisal_flights = AsyncSingleFlight()
+# نتائج التقييم لجيل البيانات الحالي (يُنشأ عند بدء التشغيل حسب الإعدادات)
+response_cache = ResponseCache()
+# منفذ الجزء الحسابي من التقييم (inline/thread/process) لجيل البيانات الحالي
+appraisal_pool: Optional[AppraisalPool] = None
+_appraisal_pool_lock = threading.Lock()
+
+async def load_model_on_startup():
+    global engine, response_cache
+    try:
+        settings = get_settings()
+    except FileNotFoundError:
+        settings = {}
+    # backend النموذج (sklearn / flat / xgboost)؛ الافتراضي ما يسجله manifest.json
+    model_registry.backend = settings.get("model_backend")
+    model_registry.load()
+    # محدد الاستخدام: "memory" لكل عملية على حدة، "sqlite" مع عدة workers
+    usage_tracker.configure_limiter(settings.get("rate_limiter", "memory"))
+    # مخزن الميزات الدائم: بناء مصفوفات المبيعات/العروض يحسب النطاقات الجديدة فقط (مشترك مع التدريب)
+    if settings.get("feature_store_enabled", True):
+        set_default_feature_store(FeatureStore(settings.get("feature_store_path") or FEATURE_STORE_DIR))
+    engine = AppraisalEngine(registry=model_registry, classification_cache=classification_cache)
+    response_cache = ResponseCache(max_entries=settings.get("response_cache_max_entries", 4096),
+                                   spill_path=settings.get("response_cache_spill_path"))
+    # تسخين بيانات Sheets في الخلفية حتى لا ينتظرها أول طلب
+    threading.Thread(target=_warm_data_caches, name="data-warmup", daemon=True).start()
+    _schedule_maintenance(settings)
+
+async def close_clients_on_shutdown():
+    await close_ai_enhancers()
+    maintenance_scheduler.stop()
+    if appraisal_pool is not None:
+        appraisal_pool.shutdown()
+    # حفظ عدادات الاستخدام المعلقة في الذاكرة
+    try:
+        usage_tracker.flush()
+    except Exception as e:
+        print(f"⚠️ فشل حفظ عدادات الاستخدام عند الإيقاف: {e}")
+
+def _schedule_maintenance(settings: Dict[str, Any]):
+    """صيانة قواعد البيانات في الخلفية بدل تنفيذها داخل الطلبات"""
+    off_peak = settings.get("maintenance_off_peak_hours", [2, 6])
+    maintenance_scheduler.off_peak_hours = tuple(off_peak) if off_peak else None
+    retention_days = settings.get("usage_retention_days", 30)
+    maintenance_scheduler.add("usage_retention",
+                              lambda: usage_tracker.cleanup_old_records(days=retention_days),
+                              settings.get("maintenance_retention_interval_seconds", 3600), off_peak_only=True)
+    maintenance_scheduler.add("usage_analyze", usage_tracker.optimize,
+                              settings.get("maintenance_analyze_interval_seconds", 21600), initial_delay=300)
+    maintenance_scheduler.add("usage_vacuum", lambda: usage_tracker.optimize(vacuum=True),
+                              settings.get("maintenance_vacuum_interval_seconds", 86400), off_peak_only=True)
+    maintenance_scheduler.add("classification_cache_prune", classification_cache.prune,
+                              settings.get("maintenance_vacuum_interval_seconds", 86400), off_peak_only=True)
+    maintenance_scheduler.start()
+
+def _data_generation() -> str:
+    """يتغير عند تبديل لقطة المبيعات أو Atom أو إعادة تحميل النموذج أو خريطة الكلمات أو الإعدادات"""
+    loaded = model_registry.get()
+    return "%d:%d:%s:%d:%d" % (sales_loader.get_cache().generation, atom_loader.get_cache().generation,
+                               loaded.version if loaded else "-", keyword_map_version(), settings_provider.version)
+
+def _pool_key(settings: Dict[str, Any]) -> tuple:
+    """ما يتطلب مجمعاً جديداً: طريقة التنفيذ والعمليات، والنموذج وخريطة الكلمات (تُحمّل داخل كل عملية)"""
+    loaded = model_registry.get()
+    return (settings.get("appraisal_executor", "thread"), settings.get("appraisal_workers"),
+            loaded.version if loaded else "-", keyword_map_version())
+
+def _snapshot_generation() -> str:
+    return "%d:%d" % (sales_loader.get_cache().generation, atom_loader.get_cache().generation)
+
+def _current_appraisal_data() -> AppraisalData:
+    """المبيعات مع مصفوفتها، والعروض مع فهرسها، كل زوج من قراءة واحدة للقطة"""
+    sales_generation, sales_snapshot = sales_loader.get_cache().current()
+    atom_generation, atom_snapshot = atom_loader.get_cache().current()
+    sales, sales_matrix = sales_snapshot or ([], None)
+    atom_listings, atom_index = atom_snapshot or ([], None)
+    return AppraisalData("%d:%d" % (sales_generation, atom_generation), sales, atom_listings,
+                         sales_matrix, atom_index)
+
+def _lease_appraisal_pool(settings: Dict[str, Any]) -> AppraisalPool:
+    """
+    حجز المجمع الحالي بعد التأكد من أنه على آخر لقطة بيانات.
+    تحديث المبيعات أو Atom يُحدّث بيانات المجمع نفسه؛ مجمع جديد فقط عند تغيّر _pool_key.
+    على المستدعي استدعاء release() عند الانتهاء؛ المجمع القديم يُغلق بعد آخر حجز عليه.
+    """
+    global appraisal_pool
+    key = _pool_key(settings)
+    pool = appraisal_pool
+    if (pool is not None and pool.key == key and pool.generation == _snapshot_generation()
+            and pool.acquire()):
+        return pool
+    with _appraisal_pool_lock:
+        pool = appraisal_pool
+        data = _current_appraisal_data()
+        if pool is None or pool.key != key:
+            pool = AppraisalPool(engine, data, mode=key[0], workers=key[1], key=key)
+            if pool.mode == "process":
+                threading.Thread(target=pool.warm_up, name="appraisal-pool-warmup", daemon=True).start()
+            previous, appraisal_pool = appraisal_pool, pool
+            if previous is not None:
+                # الطلبات الجارية على المجمع القديم تكتمل قبل إغلاق عملياته
+                previous.retire()
+        elif pool.generation != data.generation:
+            pool.update_data(data)
+        # المجمع الحالي لا يُستبدل إلا تحت نفس القفل، فالحجز هنا لا يفشل
+        pool.acquire()
+    return pool
+
+def _warm_data_caches():
+    try:
+        load_all(get_settings())
+    except Exception as e:
+        print(f"⚠️ فشل تسخين البيانات عند بدء التشغيل: {e}")
+
 # نموذج الطلب
 class AppraiseRequest(BaseModel):
     domain: str
     use_ai: bool = False
 
+class BatchAppraiseRequest(BaseModel):
+    domains: List[str]
+
 @app.post("/appraise")
 async def appraise_domain(request: Request, appraisal_request: AppraiseRequest):  # ← تغيير هنا
     try:
@@ -55,41 +197,16 @@ async def appraise_domain(request: Request, appraisal_request: AppraiseRequest):
         settings = get_settings()
         domain = appraisal_request.domain.lower().strip()  # ← تغيير هنا
 
-        # 1. تحميل المبيعات التاريخية
-        sales = load_sales_from_google_sheets(
-            spreadsheet_id=settings['google_sheets_spreadsheet_id'],
-            sheet_name=settings.get('google_sheets_sheet_name', 'Domains'),
-            cache_ttl=settings.get('sales_cache_ttl_seconds', 300)
-        )
-        if not sales:
-            raise HTTPException(status_code=500, detail="No historical sales data available")
-
-        # 2. تحميل عروض Atom
-        atom_listings = load_atom_listings(
-            spreadsheet_id=settings['atom_spreadsheet_id'],
-            sheet_name=settings.get('atom_sheet_name', 'Atom'),
-            cache_ttl=settings.get('atom_cache_ttl_seconds', 3600)
-        )
-
-        # 3. إعداد محرك الذكاء الاصطناعي (للاستخدام في التصنيف والرؤى)
-        ai_engine = None
-        ai_enabled = settings.get("ai_enabled", False) and bool(settings.get("ai_api_key"))
-        if ai_enabled:
-            ai_engine = AIEnhancer(api_key=settings["ai_api_key"], provider="deepseek")
-
-        # 4. تقييم النطاق (مع دعم Atom + تصنيف AI)
-        engine = AppraisalEngine()
-        result = engine.appraise(
-            domain=domain,
-            all_sales=sales,
-            atom_listings=atom_listings,
-            ai_engine=ai_engine  # قد يستخدمه للتصنيف
-        )
-
-        # 5. إضافة رؤية ذكية (AI Insight) إذا طُلب
-        ai_insight = ""
-        if appraisal_request.use_ai and ai_enabled:  # ← تغيير هنا
-            ai_insight = ai_engine.get_insight(result)
+        # نتيجة محفوظة لنفس جيل البيانات، وإلا تنتظر الطلبات المتطابقة الجارية تقييماً واحداً مشتركاً
+        use_ai = appraisal_request.use_ai
+        generation = _data_generation()
+        appraisal = await response_cache.aget([domain, use_ai], generation)
+        if appraisal is None:
+            appraisal = await appraisal_flights.do((domain, use_ai), lambda: _run_appraisal(domain, use_ai, settings))
+            # النتائج المتدهورة (نفاد الميزانية) لا تُحفظ
+            if not appraisal["degraded_reasons"]:
+                await response_cache.aput([domain, use_ai], generation, appraisal)
+        result = appraisal["result"]
 
         # 6. بناء الاستجابة النهائية
         response = {
@@ -100,7 +217,9 @@ async def appraise_domain(request: Request, appraisal_request: AppraiseRequest):
             "category": result.get("category", "Generic"),
             "comparables": result.get("comparables", []),
             "atom_listings": result.get("atom_listings", []),
-            "ai_insight": ai_insight,
+            "ai_insight": appraisal["ai_insight"],
+            "degraded": bool(appraisal["degraded_reasons"]),
+            "degraded_reasons": list(appraisal["degraded_reasons"]),
             "usage_info": {  # ← أضف هذا الجزء الجديد
                 "remaining_requests": usage_check["remaining"],
                 "daily_limit": 3,
@@ -115,6 +234,129 @@ async def appraise_domain(request: Request, appraisal_request: AppraiseRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Appraisal failed: {str(e)}")
 
+async def _run_appraisal(domain: str, use_ai: bool, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """تقييم نطاق واحد (الجزء المشترك بين الطلبات المتطابقة، بدون معلومات المستخدم)"""
+    # ميزانية زمنية للطلب كاملاً تُمرر إلى المحملات و AI
+    deadline = Deadline(settings.get("request_deadline_seconds", 10))
+
+    # 1+2. تحميل المبيعات التاريخية وعروض Atom (خارج حلقة الأحداث في حالة البدء البارد)
+    sales, atom_listings = await run_in_threadpool(load_all, settings, deadline)
+    if not sales:
+        if deadline.expired():
+            raise HTTPException(status_code=503, detail="Historical sales data is still loading, please retry")
+        raise HTTPException(status_code=500, detail="No historical sales data available")
+
+    # 3. إعداد محرك الذكاء الاصطناعي (مشترك بين الطلبات لإعادة استخدام الاتصالات)
+    ai_engine = None
+    ai_enabled = settings.get("ai_enabled", False) and bool(settings.get("ai_api_key"))
+    if ai_enabled:
+        ai_engine = get_ai_enhancer(api_key=settings["ai_api_key"], provider="deepseek")
+
+    # 4. التصنيف (قد يستدعي AI) بالتوازي مع الميزات ومماثلات المبيعات والنموذج،
+    #    ثم مماثلات Atom التي تحتاج الفئة
+    #    الحساب نفسه في المجمع (خارج حلقة الأحداث) على لقطة الجيل الحالي
+    pool = await run_in_threadpool(_lease_appraisal_pool, settings)
+    try:
+        classification = asyncio.create_task(engine.enhanced_classification_async(
+            domain, ai_engine, atom_index=pool.data.atom_index,  # فهرس Atom المقسم حسب الفئة + المصنف المحلي
+            min_confidence=settings.get("local_classifier_min_confidence"),
+            deadline=deadline
+        ))
+        try:
+            prepared = await pool.prepare(domain)
+        except BaseException:
+            classification.cancel()
+            raise
+        category = await classification
+        result = await pool.complete(prepared, category)
+    finally:
+        pool.release()
+
+    # 5. إضافة رؤية ذكية (AI Insight) إذا طُلب وبقي وقت في الميزانية
+    ai_insight = ""
+    if use_ai and ai_enabled:
+        if deadline.expired():
+            deadline.degrade("insight")
+        else:
+            ai_insight = await ai_engine.get_insight(result, deadline=deadline)
+
+    return {"result": result, "ai_insight": ai_insight, "degraded_reasons": deadline.degraded_reasons}
+
+@app.post("/appraise/batch")
+async def appraise_batch(request: Request, batch_request: BatchAppraiseRequest):
+    """تقييم محفظة نطاقات في طلب واحد (فحص حد استخدام واحد + predict واحد على كل النطاقات)"""
+    try:
+        client_ip = request.client.host
+        user_agent = request.headers.get("user-agent", "")
+
+        settings = get_settings()
+        max_domains = settings.get("batch_max_domains", 1000)
+        domains = [d.lower().strip() for d in batch_request.domains if d and d.strip()]
+        if not domains:
+            raise HTTPException(status_code=400, detail="No domains provided")
+        if len(domains) > max_domains:
+            raise HTTPException(status_code=400, detail=f"Too many domains (max {max_domains})")
+
+        usage_check = usage_tracker.can_make_request(client_ip, user_agent)
+        if not usage_check["allowed"]:
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "error": "DAILY_LIMIT_EXCEEDED",
+                    "message": usage_check["message"],
+                    "remaining": usage_check["remaining"],
+                    "reset_time": usage_check["reset_time"]
+                }
+            )
+
+        deadline = Deadline(settings.get("batch_deadline_seconds", 60))
+        sales, atom_listings = await run_in_threadpool(load_all, settings, deadline)
+        if not sales:
+            if deadline.expired():
+                raise HTTPException(status_code=503, detail="Historical sales data is still loading, please retry")
+            raise HTTPException(status_code=500, detail="No historical sales data available")
+
+        ai_engine = None
+        if settings.get("ai_enabled", False) and settings.get("ai_api_key"):
+            ai_engine = get_ai_enhancer(api_key=settings["ai_api_key"], provider="deepseek")
+
+        # النطاقات التي تحتاج AI تُصنف في دفعات (عشرات النطاقات لكل طلب، بتوازٍ محدود)
+        pool = await run_in_threadpool(_lease_appraisal_pool, settings)
+        try:
+            categories = await engine.enhanced_classifications_async(
+                domains, ai_engine, atom_index=pool.data.atom_index,
+                min_confidence=settings.get("local_classifier_min_confidence"),
+                deadline=deadline
+            )
+            results = await pool.appraise_many(domains, categories)
+        finally:
+            pool.release()
+
+        return {
+            "results": [{
+                "domain": result["domain"],
+                "estimated_price": result["estimated_price"],
+                "confidence": result["confidence"],
+                "reasons": result["reasons"],
+                "category": result.get("category", "Generic"),
+                "comparables": result.get("comparables", []),
+                "atom_listings": result.get("atom_listings", [])
+            } for result in results],
+            "count": len(results),
+            "degraded": deadline.degraded,
+            "degraded_reasons": deadline.degraded_reasons,
+            "usage_info": {
+                "remaining_requests": usage_check["remaining"],
+                "daily_limit": 3,
+                "message": usage_check["message"]
+            }
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Batch appraisal failed: {str(e)}")
+
 # ← أضف هذه ال endpoints الجديدة
 @app.get("/usage")
 async def get_usage_info(request: Request):
@@ -135,9 +377,22 @@ async def get_sales(page: int = Query(1, ge=1), size: int = Query(100, ge=1, le=
 
 @app.get("/health")
 async def health_check():
-    # تنظيف السجلات القديمة عند كل فحص صحة
-    usage_tracker.cleanup_old_records()
-    return {"status": "ok", "message": "Domain appraisal API is running"}
+    # بدون أي I/O: كل القيم من الذاكرة (التنظيف في maintenance_scheduler)
+    return {
+        "status": "ok",
+        "message": "Domain appraisal API is running",
+        "model": model_registry.info(),
+        "classification_cache": classification_cache.stats(),
+        "appraisal_coalescing": appraisal_flights.stats(),
+        "response_cache": response_cache.stats(),
+        "maintenance": maintenance_scheduler.stats(),
+        "appraisal_pool": appraisal_pool.stats() if appraisal_pool is not None else None,
+        "feature_store": dict(get_default_feature_store().stats) if get_default_feature_store() else None,
+        "data_refresh": {
+            "sales": sales_loader.get_refresh_metrics(),
+            "atom": atom_loader.get_refresh_metrics()
+        }
+    }
 
 # endpoint جديد لإعادة تعيين الحدود (للاستخدام الداخلي فقط)
 @app.post("/admin/reset-limits")
@@ -146,12 +401,6 @@ async def reset_limits(secret_key: str = Query(...)):
     if secret_key != "YOUR_SECRET_ADMIN_KEY":  # ← غيّر هذا إلى كود سري قوي
         raise HTTPException(status_code=403, detail="Forbidden")
     
-    # هذا مثال بسيط - يمكنك تطويره حسب الحاجة
-    import sqlite3
-    conn = sqlite3.connect("usage.db")
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM usage_records")
-    conn.commit()
-    conn.close()
+    usage_tracker.reset_all()
     
     return {"message": "All usage limits have been reset"}
\ No newline at end of file
@@ -0,0 +1,144 @@
+# backend/maintenance.py
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class MaintenanceTask:
+    """مهمة صيانة دورية مع توقيت آخر تشغيل"""
+
+    def __init__(self, name: str, fn: Callable[[], Any], interval_seconds: float, off_peak_only: bool = False):
+        self.name = name
+        self.fn = fn
+        self.interval_seconds = interval_seconds
+        self.off_peak_only = off_peak_only
+        self.next_run_at = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.running = False
+        self.last_run_at: Optional[float] = None
+        self.last_duration_seconds: Optional[float] = None
+        self.total_duration_seconds = 0.0
+        self.last_result: Any = None
+        self.last_error: Optional[str] = None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "off_peak_only": self.off_peak_only,
+            "runs": self.runs,
+            "failures": self.failures,
+            "running": self.running,
+            "last_run_at": datetime.fromtimestamp(self.last_run_at).isoformat() if self.last_run_at else None,
+            "last_duration_seconds": self.last_duration_seconds,
+            "total_duration_seconds": round(self.total_duration_seconds, 4),
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+class MaintenanceScheduler:
+    """
+    يشغّل مهام الصيانة (حذف السجلات القديمة، VACUUM/ANALYZE...) في thread خلفي.
+    المهام المعلّمة off_peak_only لا تعمل إلا داخل ساعات الهدوء [start, end) بالتوقيت المحلي.
+    stats() تقرأ من الذاكرة فقط فهي آمنة للاستخدام في /health.
+    """
+
+    def __init__(self, tick_seconds: float = 60, off_peak_hours: Optional[Tuple[int, int]] = (2, 6)):
+        self.tick_seconds = tick_seconds
+        self.off_peak_hours = tuple(off_peak_hours) if off_peak_hours else None
+        self._tasks: Dict[str, MaintenanceTask] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, fn: Callable[[], Any], interval_seconds: float, off_peak_only: bool = False,
+            initial_delay: float = 0) -> MaintenanceTask:
+        task = MaintenanceTask(name, fn, interval_seconds, off_peak_only)
+        task.next_run_at = time.time() + initial_delay
+        with self._lock:
+            self._tasks[name] = task
+        return task
+
+    def is_off_peak(self, now: Optional[float] = None) -> bool:
+        if self.off_peak_hours is None:
+            return True
+        start, end = self.off_peak_hours
+        hour = datetime.fromtimestamp(now if now is not None else time.time()).hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end  # نافذة تعبر منتصف الليل
+
+    def run_pending(self, now: Optional[float] = None) -> int:
+        """تشغيل المهام المستحقة؛ يعيد عدد المهام التي تم تشغيلها"""
+        now = now if now is not None else time.time()
+        off_peak = self.is_off_peak(now)
+        with self._lock:
+            due = [task for task in self._tasks.values()
+                   if now >= task.next_run_at and (off_peak or not task.off_peak_only)]
+        for task in due:
+            self._run(task, now)
+        return len(due)
+
+    def run(self, name: str) -> Any:
+        """تشغيل مهمة فوراً بغض النظر عن موعدها"""
+        with self._lock:
+            task = self._tasks[name]
+        self._run(task)
+        return task.last_result
+
+    def _run(self, task: MaintenanceTask, scheduled_at: Optional[float] = None) -> None:
+        with self._lock:
+            if task.running:
+                return
+            task.running = True
+        started = time.time()
+        try:
+            result = task.fn()
+            task.last_result = result
+            task.last_error = None
+            print(f"✅ صيانة {task.name}: {time.time() - started:.2f} ثانية ({result})")
+        except Exception as e:
+            task.failures += 1
+            task.last_error = str(e)
+            print(f"⚠️ فشلت مهمة الصيانة {task.name}: {e}")
+        finally:
+            duration = time.time() - started
+            with self._lock:
+                task.running = False
+                task.runs += 1
+                task.last_run_at = started
+                task.last_duration_seconds = round(duration, 4)
+                task.total_duration_seconds += duration
+                task.next_run_at = (scheduled_at or started) + task.interval_seconds
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.tick_seconds):
+            self.run_pending()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tasks = {name: task.info() for name, task in self._tasks.items()}
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "off_peak_hours": list(self.off_peak_hours) if self.off_peak_hours else None,
+            "tasks": tasks,
+        }
+
+
+# instance عالمي (تُسجّل المهام وتبدأ عند بدء التشغيل)
+maintenance_scheduler = MaintenanceScheduler()
@@ -0,0 +1,162 @@
+# backend/model_backends.py
+import os
+import json
+import pickle
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+
+from flat_forest import FlatForest
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FORMAT_VERSION = 1
+
+# ملفات كل backend داخل مجلد النموذج
+BACKEND_FILES = {
+    "sklearn": "domain_valuation_model.pkl",
+    "flat": "domain_valuation_model.flat.npz",
+    "xgboost": "domain_valuation_model.xgb.json",
+}
+
+
+def feature_schema_version(feature_names: List[str]) -> str:
+    """بصمة ترتيب وأسماء الميزات (أي تغيير يجعل النموذج غير متوافق)"""
+    return hashlib.sha256("\x1f".join(feature_names).encode("utf-8")).hexdigest()[:12]
+
+
+class ModelBackend:
+    """واجهة موحدة: predict على مصفوفة (n, n_features) بترتيب feature_names"""
+
+    name = "base"
+
+    def __init__(self, model: Any, feature_names: List[str]):
+        self.model = model
+        self.feature_names = list(feature_names)
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_names)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def memory_bytes(self) -> int:
+        """الحجم التقريبي للنموذج في الذاكرة"""
+        return len(pickle.dumps(self.model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class SklearnBackend(ModelBackend):
+    name = "sklearn"
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.model.predict(X)
+
+
+class FlatForestBackend(ModelBackend):
+    name = "flat"
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.model.predict(X)
+
+    @property
+    def flat(self) -> FlatForest:
+        return self.model
+
+    def memory_bytes(self) -> int:
+        flat = self.model
+        return sum(a.nbytes for a in (flat.feature, flat.threshold, flat.left, flat.right, flat.value, flat.roots))
+
+
+class XGBoostBackend(ModelBackend):
+    name = "xgboost"
+
+    def __init__(self, model: Any, feature_names: List[str]):
+        super().__init__(model, feature_names)
+        # طلب واحد = صفوف قليلة: thread واحد أسرع من توزيع العمل
+        model.set_param({"nthread": 1})
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        # inplace_predict بدون بناء DMatrix لكل استدعاء
+        return np.asarray(self.model.inplace_predict(np.asarray(X, dtype=np.float32)), dtype=np.float64)
+
+    def memory_bytes(self) -> int:
+        return len(self.model.save_raw("ubj"))
+
+
+def backend_for_model(model: Any, feature_names: List[str]) -> ModelBackend:
+    """backend لنموذج محمّل مباشرة (بدون manifest): الغابات تُسطح، وغير ذلك sklearn"""
+    estimators = getattr(model, "estimators_", None)
+    if estimators and all(hasattr(e, "tree_") for e in estimators):
+        try:
+            return FlatForestBackend(FlatForest.from_sklearn(model), feature_names)
+        except Exception as e:
+            print(f"⚠️ تعذر تسطيح النموذج (يُستخدم predict من sklearn): {e}")
+    return SklearnBackend(model, feature_names)
+
+
+def load_backend(model_dir: str, manifest: Dict[str, Any], name: Optional[str] = None) -> ModelBackend:
+    """تحميل backend من مجلد النموذج حسب manifest (أو الاسم المطلوب صراحة)"""
+    name = name or manifest.get("backend", "flat")
+    files = manifest.get("files", {})
+    if name not in files:
+        raise ValueError(f"Model backend '{name}' is not in the manifest (available: {sorted(files)})")
+    path = os.path.join(model_dir, files[name])
+    feature_names = list(manifest["feature_names"])
+    if manifest.get("feature_schema_version") != feature_schema_version(feature_names):
+        raise ValueError("Manifest feature schema version does not match its feature names")
+
+    if name == "sklearn":
+        backend = SklearnBackend(joblib.load(path), feature_names)
+        expected = getattr(backend.model, "n_features_in_", len(feature_names))
+    elif name == "flat":
+        flat = FlatForest.load(path)
+        if flat is None:
+            raise ValueError(f"Unsupported flat model format: {path}")
+        backend = FlatForestBackend(flat, feature_names)
+        expected = flat.n_features
+    elif name == "xgboost":
+        import xgboost as xgb
+        booster = xgb.Booster()
+        booster.load_model(path)
+        backend = XGBoostBackend(booster, feature_names)
+        expected = booster.num_features()
+    else:
+        raise ValueError(f"Unknown model backend: {name}")
+
+    if expected != len(feature_names):
+        raise ValueError(f"Model '{name}' expects {expected} features, manifest has {len(feature_names)}")
+    return backend
+
+
+def read_manifest(model_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(model_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != MANIFEST_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model manifest version: {manifest.get('format_version')}")
+    return manifest
+
+
+def write_manifest(model_dir: str, feature_names: List[str], backend: str, files: Dict[str, str],
+                   metrics: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, Any]:
+    """كتابة manifest ذرياً (يُكتب آخراً بعد ملفات النماذج)"""
+    manifest = {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "backend": backend,
+        "feature_names": list(feature_names),
+        "feature_schema_version": feature_schema_version(feature_names),
+        "files": files,
+        "metrics": metrics or {},
+        "trained_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    path = os.path.join(model_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return manifest
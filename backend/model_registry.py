@@ -0,0 +1,148 @@
+# backend/model_registry.py
+import os
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import joblib
+
+from flat_forest import FlatForest
+from model_backends import MANIFEST_NAME, ModelBackend, backend_for_model, load_backend, read_manifest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(BASE_DIR, "model", "domain_valuation_model.pkl")
+FEATURE_NAMES_PATH = os.path.join(BASE_DIR, "model", "feature_names.pkl")
+
+
+class LoadedModel(NamedTuple):
+    model: Any
+    feature_names: List[str]
+    version: str
+    loaded_at: str
+    file_stamp: tuple
+    flat: Optional[FlatForest] = None  # نسخة مسطحة من الغابة لاستدلال الصفوف القليلة
+    backend: Optional[ModelBackend] = None  # واجهة predict الموحدة (sklearn / flat / xgboost)
+
+
+class ModelRegistry:
+    """
+    سجل نموذج على مستوى العملية: يُحمّل النموذج مرة واحدة ويُشارك بين كل الطلبات،
+    ويُعاد تحميله تلقائياً (بتبديل ذري) عند تغيّر الملفات على القرص.
+    إذا وُجد manifest.json بجانب النموذج يُحمّل الـ backend المسجل فيه (أو backend المطلوب)،
+    وإلا يُحمّل ملف joblib مباشرة.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, feature_names_path: str = FEATURE_NAMES_PATH,
+                 check_interval: float = 5.0, backend: Optional[str] = None):
+        self.model_path = model_path
+        self.feature_names_path = feature_names_path
+        self.model_dir = os.path.dirname(model_path)
+        self.backend = backend
+        self.check_interval = check_interval
+        self._current: Optional[LoadedModel] = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            model_stat = os.stat(self.model_path)
+            names_stat = os.stat(self.feature_names_path)
+        except OSError:
+            return None
+        try:
+            manifest_stat = os.stat(os.path.join(self.model_dir, MANIFEST_NAME))
+            manifest_stamp = (manifest_stat.st_mtime_ns, manifest_stat.st_size)
+        except OSError:
+            manifest_stamp = None
+        return (model_stat.st_mtime_ns, model_stat.st_size, names_stat.st_mtime_ns, names_stat.st_size,
+                manifest_stamp, self.backend)
+
+    def _file_version(self, extra_paths: List[str]) -> str:
+        digest = hashlib.sha256()
+        for path in [self.model_path, self.feature_names_path] + extra_paths:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()[:12]
+
+    def load(self) -> bool:
+        """تحميل (أو إعادة تحميل) النموذج من القرص. عند الفشل يبقى النموذج الحالي كما هو."""
+        with self._reload_lock:
+            self._last_check = time.time()
+            stamp = self._file_stamp()
+            if stamp is None:
+                print("Warning: Model not found.")
+                return False
+            if self._current is not None and self._current.file_stamp == stamp:
+                return True
+            try:
+                manifest = read_manifest(self.model_dir)
+                if manifest is not None:
+                    backend = load_backend(self.model_dir, manifest, self.backend)
+                    extra = [os.path.join(self.model_dir, MANIFEST_NAME),
+                             os.path.join(self.model_dir, manifest["files"][backend.name])]
+                else:
+                    backend = backend_for_model(joblib.load(self.model_path), joblib.load(self.feature_names_path))
+                    extra = []
+                model, feature_names = backend.model, backend.feature_names
+                version = self._file_version(extra)
+            except Exception as e:
+                print(f"⚠️ فشل تحميل النموذج (يبقى الإصدار الحالي): {e}")
+                return False
+            # تبديل ذري: الطلبات الجارية تحتفظ بالمرجع القديم
+            self._current = LoadedModel(
+                model=model,
+                feature_names=feature_names,
+                version=version,
+                loaded_at=datetime.now().isoformat(timespec="seconds"),
+                file_stamp=stamp,
+                flat=getattr(backend, "flat", None),
+                backend=backend,
+            )
+            print(f"✅ تم تحميل النموذج (الإصدار {version}، {backend.name})")
+            return True
+
+    def _check_for_changes(self) -> None:
+        stamp = self._file_stamp()
+        current = self._current
+        if stamp is not None and (current is None or current.file_stamp != stamp):
+            self.load()
+
+    def get(self) -> Optional[LoadedModel]:
+        """
+        النموذج الحالي دون أي عمل على القرص في خيط المستدعي (يُستدعى من حلقة الأحداث).
+        الفحص الدوري لتغيّر الملفات وإعادة التحميل يعملان في thread خلفي، والطلبات
+        تستمر على النموذج الحالي حتى يتم التبديل.
+        """
+        current = self._current
+        now = time.time()
+        if now - self._last_check >= self.check_interval and self._check_lock.acquire(blocking=False):
+            try:
+                if self._reload_thread is None or not self._reload_thread.is_alive():
+                    self._last_check = now
+                    self._reload_thread = threading.Thread(target=self._check_for_changes,
+                                                           name="model-reload", daemon=True)
+                    self._reload_thread.start()
+            finally:
+                self._check_lock.release()
+        return current
+
+    def ensure_loaded(self) -> Optional[LoadedModel]:
+        if self._current is None:
+            self.load()
+        return self._current
+
+    def info(self) -> Dict[str, Any]:
+        current = self._current
+        if current is None:
+            return {"loaded": False, "version": None, "loaded_at": None}
+        return {"loaded": True, "version": current.version, "loaded_at": current.loaded_at,
+                "backend": current.backend.name if current.backend else None}
+
+
+# instance عالمي مشترك بين كل الطلبات
+model_registry = ModelRegistry()
@@ -0,0 +1,200 @@
+# backend/rate_limiter.py
+import threading
+from contextlib import AbstractContextManager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+ConnectionFactory = Callable[[], AbstractContextManager]
+
+_UPSERT_HIT = '''
+    INSERT INTO usage_records (user_hash, date, request_count, last_request)
+    VALUES (?, ?, 1, ?)
+    ON CONFLICT(user_hash, date) DO UPDATE
+    SET request_count = request_count + 1, last_request = excluded.last_request
+    WHERE usage_records.request_count < ?
+    RETURNING request_count
+'''
+
+# الذاكرة هي المرجع: نكتب العداد كما هو (MAX يحمي من الكتابة فوق عداد أحدث)
+_UPSERT_FLUSH = '''
+    INSERT INTO usage_records (user_hash, date, request_count, last_request)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_hash, date) DO UPDATE
+    SET request_count = MAX(request_count, excluded.request_count), last_request = excluded.last_request
+'''
+
+
+class SQLiteLimiter:
+    """كل فحص هو UPSERT ذري في usage_records (صحيح عبر عدة عمليات/workers)"""
+
+    def __init__(self, connection: ConnectionFactory):
+        self._connection = connection
+
+    def hit(self, user_hash: str, day: str, limit: int, now: str) -> Optional[int]:
+        """زيادة العداد إذا كان تحت الحد؛ يعيد العداد الجديد أو None إذا تم الرفض"""
+        with self._connection() as conn:
+            row = conn.execute(_UPSERT_HIT, (user_hash, day, now, limit)).fetchone()
+        return row[0] if row else None
+
+    def usage(self, user_hash: str, day: str) -> Optional[Tuple[int, Optional[str]]]:
+        with self._connection() as conn:
+            return conn.execute('SELECT request_count, last_request FROM usage_records WHERE user_hash = ? AND date = ?',
+                                (user_hash, day)).fetchone()
+
+    def flush(self) -> int:
+        return 0
+
+    def forget_before(self, day: str) -> None:
+        pass
+
+    def reset(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _Shard:
+    __slots__ = ("lock", "counters", "dirty")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], List] = {}  # (user_hash, day) -> [count, last_request]
+        self.dirty: Set[Tuple[str, str]] = set()
+
+
+class ShardedMemoryLimiter:
+    """
+    عدادات في الذاكرة مقسمة على أقفال مستقلة (shards) بدون أي I/O في مسار الطلب.
+    التغييرات تُكتب إلى usage_records على دفعات كل flush_interval ثانية وعند الإغلاق،
+    وتُحمّل عدادات اليوم من قاعدة البيانات عند البدء.
+    مناسب لعملية واحدة؛ مع عدة workers استخدم SQLiteLimiter.
+    """
+
+    def __init__(self, connection: ConnectionFactory, shards: int = 16, flush_interval: float = 2.0):
+        self._connection = connection
+        self._shards = [_Shard() for _ in range(shards)]
+        self.flush_interval = flush_interval
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"flushes": 0, "rows_flushed": 0, "flush_errors": 0}
+        try:
+            self.load()
+        except Exception as e:
+            print(f"⚠️ تعذر تحميل عدادات الاستخدام من قاعدة البيانات: {e}")
+        if flush_interval and flush_interval > 0:
+            self._thread = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+            self._thread.start()
+
+    def _shard(self, key: Tuple[str, str]) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def load(self, day: Optional[str] = None) -> int:
+        """إعادة بناء عدادات اليوم من قاعدة البيانات"""
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        with self._connection() as conn:
+            rows = conn.execute('SELECT user_hash, date, request_count, last_request FROM usage_records WHERE date >= ?',
+                                (day,)).fetchall()
+        for user_hash, date, count, last_request in rows:
+            key = (user_hash, date)
+            shard = self._shard(key)
+            with shard.lock:
+                current = shard.counters.get(key)
+                if current is None or current[0] < count:
+                    shard.counters[key] = [count, last_request]
+        return len(rows)
+
+    def hit(self, user_hash: str, day: str, limit: int, now: str) -> Optional[int]:
+        key = (user_hash, day)
+        shard = self._shard(key)
+        with shard.lock:
+            counter = shard.counters.get(key)
+            if counter is None:
+                counter = shard.counters[key] = [0, None]
+            if counter[0] >= limit:
+                return None
+            counter[0] += 1
+            counter[1] = now
+            shard.dirty.add(key)
+            return counter[0]
+
+    def usage(self, user_hash: str, day: str) -> Optional[Tuple[int, Optional[str]]]:
+        key = (user_hash, day)
+        shard = self._shard(key)
+        with shard.lock:
+            counter = shard.counters.get(key)
+            return (counter[0], counter[1]) if counter else None
+
+    def flush(self) -> int:
+        """كتابة العدادات المتغيرة منذ آخر flush في معاملة واحدة"""
+        with self._flush_lock:
+            pending = []
+            for shard in self._shards:
+                with shard.lock:
+                    for key in shard.dirty:
+                        counter = shard.counters.get(key)
+                        if counter is not None:
+                            pending.append((key[0], key[1], counter[0], counter[1]))
+                    shard.dirty.clear()
+            if not pending:
+                return 0
+            try:
+                with self._connection() as conn:
+                    conn.execute("BEGIN")
+                    try:
+                        conn.executemany(_UPSERT_FLUSH, pending)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+            except Exception:
+                # إعادة تعليمها للمحاولة في الدورة القادمة
+                for user_hash, day, _, _ in pending:
+                    shard = self._shard((user_hash, day))
+                    with shard.lock:
+                        shard.dirty.add((user_hash, day))
+                self.stats["flush_errors"] += 1
+                raise
+            self.stats["flushes"] += 1
+            self.stats["rows_flushed"] += len(pending)
+            return len(pending)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.forget_before(datetime.now().strftime("%Y-%m-%d"))
+            except Exception as e:
+                print(f"⚠️ فشل حفظ عدادات الاستخدام: {e}")
+
+    def forget_before(self, day: str) -> None:
+        """إزالة عدادات الأيام السابقة من الذاكرة (بعد حفظها)"""
+        for shard in self._shards:
+            with shard.lock:
+                for key in [k for k in shard.counters if k[1] < day and k not in shard.dirty]:
+                    del shard.counters[key]
+
+    def reset(self) -> None:
+        # قفل الحفظ يمنع flush جارياً من إعادة كتابة عدادات بعد حذفها
+        with self._flush_lock:
+            for shard in self._shards:
+                with shard.lock:
+                    shard.counters.clear()
+                    shard.dirty.clear()
+
+    def close(self) -> None:
+        """إيقاف الحفظ الدوري مع حفظ أخير"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+
+def create_limiter(kind: str, connection: ConnectionFactory, **kwargs):
+    if kind == "sqlite":
+        return SQLiteLimiter(connection)
+    if kind == "memory":
+        return ShardedMemoryLimiter(connection, **kwargs)
+    raise ValueError(f"Unknown limiter backend: {kind}")
@@ -0,0 +1,190 @@
+# backend/response_cache.py
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResponseCache:
+    """
+    كاش نتائج التقييم: LRU محدود في الذاكرة + تسريب اختياري إلى SQLite للمدخلات المطرودة.
+    كل المدخلات تابعة لجيل بيانات واحد (لقطة المبيعات + لقطة Atom + إصدار النموذج)؛
+    عند تغير الجيل تُمسح كل المدخلات القديمة.
+    من حلقة الأحداث تُستخدم aget/aput: الذاكرة مباشرة، وقراءة/كتابة SQLite في threadpool.
+    """
+
+    def __init__(self, max_entries: int = 4096, spill_path: Optional[str] = None,
+                 max_spill_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.max_spill_entries = max_spill_entries
+        self.spill_path = None
+        if spill_path:
+            if not os.path.isabs(spill_path):
+                base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                spill_path = os.path.join(base_dir, spill_path)
+            self.spill_path = spill_path
+            self._init_spill()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._generation: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "spill_hits": 0, "misses": 0, "evictions": 0,
+                       "spilled": 0, "invalidations": 0}
+
+    def _init_spill(self):
+        try:
+            conn = sqlite3.connect(self.spill_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    generation TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"❌ خطأ في تهيئة ملف كاش النتائج: {e}")
+            self.spill_path = None
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return json.dumps(key) if not isinstance(key, str) else key
+
+    def _switch_generation(self, generation: str) -> bool:
+        """يجب استدعاؤها مع القفل؛ تعيد True إذا وجب مسح الأجيال القديمة من القرص"""
+        if self._generation == generation:
+            return False
+        if self._generation is not None:
+            self._stats["invalidations"] += 1
+        self._generation = generation
+        self._entries.clear()
+        return bool(self.spill_path)
+
+    def _purge_spill(self, generation: str) -> None:
+        try:
+            conn = sqlite3.connect(self.spill_path)
+            conn.execute('DELETE FROM responses WHERE generation != ?', (generation,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"⚠️ خطأ في تنظيف كاش النتائج: {e}")
+
+    def _lookup_memory(self, key: str, generation: str):
+        """(النتيجة من الذاكرة أو None، هل يلزم مسح القرص)"""
+        with self._lock:
+            purge = self._switch_generation(generation)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+            elif not self.spill_path:
+                self._stats["misses"] += 1
+            return entry, purge
+
+    def _lookup_spill(self, key: str, generation: str, purge: bool) -> Optional[Dict[str, Any]]:
+        if purge:
+            self._purge_spill(generation)
+        row = None
+        try:
+            conn = sqlite3.connect(self.spill_path)
+            row = conn.execute('SELECT payload FROM responses WHERE key = ? AND generation = ?',
+                               (key, generation)).fetchone()
+            conn.close()
+        except Exception as e:
+            print(f"⚠️ خطأ في قراءة كاش النتائج: {e}")
+
+        with self._lock:
+            if row is None or self._generation != generation:
+                self._stats["misses"] += 1
+                return None
+            self._stats["spill_hits"] += 1
+            entry = json.loads(row[0])
+            evicted = self._remember(key, entry)
+        self._spill(evicted, generation)
+        return entry
+
+    def get(self, key: Hashable, generation: str) -> Optional[Dict[str, Any]]:
+        """النتيجة المخزنة لنفس الجيل أو None (النتيجة مشتركة: لا تُعدل)"""
+        key = self._key(key)
+        entry, purge = self._lookup_memory(key, generation)
+        if entry is not None or not self.spill_path:
+            return entry
+        return self._lookup_spill(key, generation, purge)
+
+    async def aget(self, key: Hashable, generation: str) -> Optional[Dict[str, Any]]:
+        """مثل get، لكن الرجوع إلى SQLite يتم في threadpool"""
+        key = self._key(key)
+        entry, purge = self._lookup_memory(key, generation)
+        if entry is not None or not self.spill_path:
+            return entry
+        return await asyncio.to_thread(self._lookup_spill, key, generation, purge)
+
+    def _store(self, key: str, generation: str, value: Dict[str, Any]):
+        with self._lock:
+            purge = self._switch_generation(generation)
+            return self._remember(key, value), purge
+
+    def _write_spill(self, evicted: list, generation: str, purge: bool) -> None:
+        if purge:
+            self._purge_spill(generation)
+        self._spill(evicted, generation)
+
+    def put(self, key: Hashable, generation: str, value: Dict[str, Any]) -> None:
+        evicted, purge = self._store(self._key(key), generation, value)
+        self._write_spill(evicted, generation, purge)
+
+    async def aput(self, key: Hashable, generation: str, value: Dict[str, Any]) -> None:
+        """مثل put، لكن مسح الأجيال القديمة وتسريب المطرود إلى SQLite يتمان في threadpool"""
+        evicted, purge = self._store(self._key(key), generation, value)
+        if evicted and self.spill_path or purge:
+            await asyncio.to_thread(self._write_spill, evicted, generation, purge)
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> list:
+        """إضافة إلى LRU؛ يعيد المدخلات المطرودة (يجب استدعاؤها مع القفل)"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False))
+            self._stats["evictions"] += 1
+        return evicted
+
+    def _spill(self, evicted: list, generation: str) -> None:
+        if not evicted or not self.spill_path:
+            return
+        try:
+            rows = [(key, generation, json.dumps(value, default=_json_default)) for key, value in evicted]
+            conn = sqlite3.connect(self.spill_path)
+            conn.executemany('INSERT OR REPLACE INTO responses (key, generation, payload) VALUES (?, ?, ?)', rows)
+            conn.execute('''
+                DELETE FROM responses WHERE rowid IN (
+                    SELECT rowid FROM responses ORDER BY rowid DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_spill_entries,))
+            conn.commit()
+            conn.close()
+            with self._lock:
+                self._stats["spilled"] += len(rows)
+        except Exception as e:
+            print(f"⚠️ خطأ في تسريب كاش النتائج إلى القرص: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["generation"] = self._generation
+        hits = stats["memory_hits"] + stats["spill_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = round(hits / lookups, 4) if lookups else None
+        return stats
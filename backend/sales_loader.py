@@ -1,82 +1,236 @@
 import time
 import os
 import re
+import json
+import heapq
+import hashlib
 from typing import List, Dict, Optional
 from datetime import datetime
 
-# Google API
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+import sheets_client
+from snapshot_cache import SnapshotCache
+from deadline import Deadline
+from data_snapshot import load_snapshot, save_snapshot
 
-# متغيرات للتخزين المؤقت
-_cached_sales: Optional[List[Dict]] = None
-_cache_timestamp: float = 0
+# لقطة المبيعات: (قائمة المبيعات، FeatureMatrix) تُستبدل معاً بشكل ذري
+_sales_cache = SnapshotCache("sales")
+_disk_restore_attempted = False
 
-def load_sales_from_google_sheets(spreadsheet_id: str, sheet_name: str = "Sheet1", cache_ttl: int = 300) -> List[Dict]:
+# حالة المزامنة التزايدية: عدد الصفوف المتزامنة + بصمة آخر صف + بصمة المحتوى كاملاً
+_sync_state: Dict = {}
+
+# أعمدة اللقطة المحفوظة على القرص
+SALES_COLUMNS = {'domain': str, 'price': float, 'date': str, 'venue': str, 'source_text': str, 'source_url': str}
+
+# صيغة النطاق المقبولة (تُستخدم أيضاً للتحقق المتجه في training_pipeline)
+DOMAIN_PATTERN = r'^[a-z0-9]([a-z0-9-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9-]*[a-z0-9])?)*\.[a-z]{2,}$'
+
+def load_sales_from_google_sheets(spreadsheet_id: str, sheet_name: str = "Sheet1", cache_ttl: int = 300,
+                                  incremental: bool = True, full_sync_interval: int = 21600,
+                                  deadline: Optional[Deadline] = None) -> List[Dict]:
     """
     يحمل بيانات المبيعات من Google Sheets باستخدام Sheets API.
+    يعيد اللقطة الحالية فوراً، وعند انتهاء صلاحيتها يتم التحديث في الخلفية.
+    مع incremental=True يتم جلب الصفوف الجديدة فقط، وتحميل كامل عند تغير صفوف سابقة
+    أو كل full_sync_interval ثانية (للتحقق من التعديلات في منتصف الجدول).
+    مع deadline لا ينتظر البدء البارد أكثر من الوقت المتبقي (قد يعيد قائمة فارغة).
     """
-    global _cached_sales, _cache_timestamp
+    if _sales_cache.snapshot is None:
+        restore_from_disk(spreadsheet_id, sheet_name)
+    snapshot = _sales_cache.get(sales_fetcher(spreadsheet_id, sheet_name, incremental, full_sync_interval), cache_ttl,
+                                max_wait=deadline.remaining() if deadline else None)
+    return snapshot[0].copy() if snapshot else []
+
+def sales_fetcher(spreadsheet_id: str, sheet_name: str, incremental: bool = True, full_sync_interval: int = 21600):
+    """دالة التحديث التي تُمرر إلى SnapshotCache"""
+    return lambda: _fetch_sales_snapshot(spreadsheet_id, sheet_name, incremental, full_sync_interval)
+
+def next_sync_range(spreadsheet_id: str, sheet_name: str, incremental: bool = True,
+                    full_sync_interval: int = 21600) -> str:
+    """النطاق الذي سيطلبه التحديث القادم (للجلب المسبق المجمّع عبر batchGet)"""
+    if _can_sync_incrementally(spreadsheet_id, sheet_name, incremental, full_sync_interval):
+        return _incremental_range(sheet_name, _sync_state)
+    return _full_range(sheet_name)
+
+def _full_range(sheet_name: str) -> str:
+    return f"'{sheet_name}'!A:F"  # ← الآن نقرأ 6 أعمدة (A إلى F)
+
+def _incremental_range(sheet_name: str, state: Dict) -> str:
+    return f"'{sheet_name}'!A{state['row_count']}:F"
+
+def _can_sync_incrementally(spreadsheet_id: str, sheet_name: str, incremental: bool, full_sync_interval: int) -> bool:
+    return (incremental and _sales_cache.snapshot is not None
+            and _sync_state.get("source") == f"{spreadsheet_id}:{sheet_name}"
+            and time.time() - _sync_state.get("last_full_sync", 0) < full_sync_interval)
+
+def _fetch_sales_snapshot(spreadsheet_id: str, sheet_name: str, incremental: bool = False,
+                          full_sync_interval: int = 21600) -> tuple:
+    source = f"{spreadsheet_id}:{sheet_name}"
+    current = _sales_cache.snapshot
+    anchor_changed = False
+    if _can_sync_incrementally(spreadsheet_id, sheet_name, incremental, full_sync_interval):
+        synced = _fetch_incremental(spreadsheet_id, sheet_name, current, _sync_state)
+        if synced is not None:
+            return synced
+        anchor_changed = True
+
+    previous_hash = _sync_state.get("content_hash") if _sync_state.get("source") == source else None
+    sales, rows = _fetch_sales(spreadsheet_id, sheet_name, with_rows=True)
+    _sync_state.clear()
+    _sync_state.update(_new_sync_state(source, rows))
+    if previous_hash is not None and current is not None:
+        if _sync_state["content_hash"] == previous_hash:
+            # التحميل الكامل الدوري يطابق ما بنته المزامنة التزايدية: نفس اللقطة (لا يتغير جيل البيانات)
+            return current
+        if not anchor_changed:
+            print("ℹ️ التحميل الكامل الدوري وجد تعديلات في صفوف سابقة لم تلتقطها المزامنة التزايدية")
+    _save_to_disk(sales, spreadsheet_id, sheet_name)
+    return sales, _build_sales_matrix(sales)
+
+def _row_hash(row: List) -> str:
+    return hashlib.sha256(json.dumps(row, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _fold_content_hash(content_hash: str, rows: List[List]) -> str:
+    """بصمة متسلسلة للمحتوى: نفس النتيجة سواء أُضيفت الصفوف دفعة واحدة أو على عدة مزامنات"""
+    for row in rows:
+        content_hash = hashlib.sha256((content_hash + _row_hash(row)).encode()).hexdigest()
+    return content_hash
+
+def _new_sync_state(source: str, rows: List[List]) -> Dict:
+    return {
+        "source": source,
+        "row_count": len(rows),  # يشمل صف العناوين
+        "anchor_hash": _row_hash(rows[-1]),
+        "content_hash": _fold_content_hash("", rows),
+        "last_full_sync": time.time(),
+    }
+
+def _fetch_incremental(spreadsheet_id: str, sheet_name: str, current: tuple, state: Dict) -> Optional[tuple]:
+    """
+    جلب الصفوف الجديدة فقط (بدءاً من آخر صف متزامن كمرجع). يعيد None إذا تغيّر
+    الصف المرجعي (حذف/تعديل صفوف سابقة) ليتم التحميل الكامل.
+    """
+    values = sheets_client.get_values(spreadsheet_id, _incremental_range(sheet_name, state))
+    if not values or _row_hash(values[0]) != state["anchor_hash"]:
+        print("ℹ️ تغيرت صفوف سابقة في جدول المبيعات، سيتم التحميل الكامل")
+        return None
+
+    new_rows = values[1:]
+    if not new_rows:
+        return current
+
+    sales, matrix = current
+    new_sales = _parse_sales_rows([list(row) for row in new_rows])
+
+    state.update({
+        "row_count": state["row_count"] + len(new_rows),
+        "anchor_hash": _row_hash(new_rows[-1]),
+        "content_hash": _fold_content_hash(state["content_hash"], new_rows),
+    })
+    if not new_sales:
+        # صفوف غير صالحة فقط: نفس اللقطة (لا يتغير جيل البيانات)
+        return current
+    merged = _merge_sales(sales, matrix, new_sales)
+    _save_to_disk(merged[0], spreadsheet_id, sheet_name)
+    return merged
+
+def _merge_sales(sales: List[Dict], matrix, new_sales: List[Dict]) -> tuple:
+    """دمج المبيعات الجديدة في اللقطة المرتبة (نفس ترتيب الفرز الكامل المستقر)"""
+    if not new_sales:
+        return sales, matrix
+    new_sales.sort(key=lambda x: x['date'], reverse=True)
+    combined = sales + new_sales
+    # heapq.merge مستقر: عند تساوي التاريخ تأتي الصفوف الأقدم في الجدول أولاً
+    order = list(heapq.merge(range(len(sales)), range(len(sales), len(combined)),
+                             key=lambda i: combined[i]['date'], reverse=True))
+    merged_sales = [combined[i] for i in order]
+
+    new_matrix = _build_sales_matrix(new_sales)
+    if matrix is None or len(matrix) != len(sales) or len(new_matrix) != len(new_sales):
+        return merged_sales, _build_sales_matrix(merged_sales)
+    combined_matrix = matrix.concat(matrix, new_matrix)
+    if combined_matrix is None:
+        return merged_sales, _build_sales_matrix(merged_sales)
+    return merged_sales, combined_matrix.take(order)
+
+def restore_from_disk(spreadsheet_id: str, sheet_name: str) -> bool:
+    """بدء دافئ من آخر لقطة محفوظة؛ عمرها الحقيقي يُحترم فتُحدّث في الخلفية إذا كانت قديمة"""
+    global _disk_restore_attempted
+    if _disk_restore_attempted:
+        return False
+    _disk_restore_attempted = True
+    restored = load_snapshot("sales", SALES_COLUMNS, f"{spreadsheet_id}:{sheet_name}")
+    if not restored:
+        return False
+    sales, meta = restored
+    _sales_cache.set((sales, _build_sales_matrix(sales)), timestamp=meta["saved_at"])
+    print(f"✅ تم استرجاع {len(sales)} عملية بيع من اللقطة المحفوظة (الإصدار {meta['data_version']})")
+    return True
+
+def _save_to_disk(sales: List[Dict], spreadsheet_id: str, sheet_name: str) -> None:
+    try:
+        save_snapshot("sales", sales, SALES_COLUMNS, f"{spreadsheet_id}:{sheet_name}")
+    except Exception as e:
+        print(f"⚠️ تعذر حفظ لقطة المبيعات: {e}")
+
+def _fetch_sales(spreadsheet_id: str, sheet_name: str, with_rows: bool = False):
+    # قراءة البيانات
+    values = sheets_client.get_values(spreadsheet_id, _full_range(sheet_name))
     
-    current_time = time.time()
-    if _cached_sales is not None and (current_time - _cache_timestamp) < cache_ttl:
-        return _cached_sales.copy()
+    if not values:
+        raise ValueError("لا توجد بيانات في Google Sheets")
     
-    try:
-        # تحميل بيانات الاعتماد
-        creds_path = os.path.join(os.path.dirname(__file__), "..", "config", "credentials.json")
-        creds = Credentials.from_service_account_file(
-            creds_path, 
-            scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
-        )
-        service = build("sheets", "v4", credentials=creds)
-        
-        # قراءة البيانات
-        sheet = service.spreadsheets()
-        range_name = f"'{sheet_name}'!A:F"  # ← الآن نقرأ 6 أعمدة (A إلى F)
-        values_result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-        values = values_result.get("values", [])
-        
-        if not values:
-            raise ValueError("لا توجد بيانات في Google Sheets")
-        
-        # التحقق من العناوين
-        headers = values[0]
-        expected_headers = ["Domain", "Price", "Date", "Venue", "Source", "Source_Url"]
-        if headers != expected_headers:
-            raise ValueError(f"الأعمدة غير متوافقة. المتوقع: {expected_headers}")
-        
-        sales = []
-        for row in values[1:]:
-            if len(row) < 6:
-                # ملء القيم المفقودة بقيم افتراضية
-                row += [""] * (6 - len(row))
-            
-            domain = str(row[0]).strip().lower()
-            price = _parse_price(row[1])
-            date = _parse_date(row[2])
-            venue = str(row[3]).strip()
-            source_text = str(row[4]).strip() if row[4] else "Source"
-            source_url = str(row[5]).strip() if row[5] else ""
-            
-            if price and date and _is_valid_domain(domain):
-                sales.append({
-                    'domain': domain,
-                    'price': price,
-                    'date': date,
-                    'venue': venue,
-                    'source_text': source_text,
-                    'source_url': source_url
-                })
+    # التحقق من العناوين
+    headers = values[0]
+    expected_headers = ["Domain", "Price", "Date", "Venue", "Source", "Source_Url"]
+    if headers != expected_headers:
+        raise ValueError(f"الأعمدة غير متوافقة. المتوقع: {expected_headers}")
+    
+    rows = [list(row) for row in values]
+    sales = _parse_sales_rows(values[1:])
+    sales.sort(key=lambda x: x['date'], reverse=True)
+    return (sales, rows) if with_rows else sales
+
+def _parse_sales_rows(rows: List[List]) -> List[Dict]:
+    sales = []
+    for row in rows:
+        if len(row) < 6:
+            # ملء القيم المفقودة بقيم افتراضية
+            row += [""] * (6 - len(row))
         
-        sales.sort(key=lambda x: x['date'], reverse=True)
-        _cached_sales = sales
-        _cache_timestamp = current_time
-        return sales.copy()
+        domain = str(row[0]).strip().lower()
+        price = _parse_price(row[1])
+        date = _parse_date(row[2])
+        venue = str(row[3]).strip()
+        source_text = str(row[4]).strip() if row[4] else "Source"
+        source_url = str(row[5]).strip() if row[5] else ""
         
-    except Exception as e:
-        print(f"خطأ في تحميل المبيعات: {e}")
-        return _cached_sales or []
+        if price and date and _is_valid_domain(domain):
+            sales.append({
+                'domain': domain,
+                'price': price,
+                'date': date,
+                'venue': venue,
+                'source_text': source_text,
+                'source_url': source_url
+            })
+    return sales
+
+def get_sales_matrix():
+    """مصفوفة ميزات المبيعات المحملة حالياً (أو None إذا لم تُحمّل البيانات بعد)"""
+    snapshot = _sales_cache.snapshot
+    return snapshot[1] if snapshot else None
+
+def get_cache() -> SnapshotCache:
+    return _sales_cache
+
+def get_refresh_metrics() -> Dict:
+    """مقاييس التحديث: المدة، عدد مرات الفشل، عمر اللقطة"""
+    return _sales_cache.metrics()
+
+def _build_sales_matrix(sales: List[Dict]):
+    from appraisal_engine import AppraisalEngine
+    return AppraisalEngine(load_model=False).build_sales_matrix(sales)
 
 def get_latest_sales(page: int = 1, size: int = 10) -> Dict:
     from .config_loader import get_settings
@@ -105,7 +259,7 @@ def _is_valid_domain(domain: str) -> bool:
         return False
     if domain.startswith('-') or domain.endswith('-'):
         return False
-    if not re.match(r'^[a-z0-9]([a-z0-9-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9-]*[a-z0-9])?)*\.[a-z]{2,}$', domain):
+    if not re.match(DOMAIN_PATTERN, domain):
         return False
     return True
 
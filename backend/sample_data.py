@@ -0,0 +1,23 @@
+# backend/sample_data.py
+import random
+from typing import Dict, List
+
+from appraisal_engine import KEYWORD_CATEGORY_MAP
+
+
+def random_sales(count: int, seed: int = 7) -> List[Dict]:
+    """مبيعات اصطناعية ثابتة لنفس البذرة (للاختبارات وسكربتات القياس)"""
+    rng = random.Random(seed)
+    words = list(KEYWORD_CATEGORY_MAP) + ['zeta', 'nova', 'blue', 'x', 'prime', '24', 'go']
+    tlds = ['com', 'ai', 'io', 'net', 'org', 'xyz', 'de', 'co']
+    sales = []
+    for i in range(count):
+        name = ''.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.1:
+            name = name[:3] + '-' + name[3:]
+        sales.append({
+            'domain': f"{name}.{rng.choice(tlds)}",
+            'price': float(rng.randint(100, 50000)),
+            'venue': rng.choice(['GoDaddy', 'Sedo', 'Afternic']),
+        })
+    return sales
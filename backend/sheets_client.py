@@ -0,0 +1,121 @@
+# backend/sheets_client.py
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CREDENTIALS_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "credentials.json")
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+
+# القيم المجلوبة مسبقاً عبر batchGet تبقى صالحة لفترة قصيرة فقط
+PREFETCH_TTL_SECONDS = 60
+# اتصالات HTTP الخاملة المحتفظ بها لإعادة الاستخدام (التحديثات الخلفية تعمل في threads جديدة كل مرة)
+MAX_IDLE_HTTP = 4
+
+_lock = threading.Lock()
+_credentials = None
+_service = None
+_http_lock = threading.Lock()
+_idle_http: List = []
+_prefetch_lock = threading.Lock()
+_prefetched: Dict[Tuple[str, str], Tuple[List[List], float]] = {}
+
+
+def get_service():
+    """خدمة Sheets مشتركة: بيانات الاعتماد و discovery client يُبنيان مرة واحدة لكل عملية"""
+    global _credentials, _service
+    if _service is None:
+        with _lock:
+            if _service is None:
+                from google.oauth2.service_account import Credentials
+                from googleapiclient.discovery import build
+                _credentials = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=SCOPES)
+                _service = build("sheets", "v4", credentials=_credentials, cache_discovery=False)
+    return _service
+
+
+def _new_http(credentials):
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    return AuthorizedHttp(credentials, http=httplib2.Http(timeout=30))
+
+
+@contextmanager
+def _lease_http():
+    """
+    اتصال HTTP من مجمع مشترك صغير (httplib2 غير آمن بين الـ threads: كل اتصال يستخدمه thread واحد
+    في كل مرة) يُعاد إليه بعد الطلب فيبقى keep-alive بين التحديثات الخلفية المتتالية.
+    """
+    credentials = _credentials
+    if credentials is None:
+        yield None
+        return
+    with _http_lock:
+        http = None
+        while _idle_http and http is None:
+            candidate = _idle_http.pop()
+            if candidate.credentials is credentials:
+                http = candidate
+    if http is None:
+        http = _new_http(credentials)
+    # عند خطأ يُرفع الاستثناء هنا ولا يعود الاتصال (حالته غير معروفة) إلى المجمع
+    yield http
+    with _http_lock:
+        if len(_idle_http) < MAX_IDLE_HTTP and credentials is _credentials:
+            _idle_http.append(http)
+
+
+def _execute(request):
+    with _lease_http() as http:
+        return request.execute(http=http) if http is not None else request.execute()
+
+
+def get_values(spreadsheet_id: str, range_name: str) -> List[List]:
+    """قيم نطاق واحد (تُستخدم القيم المجلوبة مسبقاً إن وجدت)"""
+    with _prefetch_lock:
+        prefetched = _prefetched.pop((spreadsheet_id, range_name), None)
+    if prefetched is not None and time.time() - prefetched[1] < PREFETCH_TTL_SECONDS:
+        return prefetched[0]
+    service = get_service()
+    result = _execute(service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=range_name))
+    return result.get("values", [])
+
+
+def batch_get_values(spreadsheet_id: str, ranges: Sequence[str]) -> List[List[List]]:
+    """عدة نطاقات من نفس الجدول في طلب batchGet واحد"""
+    service = get_service()
+    result = _execute(service.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=list(ranges)))
+    value_ranges = result.get("valueRanges", [])
+    return [value_ranges[i].get("values", []) if i < len(value_ranges) else [] for i in range(len(ranges))]
+
+
+def prefetch(requests: Sequence[Tuple[str, str]]) -> int:
+    """
+    جلب عدة نطاقات مسبقاً: طلب batchGet واحد لكل جدول (spreadsheet).
+    الاستدعاءات اللاحقة لـ get_values لنفس النطاق تستخدم النتيجة بدون رحلة إضافية.
+    """
+    by_spreadsheet: Dict[str, List[str]] = {}
+    for spreadsheet_id, range_name in requests:
+        by_spreadsheet.setdefault(spreadsheet_id, []).append(range_name)
+    round_trips = 0
+    for spreadsheet_id, ranges in by_spreadsheet.items():
+        values = batch_get_values(spreadsheet_id, ranges)
+        round_trips += 1
+        now = time.time()
+        with _prefetch_lock:
+            for range_name, range_values in zip(ranges, values):
+                _prefetched[(spreadsheet_id, range_name)] = (range_values, now)
+    return round_trips
+
+
+def reset() -> None:
+    """إعادة تعيين العميل (مثلاً بعد تغيير ملف بيانات الاعتماد)"""
+    global _credentials, _service
+    with _lock:
+        _credentials = None
+        _service = None
+    with _http_lock:
+        _idle_http.clear()
+    with _prefetch_lock:
+        _prefetched.clear()
@@ -0,0 +1,38 @@
+# backend/singleflight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class AsyncSingleFlight:
+    """
+    دمج الطلبات المتطابقة الجارية: كل المستدعين بنفس المفتاح ينتظرون حساباً واحداً مشتركاً.
+    الحساب يعمل كـ task مستقلة، فإلغاء أحد المنتظرين (انقطاع العميل) لا يلغيه للبقية.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self._stats["executions"] += 1
+        else:
+            self._stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, done: asyncio.Future) -> None:
+        if self._inflight.get(key) is done:
+            del self._inflight[key]
+        # تعليم الاستثناء كمقروء حتى لو أُلغي كل المنتظرين
+        if not done.cancelled():
+            done.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "in_flight": len(self._inflight)}
@@ -0,0 +1,150 @@
+# backend/snapshot_cache.py
+import time
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class SnapshotCache:
+    """
+    لقطة بيانات بنمط stale-while-revalidate:
+    - تُعاد اللقطة الحالية فوراً دائماً (حتى لو انتهت صلاحيتها)
+    - عند انتهاء الصلاحية يبدأ تحديث واحد فقط في الخلفية
+    - التحميل المتزامن يحدث فقط عند عدم وجود أي لقطة (بدء بارد)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.snapshot: Any = None
+        self.timestamp: float = 0.0
+        self.generation = 0  # يزداد فقط عند تغيّر اللقطة فعلاً (جزء من جيل البيانات للكاش والمجمع)
+        self._sets = 0  # كل set (حتى بدون تغيير): لمعرفة أن تحديثاً آخر اكتمل أثناء الانتظار
+        self._refresh_lock = threading.Lock()
+        self._set_lock = threading.Lock()  # اللقطة والجيل يتغيران معاً (انظر current)
+        self._state_lock = threading.Lock()
+        self._refresh_done = threading.Condition(self._state_lock)
+        self._refreshing = False
+        self._metrics: Dict[str, Any] = {
+            "refreshes": 0,
+            "failures": 0,
+            "last_duration_seconds": None,
+            "total_duration_seconds": 0.0,
+            "last_success": None,
+            "last_error": None,
+        }
+
+    def is_stale(self, ttl: float) -> bool:
+        return time.time() - self.timestamp >= ttl
+
+    def get(self, fetch: Callable[[], Any], ttl: float, max_wait: Optional[float] = None) -> Any:
+        """
+        اللقطة الحالية؛ تحميل متزامن فقط إذا لم توجد لقطة بعد أو كان ttl <= 0.
+        مع max_wait يتم التحميل في الخلفية وانتظاره max_wait ثانية على الأكثر
+        (قد تعود None في البدء البارد، ويكمل التحميل للطلبات اللاحقة).
+        """
+        snapshot = self.snapshot
+        if snapshot is None or ttl <= 0:
+            if max_wait is None:
+                return self.refresh(fetch, force=ttl <= 0)
+            self.refresh_in_background(fetch)
+            self.wait_for_refresh(max_wait)
+            return self.snapshot
+        if self.is_stale(ttl):
+            self.refresh_in_background(fetch)
+        return snapshot
+
+    def set(self, snapshot: Any, timestamp: Optional[float] = None) -> None:
+        """تبديل ذري للقطة الحالية (نفس الكائن = تحديث بلا تغيير: يتجدد الوقت فقط)"""
+        with self._set_lock:
+            changed = snapshot is not self.snapshot
+            self.snapshot = snapshot
+            self.timestamp = time.time() if timestamp is None else timestamp
+            self._sets += 1
+            if changed:
+                self.generation += 1
+
+    def current(self) -> Tuple[int, Any]:
+        """(الجيل، اللقطة) من قراءة واحدة متسقة"""
+        with self._set_lock:
+            return self.generation, self.snapshot
+
+    def refresh(self, fetch: Callable[[], Any], force: bool = True) -> Any:
+        """تحديث متزامن (تحديث واحد فقط في نفس الوقت). عند الفشل تبقى اللقطة السابقة."""
+        sets = self._sets
+        with self._refresh_lock:
+            # إذا أنهى طلب آخر التحميل بينما كنا ننتظر، نستخدم نتيجته
+            if self.snapshot is not None and (self._sets != sets or not force):
+                return self.snapshot
+            self._run_fetch(fetch)
+        return self.snapshot
+
+    def refresh_in_background(self, fetch: Callable[[], Any]) -> bool:
+        """بدء تحديث في الخلفية إذا لم يكن هناك تحديث جارٍ"""
+        if not self.begin_refresh():
+            return False
+
+        def _worker():
+            try:
+                self.run_refresh(fetch)
+            finally:
+                self.end_refresh()
+
+        threading.Thread(target=_worker, name=f"{self.name}-refresh", daemon=True).start()
+        return True
+
+    def begin_refresh(self) -> bool:
+        """حجز التحديث الخلفي (False إذا كان هناك تحديث جارٍ بالفعل)"""
+        with self._state_lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            return True
+
+    def end_refresh(self) -> None:
+        with self._state_lock:
+            self._refreshing = False
+            self._refresh_done.notify_all()
+
+    def wait_for_refresh(self, timeout: float) -> bool:
+        """انتظار انتهاء التحديث الخلفي الجاري (False إذا انتهت المهلة قبله)"""
+        with self._state_lock:
+            return self._refresh_done.wait_for(lambda: not self._refreshing, timeout=timeout)
+
+    def run_refresh(self, fetch: Callable[[], Any]) -> None:
+        """تنفيذ تحديث محجوز مسبقاً عبر begin_refresh"""
+        with self._refresh_lock:
+            self._run_fetch(fetch)
+
+    def _run_fetch(self, fetch: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        try:
+            snapshot = fetch()
+        except Exception as e:
+            self._record(started, error=e)
+            print(f"❌ فشل تحديث {self.name}: {e}")
+            return
+        self.set(snapshot)
+        self._record(started)
+
+    def _record(self, started: float, error: Optional[Exception] = None) -> None:
+        duration = time.perf_counter() - started
+        self._metrics["refreshes"] += 1
+        self._metrics["last_duration_seconds"] = round(duration, 4)
+        self._metrics["total_duration_seconds"] += duration
+        if error is None:
+            self._metrics["last_success"] = time.time()
+        else:
+            self._metrics["failures"] += 1
+            self._metrics["last_error"] = str(error)
+
+    @property
+    def refreshing(self) -> bool:
+        return self._refreshing
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "total_duration_seconds": round(self._metrics["total_duration_seconds"], 4),
+            "generation": self.generation,
+            "age_seconds": round(time.time() - self.timestamp, 1) if self.snapshot is not None else None,
+            "refreshing": self._refreshing,
+        }
@@ -0,0 +1,284 @@
+# backend/test_ai_enhancer.py
+import os
+import sys
+import json
+import time
+import asyncio
+import re
+import threading
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from ai_enhancer import AIEnhancer
+from appraisal_engine import AppraisalEngine, ATOM_CATEGORIES, ATOM_CATEGORIES_VERSION
+from classification_cache import ClassificationCache
+from deadline import Deadline
+
+
+class StubChatServer:
+    """خادم محلي يحاكي واجهة chat/completions (رد ثابت أو دالة على نص الطلب)"""
+
+    def __init__(self, reply, delay=0.0, status=200):
+        self.reply, self.delay, self.status = reply, delay, status
+        self.requests = []
+        self.connections = set()
+        self.active = self.max_active = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append((self.path, self.headers["Authorization"], body))
+                stub.connections.add(self.client_address)
+                with stub._lock:
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.active -= 1
+                prompt = body["messages"][0]["content"]
+                content = stub.reply(prompt) if callable(stub.reply) else stub.reply
+                payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(reply, **kwargs):
+        servers.append(StubChatServer(reply, **kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_classify_and_insight_against_stub(stub):
+    server = stub(lambda prompt: '"Payment."' if "Choose the SINGLE" in prompt else "Great fintech name.")
+
+    async def run():
+        enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+        try:
+            category = await enhancer.classify_domain("zzqvex.com", ATOM_CATEGORIES)
+            insight = await enhancer.get_insight({"domain": "zzqvex.com", "category": category,
+                                                  "reasons": ["Short"], "atom_listings": []})
+            return category, insight
+        finally:
+            await enhancer.aclose()
+
+    assert asyncio.run(run()) == ("Payment", "Great fintech name.")
+    path, auth, body = server.requests[0]
+    assert path == "/v1/chat/completions" and auth == "Bearer sk-test"
+    assert body["model"] == "deepseek-chat" and body["temperature"] == 0.0
+    # نفس اتصال keep-alive للطلبين
+    assert len(server.connections) == 1
+
+
+def test_classify_fallbacks(stub):
+    partial = stub("Crypto")
+    unknown = stub("Underwater basket weaving")
+    failing = stub("Payment", status=500)
+
+    async def run():
+        results = []
+        for server in (partial, unknown, failing):
+            enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+            results.append(await enhancer.classify_domain("x.com", ATOM_CATEGORIES))
+            await enhancer.aclose()
+        results.append(await AIEnhancer("").classify_domain("x.com", ATOM_CATEGORIES))
+        return results
+
+    assert asyncio.run(run()) == ["Cryptocurrency, Blockchain", "Generic", "Generic", "Generic"]
+
+
+def test_classification_overlaps_with_appraisal_work(stub):
+    server = stub("Payment", delay=0.3)
+    engine = AppraisalEngine(load_model=False)
+    sales = [{"domain": "zzqshop.com", "price": 1200.0, "venue": "Sedo", "date": "2024-01-01"}]
+    listings = [{"domain": "zzqpay.io", "price": 900.0, "category": "Payment", "page_url": "u"}]
+
+    async def run():
+        enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+        try:
+            started = time.perf_counter()
+            classification = asyncio.create_task(engine.enhanced_classification_async("zzqvex.com", enhancer))
+
+            def slow_prepare():
+                time.sleep(0.3)
+                return engine.prepare_appraisal("zzqvex.com", sales)
+
+            prepared = await asyncio.to_thread(slow_prepare)
+            category = await classification
+            elapsed = time.perf_counter() - started
+            return engine.complete_appraisal(prepared, category, listings), elapsed
+        finally:
+            await enhancer.aclose()
+
+    result, elapsed = asyncio.run(run())
+    assert elapsed < 0.55
+    assert result == engine.appraise("zzqvex.com", sales, listings, category="Payment")
+    assert result["category"] == "Payment" and result["atom_listings"][0]["domain"] == "zzqpay.io"
+
+
+def _batch_domains(prompt):
+    return json.loads(re.search(r"Domains \(JSON array\): (\[.*?\])\n", prompt).group(1))
+
+
+def test_batch_classification_with_bounded_concurrency_and_retries(stub):
+    attempts = {}
+
+    def reply(prompt):
+        answers = {}
+        for domain in _batch_domains(prompt):
+            attempts[domain] = attempts.get(domain, 0) + 1
+            if domain == "flaky0.com" and attempts[domain] == 1:
+                continue  # مفقود في المحاولة الأولى
+            if domain == "never.com":
+                continue
+            answers[domain] = "crypto" if domain.startswith("coin") else "Payment."
+        return "```json\n" + json.dumps(answers) + "\n```"
+
+    server = stub(reply, delay=0.05)
+    domains = [f"flaky{i}.com" for i in range(50)] + ["coinz.io", "never.com", "flaky1.com"]
+
+    async def run():
+        enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+        try:
+            return await enhancer.classify_domains(domains, ATOM_CATEGORIES, batch_size=10,
+                                                   max_concurrency=2, max_retries=2)
+        finally:
+            await enhancer.aclose()
+
+    results = asyncio.run(run())
+    assert len(results) == 52
+    assert results["coinz.io"] == "Cryptocurrency, Blockchain"
+    assert results["flaky0.com"] == results["flaky49.com"] == "Payment"
+    assert results["never.com"] == "Generic"
+    # 6 دفعات ثم إعادة المفقودين فقط (flaky0 + never) ثم never مرة أخيرة
+    assert len(server.requests) == 8
+    assert attempts["flaky0.com"] == 2 and attempts["never.com"] == 3 and attempts["flaky1.com"] == 1
+    assert server.max_active <= 2
+    body = server.requests[0][2]
+    assert body["response_format"] == {"type": "json_object"}
+    assert body["messages"][0]["content"].count("- Payment") == 1
+
+
+def test_engine_batches_only_unresolved_domains(stub, tmp_path):
+    server = stub(lambda prompt: json.dumps({d: "Payment" for d in _batch_domains(prompt)}))
+    engine = AppraisalEngine(load_model=False, classification_cache=ClassificationCache(str(tmp_path / "c.db")))
+
+    async def run(domains):
+        enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+        try:
+            return await engine.enhanced_classifications_async(domains, enhancer)
+        finally:
+            await enhancer.aclose()
+
+    domains = ["cloudpay.com", "zzqvex.com", "qqxyz.io", "zzqvex.com"]
+    assert asyncio.run(run(domains)) == ["Tech, Internet, Software", "Payment", "Payment", "Payment"]
+    assert _batch_domains(server.requests[0][2]["messages"][0]["content"]) == ["zzqvex.com", "qqxyz.io"]
+    # المرة الثانية من الكاش: بدون أي طلب
+    assert asyncio.run(run(domains[1:3])) == ["Payment", "Payment"]
+    assert len(server.requests) == 1
+
+
+def test_deadline_bounds_ai_calls_and_flags_degraded(stub):
+    server = stub("Payment", delay=1.0)
+    engine = AppraisalEngine(load_model=False)
+
+    async def run():
+        enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+        try:
+            deadline = Deadline(0.2)
+            started = time.perf_counter()
+            category = await engine.enhanced_classification_async("zzqvex.com", enhancer, deadline=deadline)
+            insight = await enhancer.get_insight({"domain": "zzqvex.com", "reasons": []}, deadline=deadline)
+            batch = await enhancer.classify_domains(["a.com", "b.com"], ATOM_CATEGORIES, deadline=deadline)
+            return category, insight, batch, deadline, time.perf_counter() - started
+        finally:
+            await enhancer.aclose()
+
+    category, insight, batch, deadline, elapsed = asyncio.run(run())
+    assert elapsed < 0.6
+    assert (category, insight, batch) == ("Generic", "", {"a.com": "Generic", "b.com": "Generic"})
+    assert deadline.degraded and deadline.degraded_reasons == ["classification", "insight"]
+    # بعد نفاد الميزانية لا يُرسل أي طلب جديد
+    assert len(server.requests) == 1
+    assert not Deadline().expired() and Deadline().timeout(8) == 8
+
+
+def test_sync_appraise_with_async_enhancer_never_returns_a_coroutine(stub, tmp_path):
+    server = stub("Payment")
+    cache = ClassificationCache(str(tmp_path / "cache.db"))
+    engine = AppraisalEngine(load_model=False, classification_cache=cache)
+    enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)  # "coroutine was never awaited"
+        result = engine.appraise("zzqvex.com", [], [], ai_engine=enhancer)
+        many = engine.appraise_many(["zzqvex.com"], [], [], ai_engine=enhancer)
+    # المسار المتزامن لا يستدعي AI ولا يكتب شيئاً في الكاش
+    assert result["category"] == many[0]["category"] == "Generic"
+    assert server.requests == [] and cache.get("zzqvex.com", ATOM_CATEGORIES_VERSION) is None
+
+    # بعد تصنيف غير متزامن يستخدم المسار المتزامن النتيجة المخزنة
+    async def classify():
+        try:
+            return await engine.enhanced_classification_async("zzqvex.com", enhancer)
+        finally:
+            await enhancer.aclose()
+
+    assert asyncio.run(classify()) == "Payment"
+    assert engine.appraise("zzqvex.com", [], [], ai_engine=enhancer)["category"] == "Payment"
+
+
+def test_truncated_batch_answer_keeps_complete_entries(stub):
+    attempts = []
+    domains = [f"{'verylongbrandablename' * 2}{i}.com" for i in range(6)]
+
+    def reply(prompt):
+        batch = _batch_domains(prompt)
+        attempts.append(batch)
+        answer = json.dumps({d: "Tech, Internet, Software" for d in batch})
+        # الإجابة الأولى قُطعت في منتصف المدخل الرابع (نفاد max_tokens)
+        return answer[:answer.index(domains[3]) + 10] if len(attempts) == 1 else answer
+
+    server = stub(reply)
+
+    async def run():
+        enhancer = AIEnhancer("sk-test", base_url=server.base_url)
+        try:
+            return await enhancer.classify_domains(domains, ATOM_CATEGORIES)
+        finally:
+            await enhancer.aclose()
+
+    results = asyncio.run(run())
+    assert results == {d: "Tech, Internet, Software" for d in domains}
+    # المدخلات المكتملة من الإجابة المقطوعة لا يُعاد طلبها
+    assert attempts == [domains, domains[3:]]
+    # الميزانية تتسع للإجابة الكاملة (بتقدير 3 أحرف لكل token)
+    first = server.requests[0][2]
+    full_answer = json.dumps({d: max(ATOM_CATEGORIES, key=len) for d in domains})
+    assert first["max_tokens"] * 3 >= len(full_answer)
@@ -0,0 +1,135 @@
+# backend/test_appraisal_engine.py
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from appraisal_engine import AppraisalEngine, KEYWORD_CATEGORY_MAP
+from sample_data import random_sales
+
+
+def _legacy_comparable_sales(engine, domain, all_sales, top_k=5):
+    """المرجع: حلقة المقارنة القديمة سجلاً بسجل"""
+    domain_features = engine.extract_features(domain)
+    domain_keywords = engine._extract_keywords(domain)
+    comparables = []
+    for sale in all_sales:
+        sale_features = engine.extract_features(sale['domain'])
+        basic_similarity = engine._calculate_similarity(domain_features, sale_features)
+        sale_keywords = engine._extract_keywords(sale['domain'])
+        keyword_similarity = engine._calculate_keyword_similarity(domain_keywords, sale_keywords)
+        total_similarity = (basic_similarity * 0.5) + (keyword_similarity * 0.5)
+        if total_similarity > 0.4:
+            comparables.append({
+                'domain': sale['domain'],
+                'price': sale['price'],
+                'similarity': total_similarity,
+                'venue': sale['venue'],
+                'keyword_match': keyword_similarity > 0.6
+            })
+    comparables.sort(key=lambda x: x['similarity'], reverse=True)
+    return comparables[:top_k]
+
+
+def test_vectorized_sales_match_legacy_scoring():
+    engine = AppraisalEngine(load_model=False)
+    sales = random_sales(400)
+    matrix = engine.build_sales_matrix(sales)
+    for query in ['cloudpay.com', 'aibot.io', 'zetanova.xyz', 'my-shop24.net', 'q.ai', 'healthcare.org']:
+        expected = _legacy_comparable_sales(engine, query, sales)
+        assert engine.find_comparable_sales_enhanced(query, sales, sales_matrix=matrix) == expected
+        assert engine.find_comparable_sales_enhanced(query, sales, top_k=50) == \
+            _legacy_comparable_sales(engine, query, sales, top_k=50)
+
+
+def test_sales_matrix_skips_incomplete_records():
+    engine = AppraisalEngine(load_model=False)
+    sales = [{'domain': 'cloud.com', 'price': 500.0}, {'domain': 'cloud.io', 'price': 900.0, 'venue': 'Sedo'}]
+    matrix = engine.build_sales_matrix(sales)
+    assert len(matrix) == 1
+    assert engine.find_comparable_sales_enhanced('cloud.com', [], sales_matrix=matrix)[0]['domain'] == 'cloud.io'
+
+
+def test_keyword_matcher_matches_substring_scan():
+    from appraisal_engine import HIGH_VALUE_KEYWORDS, get_keyword_matcher, reload_keyword_map
+
+    engine = AppraisalEngine(load_model=False)
+    for sale in random_sales(300, seed=11):
+        name = engine._split_domain(sale['domain'])[0].lower()
+        expected_keywords = [k for k in KEYWORD_CATEGORY_MAP if k in name]
+        expected_category = next((c for k, c in KEYWORD_CATEGORY_MAP.items() if k in name), None)
+        keywords, category, high_value = get_keyword_matcher().analyze(name)
+        assert keywords == expected_keywords
+        assert category == expected_category
+        assert high_value == sum(1 for kw in HIGH_VALUE_KEYWORDS if kw in name)
+
+    original = dict(KEYWORD_CATEGORY_MAP)
+    try:
+        reload_keyword_map({'zzq': 'Drone', **original})
+        assert engine.enhanced_classification('zzqcloud.com', use_ai=False) == 'Drone'
+    finally:
+        reload_keyword_map(original)
+    assert engine.enhanced_classification('zzqcloud.com', use_ai=False) == 'Tech, Internet, Software'
+
+    # نفس عدد الكلمات مع فئة مختلفة: المطابق وبصمة الميزات يتغيران أيضاً
+    schema = engine.feature_schema_version()
+    try:
+        reload_keyword_map({**original, 'cloud': 'Drone'})
+        assert engine.enhanced_classification('zzqcloud.com', use_ai=False) == 'Drone'
+        assert engine.feature_schema_version() != schema
+    finally:
+        reload_keyword_map(original)
+    assert engine.feature_schema_version() == schema
+
+    # التعديل المباشر ممنوع (كان يترك مطابقاً قديماً دون أن يلاحظه أحد)
+    with pytest.raises(TypeError):
+        KEYWORD_CATEGORY_MAP['cloud'] = 'Drone'
+
+
+def _legacy_comparable_listings(engine, domain, atom_listings, category, top_k=5):
+    """المرجع: البحث القديم في Atom عبر القائمة كاملة"""
+    domain_features = engine.extract_features(domain)
+    comparables = []
+    for listing in [l for l in atom_listings if l['category'] == category]:
+        similarity = engine._calculate_similarity(domain_features, engine.extract_features(listing['domain']))
+        if similarity > 0.4:
+            comparables.append({'domain': listing['domain'], 'price': listing['price'],
+                                'page_url': listing['page_url'], 'similarity': similarity,
+                                'category': listing['category'], 'match_type': 'same_category'})
+    if len(comparables) < 3:
+        relevant = {KEYWORD_CATEGORY_MAP[k] for k in engine._extract_keywords(domain)}
+        for listing in [l for l in atom_listings if l['category'] in relevant]:
+            if listing['category'] != category:
+                similarity = engine._calculate_similarity(domain_features, engine.extract_features(listing['domain']))
+                if similarity > 0.4:
+                    comparables.append({'domain': listing['domain'], 'price': listing['price'],
+                                        'page_url': listing['page_url'], 'similarity': similarity * 0.8,
+                                        'category': listing['category'], 'match_type': 'keyword_category'})
+    comparables.sort(key=lambda x: x['similarity'], reverse=True)
+    return comparables[:top_k]
+
+
+def test_atom_index_matches_full_scan():
+    engine = AppraisalEngine(load_model=False)
+    categories = ['Bots & AI', 'Payment', 'E-Commerce & Retail', 'Tech, Internet, Software', 'Drone']
+    listings = [dict(sale, category=categories[i % len(categories)], page_url=f"https://atom.com/{i}")
+                for i, sale in enumerate(random_sales(500, seed=3))]
+    index = engine.build_atom_index(listings)
+    for query, category in [('aipay.com', 'Bots & AI'), ('shopbot.io', 'Drone'), ('zzqx.net', 'Payment'),
+                            ('cloudshop.ai', 'Gaming'), ('paycoin.xyz', 'Payment')]:
+        for top_k in (3, 5, 40):
+            assert engine.find_comparable_listings_enhanced(query, listings, category, top_k, atom_index=index) == \
+                _legacy_comparable_listings(engine, query, listings, category, top_k)
+
+
+def test_appraise_many_matches_single_appraisals():
+    engine = AppraisalEngine(load_model=False)
+    sales = random_sales(300, seed=5)
+    listings = [dict(sale, category=['Bots & AI', 'Payment', 'Gaming'][i % 3], page_url=f"https://atom.com/{i}")
+                for i, sale in enumerate(random_sales(200, seed=9))]
+    matrix, index = engine.build_sales_matrix(sales), engine.build_atom_index(listings)
+    domains = ['aipay.com', 'gamebot.io', 'zzqx.net', 'cloudshop.ai', 'paycoin.xyz', 'aipay.com']
+    batch = engine.appraise_many(domains, sales, listings, sales_matrix=matrix, atom_index=index)
+    assert batch == [engine.appraise(d, sales, listings, sales_matrix=matrix, atom_index=index) for d in domains]
+    assert engine.appraise_many(domains, sales, listings) == batch
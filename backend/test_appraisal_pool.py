@@ -0,0 +1,127 @@
+# backend/test_appraisal_pool.py
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from appraisal_engine import AppraisalEngine, ATOM_CATEGORIES
+from appraisal_pool import AppraisalData, AppraisalPool
+from sample_data import random_sales
+
+
+def _data(engine, generation="g1"):
+    sales = random_sales(300)
+    listings = [{"domain": sale["domain"], "price": sale["price"], "page_url": "",
+                 "category": ATOM_CATEGORIES[i % len(ATOM_CATEGORIES)]} for i, sale in enumerate(random_sales(200, seed=3))]
+    return AppraisalData(generation, sales, listings, engine.build_sales_matrix(sales), engine.build_atom_index(listings))
+
+
+def test_every_executor_mode_matches_direct_appraisal():
+    engine = AppraisalEngine(load_model=False)
+    data = _data(engine)
+    domains = ["cloudpay.com", "aibot.io", "zetanova.xyz"]
+    categories = [engine.keyword_category(domain) or "Generic" for domain in domains]
+    expected = [engine.appraise(domain, data.sales, data.atom_listings, sales_matrix=data.sales_matrix,
+                                atom_index=data.atom_index, category=category)
+                for domain, category in zip(domains, categories)]
+
+    async def run(pool):
+        prepared = await asyncio.gather(*(pool.prepare(domain) for domain in domains))
+        single = [await pool.complete(p, c) for p, c in zip(prepared, categories)]
+        return single, await pool.appraise_many(domains, categories)
+
+    for mode in ("inline", "thread", "process"):
+        pool = AppraisalPool(engine, data, mode=mode, workers=2)
+        try:
+            pool.warm_up()
+            single, many = asyncio.run(run(pool))
+        finally:
+            pool.shutdown(wait=True)
+        assert single == expected, mode
+        assert many == expected, mode
+        stats = pool.stats()
+        assert stats["tasks"] == 7 and stats["failures"] == 0 and stats["generation"] == "g1"
+
+
+def _use_snapshots(monkeypatch, engine, sales, listings):
+    import main
+    import sales_loader
+    import atom_loader
+    from snapshot_cache import SnapshotCache
+    monkeypatch.setattr(sales_loader, "_sales_cache", SnapshotCache("sales"))
+    monkeypatch.setattr(atom_loader, "_atom_cache", SnapshotCache("atom"))
+    monkeypatch.setattr(main, "engine", engine)
+    monkeypatch.setattr(main, "appraisal_pool", None)
+    set_snapshots(engine, sales, listings)
+    return main
+
+
+def set_snapshots(engine, sales, listings):
+    import sales_loader
+    import atom_loader
+    sales_loader.get_cache().set((sales, engine.build_sales_matrix(sales)))
+    atom_loader.get_cache().set((listings, engine.build_atom_index(listings)))
+
+
+def test_pool_swap_between_prepare_and_complete_keeps_old_pool_alive(monkeypatch):
+    engine = AppraisalEngine(load_model=False)
+    data = _data(engine)
+    main = _use_snapshots(monkeypatch, engine, data.sales, data.atom_listings)
+    settings = {"appraisal_executor": "process", "appraisal_workers": 1}
+    category = engine.keyword_category("cloudpay.com") or "Generic"
+    expected = engine.appraise("cloudpay.com", data.sales, data.atom_listings, sales_matrix=data.sales_matrix,
+                               atom_index=data.atom_index, category=category)
+
+    async def run():
+        old = main._lease_appraisal_pool(settings)
+        prepared = await old.prepare("cloudpay.com")
+        # تغيّر الإعدادات أثناء انتظار التصنيف: طلب آخر يستبدل المجمع
+        new = main._lease_appraisal_pool({**settings, "appraisal_workers": 2})
+        assert new is not old and main.appraisal_pool is new and old.stats()["retired"]
+        try:
+            result = await old.complete(prepared, category)
+        finally:
+            old.release()
+        assert not old.acquire() and old.stats()["leases"] == 0
+        try:
+            return result, await new.complete(await new.prepare("cloudpay.com"), category)
+        finally:
+            new.release()
+
+    try:
+        old_result, new_result = asyncio.run(run())
+    finally:
+        main.appraisal_pool.shutdown(wait=True)
+    assert old_result == new_result == expected
+
+
+def test_data_refresh_updates_pool_in_place_without_respawning_workers(monkeypatch):
+    engine = AppraisalEngine(load_model=False)
+    data = _data(engine)
+    main = _use_snapshots(monkeypatch, engine, data.sales, data.atom_listings)
+    settings = {"appraisal_executor": "process", "appraisal_workers": 1}
+    category = engine.keyword_category("cloudpay.com") or "Generic"
+
+    async def appraise():
+        pool = main._lease_appraisal_pool(settings)
+        try:
+            return pool, await pool.complete(await pool.prepare("cloudpay.com"), category)
+        finally:
+            pool.release()
+
+    try:
+        pool, first = asyncio.run(appraise())
+        pids = set(pool._executor._processes)
+        # مزامنة جديدة للمبيعات: نفس المجمع ونفس العمليات، على اللقطة الجديدة
+        more_sales = data.sales + [{"domain": "cloudpays.com", "price": 99000.0, "venue": "Sedo"}]
+        set_snapshots(engine, more_sales, data.atom_listings)
+        same_pool, second = asyncio.run(appraise())
+        assert same_pool is pool and set(pool._executor._processes) == pids
+        assert pool.stats()["data_updates"] == 1 and pool.generation == main._snapshot_generation()
+        assert second == engine.appraise("cloudpay.com", more_sales, data.atom_listings, category=category)
+        assert second != first
+        # ملف اللقطة السابقة لا يبقى بعد انتهاء مهامه
+        assert os.listdir(pool._data_dir) == [os.path.basename(pool._data_file)]
+    finally:
+        main.appraisal_pool.shutdown(wait=True)
+    assert not os.path.exists(pool._data_dir)
@@ -0,0 +1,104 @@
+# backend/test_classification_cache.py
+import os
+import sys
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from classification_cache import ClassificationCache, normalize_name, categories_version
+from appraisal_engine import AppraisalEngine, ATOM_CATEGORIES, ATOM_CATEGORIES_VERSION
+
+
+class CountingAI:
+    def __init__(self, category="Payment"):
+        self.category = category
+        self.calls = 0
+
+    async def classify_domain(self, domain, categories):
+        self.calls += 1
+        return self.category
+
+
+def test_normalize_name_and_version():
+    assert normalize_name("Cloud.COM") == normalize_name("https://www.cloud.io/path") == "cloud"
+    assert categories_version(["A", "B"]) != categories_version(["A", "B", "C"])
+
+
+def test_memory_lru_disk_fallback_and_ttl(tmp_path):
+    path = str(tmp_path / "classifications.db")
+    cache = ClassificationCache(path, max_memory_entries=2)
+    cache.put("alpha.com", "v1", "Finance")
+    cache.put("beta.com", "v1", "Payment")
+    cache.put("gamma.com", "v1", "Drone")  # يطرد alpha من الذاكرة
+
+    assert cache.get("alpha.io", "v1") == "Finance"  # من القرص ثم يعود للذاكرة
+    assert cache.get("gamma.com", "v1") == "Drone"
+    assert cache.get("alpha.com", "v2") is None  # قائمة فئات مختلفة
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["memory_evictions"] == 2 and stats["memory_entries"] == 2
+
+    # إعادة التشغيل: المدخلات محفوظة على القرص
+    assert ClassificationCache(path).get("beta.com", "v1") == "Payment"
+
+    # انتهاء الصلاحية
+    expired = ClassificationCache(path, ttl_seconds=0)
+    assert expired.get("beta.com", "v1") is None and expired.stats()["expired"] == 1
+    assert expired.prune() == 3
+
+
+def test_disk_size_bound(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "c.db"), max_memory_entries=1, max_disk_entries=2)
+    for name in ("one", "two", "three"):
+        cache.put(f"{name}.com", "v1", "Finance")
+    assert cache.prune() == 1
+    assert cache.get("one.com", "v1") is None and cache.get("three.com", "v1") == "Finance"
+
+
+def test_engine_reuses_cached_ai_classification(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "c.db"))
+    engine = AppraisalEngine(load_model=False, classification_cache=cache)
+    ai = CountingAI()
+
+    async def classify(domain):
+        return await engine.enhanced_classification_async(domain, ai)
+
+    assert asyncio.run(classify("zzqvex.com")) == "Payment"
+    assert asyncio.run(classify("ZZQVEX.io")) == "Payment"
+    assert ai.calls == 1
+    assert cache.get("zzqvex.com", ATOM_CATEGORIES_VERSION) == "Payment"
+
+    # "Generic" (فشل أو عدم تطابق) لا يُخزن
+    generic = CountingAI("Generic")
+    assert asyncio.run(engine.enhanced_classification_async("qqxyz.com", generic)) == "Generic"
+    assert asyncio.run(engine.enhanced_classification_async("qqxyz.com", generic)) == "Generic"
+    assert generic.calls == 2
+    assert ATOM_CATEGORIES_VERSION == categories_version(ATOM_CATEGORIES)
+
+
+def test_async_lookups_read_sqlite_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "c.db")
+    ClassificationCache(path).put("alpha.com", "v1", "Finance")
+    cache = ClassificationCache(path)
+    threads = []
+    disk_get_many = cache._disk_get_many
+
+    def tracking(keys, now):
+        threads.append(threading.get_ident())
+        return disk_get_many(keys, now)
+
+    monkeypatch.setattr(cache, "_disk_get_many", tracking)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await cache.aput("beta.com", "v1", "Payment")
+        found = await cache.aget_many(["alpha.com", "ALPHA.io", "beta.com", "gamma.com"], "v1")
+        return loop_thread, found
+
+    loop_thread, found = asyncio.run(run())
+    assert found == {"alpha.com": "Finance", "ALPHA.io": "Finance", "beta.com": "Payment"}
+    # beta من الذاكرة؛ alpha و gamma في استعلام واحد خارج حلقة الأحداث
+    assert len(threads) == 1 and threads[0] != loop_thread
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert ClassificationCache(path).get("beta.com", "v1") == "Payment"
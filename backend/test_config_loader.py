@@ -0,0 +1,64 @@
+# backend/test_config_loader.py
+import os
+import sys
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import config_loader
+from config_loader import SettingsError, SettingsProvider, validate_settings
+
+
+def _write(path, settings, bom=False):
+    data = json.dumps(settings).encode("utf-8")
+    path.write_bytes((b"\xef\xbb\xbf" if bom else b"") + data)
+    # mtime بدقة أقل من ثانية قد لا يتغير بين كتابتين سريعتين
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_parses_once_and_swaps_on_change(tmp_path, monkeypatch):
+    path = tmp_path / "app_settings.json"
+    _write(path, {"ai_enabled": False, "sales_cache_ttl_seconds": 300, "maintenance_off_peak_hours": [2, 6]}, bom=True)
+    provider = SettingsProvider(str(path), check_interval=0)
+
+    parses = []
+    real_load = json.load
+    monkeypatch.setattr(config_loader.json, "load", lambda f: parses.append(1) or real_load(f))
+
+    first = provider.get()
+    assert provider.get() is first and len(parses) == 1 and provider.version == 1
+    assert first["maintenance_off_peak_hours"] == (2, 6)
+    with pytest.raises(TypeError):
+        first["ai_enabled"] = True
+
+    _write(path, {"ai_enabled": True, "sales_cache_ttl_seconds": 60})
+    second = provider.get()
+    assert second["ai_enabled"] is True and second["sales_cache_ttl_seconds"] == 60
+    assert provider.version == 2 and first["ai_enabled"] is False  # الطلبات الجارية تحتفظ بالقديم
+
+    # ملف غير صالح: تبقى الإعدادات الحالية ولا يُعاد تحليله في كل طلب
+    _write(path, {"ai_enabled": "yes"})
+    assert provider.get() is second
+    assert provider.get() is second
+    assert len(parses) == 3 and provider.version == 2
+
+
+def test_validation_and_missing_file(tmp_path):
+    with pytest.raises(SettingsError) as error:
+        validate_settings({"batch_max_domains": 0, "request_deadline_seconds": True,
+                           "local_classifier_min_confidence": 1.5, "appraisal_executor": "gpu",
+                           "rate_limiter": "redis"})
+    message = str(error.value)
+    for key in ("batch_max_domains", "request_deadline_seconds", "local_classifier_min_confidence",
+                "appraisal_executor", "rate_limiter"):
+        assert key in message
+    assert validate_settings({"custom_key": {"a": [1]}})["custom_key"]["a"] == (1,)
+
+    with pytest.raises(FileNotFoundError):
+        SettingsProvider(str(tmp_path / "missing.json")).get()
+    broken = tmp_path / "broken.json"
+    broken.write_text("{", encoding="utf-8")
+    with pytest.raises(SettingsError):
+        SettingsProvider(str(broken)).get()
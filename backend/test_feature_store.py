@@ -0,0 +1,114 @@
+# backend/test_feature_store.py
+import os
+import sys
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from appraisal_engine import AppraisalEngine, FeatureMatrix, KEYWORD_CATEGORY_MAP, reload_keyword_map
+from feature_store import FeatureStore
+from sample_data import random_sales
+from train_model import prepare_training_data
+
+
+def _assert_same_matrix(a: FeatureMatrix, b: FeatureMatrix):
+    assert a.records == b.records and a.vocabulary == b.vocabulary
+    np.testing.assert_array_equal(a.positions, b.positions)
+    np.testing.assert_array_equal(a.columns, b.columns)
+    np.testing.assert_array_equal(a.keyword_bits, b.keyword_bits)
+    np.testing.assert_array_equal(a.keyword_counts, b.keyword_counts)
+
+
+def test_store_matrix_matches_direct_and_computes_only_new_domains(tmp_path):
+    sales = random_sales(400) + [{'domain': None, 'price': 1.0, 'venue': 'Sedo'}, {'price': 5.0}]
+    direct = AppraisalEngine(load_model=False).build_sales_matrix(sales)
+
+    store = FeatureStore(str(tmp_path))
+    engine = AppraisalEngine(load_model=False, feature_store=store)
+    _assert_same_matrix(engine.build_sales_matrix(sales), direct)
+    first_computed = store.stats["computed"]
+    assert first_computed == len({s['domain'] for s in sales if isinstance(s.get('domain'), str)})
+
+    # مزامنة تزايدية: فقط النطاقات الجديدة تُحسب
+    more = sales + random_sales(50, seed=99)
+    _assert_same_matrix(engine.build_sales_matrix(more), AppraisalEngine(load_model=False).build_sales_matrix(more))
+    new_domains = {s['domain'] for s in more if isinstance(s.get('domain'), str)} - {
+        s['domain'] for s in sales if isinstance(s.get('domain'), str)}
+    assert store.stats["computed"] == first_computed + len(new_domains)
+
+    # عملية جديدة (مخزن جديد على نفس المجلد) تقرأ كل شيء من القرص
+    reopened = FeatureStore(str(tmp_path))
+    _assert_same_matrix(AppraisalEngine(load_model=False, feature_store=reopened).build_sales_matrix(more),
+                        engine.build_sales_matrix(more))
+    assert reopened.stats["computed"] == 0
+
+
+def test_keyword_map_change_uses_new_schema_segment(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    engine = AppraisalEngine(load_model=False, feature_store=store)
+    sales = random_sales(100)
+    engine.build_sales_matrix(sales)
+    before = engine.feature_schema_version()
+
+    original = dict(KEYWORD_CATEGORY_MAP)
+    try:
+        reload_keyword_map({**original, 'zeta': 'Technology'})
+        assert engine.feature_schema_version() != before
+        _assert_same_matrix(engine.build_sales_matrix(sales),
+                            AppraisalEngine(load_model=False).build_sales_matrix(sales))
+        assert sorted(os.listdir(tmp_path)) == sorted([before, engine.feature_schema_version()])
+    finally:
+        reload_keyword_map(original)
+
+
+def test_training_data_from_store_matches_direct(tmp_path):
+    sales = random_sales(300)
+    direct = prepare_training_data(sales)
+    stored = prepare_training_data(sales, feature_store=FeatureStore(str(tmp_path)))
+    assert list(stored.columns) == list(direct.columns)
+    pd.testing.assert_frame_equal(stored.reset_index(drop=True), direct.reset_index(drop=True).astype(float))
+
+
+def test_concurrent_appends_and_reads_stay_consistent(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    columns = ["a", "b"]
+
+    def compute(domains):
+        values = np.array([[len(d), sum(map(ord, d))] for d in domains], dtype=np.float64)
+        return values, np.zeros((len(domains), 1), dtype=np.uint8), np.ones(len(domains), dtype=bool)
+
+    batches = [[f"d{batch}-{i}.com" for i in range(20)] for batch in range(150)]
+    errors = []
+
+    def writer():
+        try:
+            for batch in batches:
+                store.get_or_compute(batch, "v1", columns, 1, compute)
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            for batch in batches:
+                # نطاقات قد تكون قيد الإضافة في الـ thread الآخر
+                domains = [d for b in batches[:batches.index(batch) + 1] for d in b[::3]]
+                values, _, valid = store.get_or_compute(domains, "v1", columns, 1, compute)
+                assert valid.all()
+                np.testing.assert_array_equal(values, compute(domains)[0])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # تبديل متكرر بين الـ threads لكشف الحالة غير المتسقة
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert len(store.segment("v1", columns, 1)) == sum(len(b) for b in batches)
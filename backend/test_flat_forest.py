@@ -0,0 +1,54 @@
+# backend/test_flat_forest.py
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from appraisal_engine import AppraisalEngine
+from flat_forest import FlatForest
+from model_registry import ModelRegistry
+from sample_data import random_sales
+from train_model import export_flat_forest, prepare_training_data
+
+
+def _train(sales):
+    df = prepare_training_data(sales)
+    X, y = df.drop('price', axis=1), df['price']
+    model = RandomForestRegressor(n_estimators=50, max_depth=12, min_samples_split=5, random_state=42)
+    return model.fit(X, y), list(X.columns)
+
+
+def test_flat_forest_matches_sklearn_on_held_out_sales(tmp_path):
+    sales = random_sales(1500)
+    model, feature_names = _train(sales[:1200])
+    held_out = prepare_training_data(sales[1200:])[feature_names]
+    expected = model.predict(held_out)
+
+    flat = export_flat_forest(model, held_out, expected)
+    np.testing.assert_allclose(flat.predict(held_out.to_numpy()), expected, rtol=1e-9)
+    # صف واحد (المسار الساخن في /appraise)
+    assert np.isclose(flat.predict(held_out.to_numpy()[0])[0], expected[0], rtol=1e-9)
+
+    path = str(tmp_path / "model.flat.npz")
+    flat.save(path)
+    loaded = FlatForest.load(path)
+    np.testing.assert_array_equal(loaded.predict(held_out.to_numpy()), flat.predict(held_out.to_numpy()))
+
+
+def test_engine_serves_prices_through_flat_forest(tmp_path):
+    sales = random_sales(600)
+    model, feature_names = _train(sales)
+    joblib.dump(model, tmp_path / "model.pkl")
+    joblib.dump(feature_names, tmp_path / "features.pkl")
+    registry = ModelRegistry(str(tmp_path / "model.pkl"), str(tmp_path / "features.pkl"))
+    assert registry.load() and registry.get().flat is not None
+
+    engine = AppraisalEngine(registry=registry)
+    domains = ["cloudpay.com", "aibot.io", "zetanova.xyz"]
+    features = [engine.extract_features(domain) for domain in domains]
+    X = np.array([[f.get(name, 0) for name in feature_names] for f in features], dtype=np.float64)
+    np.testing.assert_allclose(engine.predict_base_prices(features), model.predict(pd.DataFrame(X, columns=feature_names)), rtol=1e-9)
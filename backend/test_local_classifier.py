@@ -0,0 +1,91 @@
+# backend/test_local_classifier.py
+import os
+import sys
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from local_classifier import LocalClassifier, char_ngrams
+from appraisal_engine import AppraisalEngine
+
+LISTINGS = (
+    [{"domain": f"{name}.com", "price": 1000.0, "category": "Drone", "page_url": "u"}
+     for name in ("skydronez", "dronify", "droneva", "flydrona", "dronetix", "aerodronez")] +
+    [{"domain": f"{name}.com", "price": 1000.0, "category": "Pets", "page_url": "u"}
+     for name in ("pawsly", "pawzen", "purrpaws", "pawtopia", "kittypaw", "pawbuddy")] +
+    [{"domain": "oddname.com", "price": 1000.0, "category": "Not An Atom Category", "page_url": "u"}]
+)
+
+
+class CountingAI:
+    def __init__(self):
+        self.calls = 0
+
+    async def classify_domain(self, domain, categories):
+        self.calls += 1
+        return "Finance"
+
+
+def test_char_ngrams_and_prediction():
+    assert char_ngrams("ab") == ["^a", "ab", "b$", "^ab", "ab$", "^ab$"]
+    assert len(LocalClassifier.from_listings(LISTINGS)) == 3
+    # الفهرس يدرب المصنف على فئات Atom الرسمية فقط
+    classifier = AppraisalEngine(load_model=False).build_atom_index(LISTINGS).classifier
+    assert sorted(classifier.categories) == ["Drone", "Pets"]
+
+    category, confidence = classifier.predict("www.zendrone.io")
+    assert category == "Drone" and 0.5 < confidence <= 1.0
+    category, confidence = classifier.predict("pawzy.net")
+    assert category == "Pets" and confidence > 0.9
+    # اسم بدون أي n-gram معروفة: الاحتمال القبلي فقط (ثقة منخفضة)
+    assert classifier.predict("qqq.com")[1] < 0.6
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        classifier.predict("dronepaws.com")
+    assert (time.perf_counter() - started) / 1000 < 0.001
+
+    assert LocalClassifier.from_listings(LISTINGS[:3]) is None  # فئة واحدة لا تكفي
+
+
+def test_ai_called_only_below_confidence_threshold():
+    engine = AppraisalEngine(load_model=False)
+    atom_index = engine.build_atom_index(LISTINGS)
+    ai = CountingAI()
+
+    def classify(domain, min_confidence=None):
+        return asyncio.run(engine.enhanced_classification_async(domain, ai, atom_index=atom_index,
+                                                                min_confidence=min_confidence))
+
+    assert classify("pawzy.com") == "Pets" and ai.calls == 0
+    assert classify("qqq.com") == "Finance" and ai.calls == 1
+    assert classify("pawzy.com", min_confidence=1.01) == "Finance" and ai.calls == 2
+
+    # المسار المتزامن وappraise يستخدمان نفس المصنف
+    assert engine.enhanced_classification("pawzy.com", use_ai=False, atom_index=atom_index) == "Pets"
+    assert engine.appraise("pawzy.com", [], LISTINGS)["category"] == "Pets"
+    assert engine.enhanced_classification("pawzy.com", use_ai=False) == "Generic"
+
+
+def test_unrelated_names_fall_through_to_ai():
+    roots = {"Finance": ["pay", "cash", "fin", "coin", "bank", "fund", "loan", "credit"],
+             "Health": ["care", "med", "vita", "heal", "well", "clinic", "pharma", "doc"],
+             "Drone": ["drone", "fly", "aero", "sky", "hover", "copter", "pilot", "uav"]}
+    affixes = ["ly", "ify", "hub", "io", "zen", "go", "pro", "x", "nova", "ia", "base", "er"]
+    listings = [{"domain": (root + affix if (i + j) % 2 else affix + root) + ".com", "price": 1000.0,
+                 "category": category, "page_url": "u"}
+                for category, names in roots.items() for i, root in enumerate(names)
+                for j, affix in enumerate(affixes)]
+    engine = AppraisalEngine(load_model=False)
+    atom_index = engine.build_atom_index(listings)
+
+    # أسماء بلا علاقة بأي فئة: الاحتمال البعدي الخام لـ NB مرتفع لبعضها، لكن التغطية ضعيفة
+    for domain in ("garden.net", "bestshoes.com", "paradise.org", "techstar.com"):
+        assert engine.local_classification(domain, atom_index, 0.8) is None, domain
+    assert engine.local_classification("paywise.com", atom_index, 0.8) == "Finance"
+    assert engine.local_classification("droneworks.com", atom_index, 0.8) == "Drone"
+
+    ai = CountingAI()  # bestshoes لا تطابق أي كلمة مفتاحية: القرار بين المصنف المحلي و AI
+    assert asyncio.run(engine.enhanced_classification_async("bestshoes.com", ai, atom_index=atom_index,
+                                                            min_confidence=0.8)) == "Finance"
+    assert ai.calls == 1
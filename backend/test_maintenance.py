@@ -0,0 +1,64 @@
+# backend/test_maintenance.py
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from maintenance import MaintenanceScheduler
+from usage_tracker import UsageTracker
+
+
+def _at_hour(hour: int) -> float:
+    tomorrow = datetime.now() + timedelta(days=1)
+    return tomorrow.replace(hour=hour, minute=0, second=0, microsecond=0).timestamp()
+
+
+def test_off_peak_tasks_wait_for_window_and_record_timings():
+    calls = []
+    scheduler = MaintenanceScheduler(off_peak_hours=(2, 6))
+    scheduler.add("retention", lambda: calls.append("retention") or 7, 3600, off_peak_only=True)
+    scheduler.add("analyze", lambda: calls.append("analyze"), 3600)
+
+    assert scheduler.run_pending(now=_at_hour(12)) == 1
+    assert calls == ["analyze"]
+    assert scheduler.run_pending(now=_at_hour(3)) == 1  # analyze لم يحن موعده بعد (آخر تشغيل + ساعة)
+    assert calls == ["analyze", "retention"]
+
+    stats = scheduler.stats()["tasks"]["retention"]
+    assert stats["runs"] == 1 and stats["last_result"] == 7 and stats["last_duration_seconds"] >= 0
+
+    scheduler.add("broken", lambda: 1 / 0, 60)
+    scheduler.run("broken")
+    broken = scheduler.stats()["tasks"]["broken"]
+    assert broken["failures"] == 1 and "division" in broken["last_error"]
+    assert MaintenanceScheduler(off_peak_hours=(22, 4)).is_off_peak(_at_hour(1))
+
+
+def test_retention_deletes_in_batches_and_optimize(tmp_path):
+    tracker = UsageTracker(str(tmp_path / "usage.db"), flush_interval=0)
+    old_day = (datetime.now() - timedelta(days=40)).strftime("%Y-%m-%d")
+    today = datetime.now().strftime("%Y-%m-%d")
+    with tracker._connection() as conn:
+        conn.executemany('INSERT INTO usage_records (user_hash, date, request_count) VALUES (?, ?, 1)',
+                         [(f"user{i}", old_day) for i in range(25)] + [("fresh", today)])
+
+    assert tracker.cleanup_old_records(days=30, batch_size=10, pause_seconds=0) == 25
+    with tracker._connection() as conn:
+        assert conn.execute("SELECT user_hash FROM usage_records").fetchall() == [("fresh",)]
+    assert tracker.optimize(vacuum=True)["size_bytes"] > 0
+    tracker.close()
+
+
+def test_health_check_does_no_database_work(monkeypatch):
+    import main
+
+    def fail(*args, **kwargs):
+        raise AssertionError("health check touched the database")
+
+    monkeypatch.setattr(main.usage_tracker, "_connection", fail)
+    started = time.perf_counter()
+    health = asyncio.run(main.health_check())
+    assert health["status"] == "ok" and "maintenance" in health
+    assert time.perf_counter() - started < 0.05
@@ -0,0 +1,61 @@
+# backend/test_model_backends.py
+import os
+import sys
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from model_backends import MANIFEST_NAME, feature_schema_version, read_manifest
+from model_registry import ModelRegistry
+from sample_data import random_sales
+from train_model import _evaluate, export_flat_forest, prepare_training_data, save_models, train_xgboost
+
+
+def _train(tmp_path):
+    df = prepare_training_data(random_sales(800))
+    X, y = df.drop('price', axis=1), df['price']
+    model = RandomForestRegressor(n_estimators=30, max_depth=8, random_state=42).fit(X, y)
+    flat = export_flat_forest(model, X, model.predict(X))
+    booster = train_xgboost(X, y)
+    metrics = {"flat": _evaluate(y, model.predict(X)), "xgboost": _evaluate(y, booster.inplace_predict(X.to_numpy()))}
+    manifest = save_models(str(tmp_path), list(X.columns), model, flat, booster, metrics)
+    return X.to_numpy(dtype=np.float64), model, booster, manifest
+
+
+def test_registry_serves_every_backend_behind_one_interface(tmp_path):
+    X, model, booster, manifest = _train(tmp_path)
+    assert read_manifest(str(tmp_path)) == manifest
+    assert manifest["feature_schema_version"] == feature_schema_version(manifest["feature_names"])
+    assert manifest["backend"] in ("flat", "xgboost")
+
+    predictions = {}
+    for name in ("sklearn", "flat", "xgboost"):
+        registry = ModelRegistry(str(tmp_path / "domain_valuation_model.pkl"), str(tmp_path / "feature_names.pkl"),
+                                 backend=name)
+        assert registry.load() and registry.info()["backend"] == name
+        loaded = registry.get()
+        assert loaded.feature_names == manifest["feature_names"] and loaded.backend.memory_bytes() > 0
+        predictions[name] = loaded.backend.predict(X[:20])
+
+    np.testing.assert_allclose(predictions["flat"], predictions["sklearn"], rtol=1e-9)
+    np.testing.assert_allclose(predictions["xgboost"], booster.inplace_predict(X[:20]), rtol=1e-6)
+    assert ModelRegistry(str(tmp_path / "domain_valuation_model.pkl"),
+                         str(tmp_path / "feature_names.pkl")).load()  # الافتراضي من manifest
+
+
+def test_incompatible_manifest_keeps_current_model(tmp_path):
+    _train(tmp_path)
+    registry = ModelRegistry(str(tmp_path / "domain_valuation_model.pkl"), str(tmp_path / "feature_names.pkl"),
+                             check_interval=0)
+    assert registry.load()
+    first = registry.get()
+
+    path = tmp_path / MANIFEST_NAME
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    manifest["feature_names"] = manifest["feature_names"][:-1]
+    manifest["feature_schema_version"] = feature_schema_version(manifest["feature_names"])
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    assert not registry.load()
+    assert registry.get() is first
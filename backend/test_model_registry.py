@@ -0,0 +1,49 @@
+# backend/test_model_registry.py
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import joblib
+from sklearn.dummy import DummyRegressor
+
+from model_registry import ModelRegistry
+from appraisal_engine import AppraisalEngine
+
+
+def _save_model(tmp_path, constant):
+    model = DummyRegressor(strategy="constant", constant=constant).fit([[0]], [constant])
+    joblib.dump(model, tmp_path / "model.pkl")
+    joblib.dump(["length"], tmp_path / "features.pkl")
+
+
+def test_registry_shares_and_reloads_on_change(tmp_path):
+    _save_model(tmp_path, 1000.0)
+    registry = ModelRegistry(str(tmp_path / "model.pkl"), str(tmp_path / "features.pkl"), check_interval=0)
+    assert registry.load()
+    first = registry.get()
+    assert registry.info()["version"] == first.version
+
+    # نفس الملفات: لا إعادة تحميل
+    registry._reload_thread.join()
+    assert registry.get() is first
+    registry._reload_thread.join()
+    assert registry._current is first
+
+    _save_model(tmp_path, 2000.0)
+    os.utime(tmp_path / "model.pkl", ns=(first.file_stamp[0] + 10**9, first.file_stamp[0] + 10**9))
+    # get() لا يحمّل في خيط المستدعي: يعيد النموذج الحالي ويبدأ التحميل في الخلفية
+    assert registry.get() is first
+    registry._reload_thread.join()
+    second = registry.get()
+    assert second is not first
+    assert second.version != first.version
+
+    engine = AppraisalEngine(registry=registry)
+    assert engine.appraise("cloud.com", [], [])["estimated_price"] == 1400
+
+
+def test_missing_model_falls_back(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "none.pkl"), str(tmp_path / "none2.pkl"))
+    assert not registry.load()
+    assert registry.info()["loaded"] is False
+    assert AppraisalEngine(registry=registry).model is None
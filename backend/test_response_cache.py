@@ -0,0 +1,84 @@
+# backend/test_response_cache.py
+import os
+import sys
+import time
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from response_cache import ResponseCache
+
+
+def _appraisal(domain, price):
+    return {"result": {"domain": domain, "estimated_price": price, "confidence": np.float64(0.5)},
+            "ai_insight": "", "degraded_reasons": []}
+
+
+def test_lru_hits_and_generation_invalidation():
+    cache = ResponseCache(max_entries=2)
+    cache.put(["cloud.com", False], "g1", _appraisal("cloud.com", 100))
+    cache.put(["pay.io", False], "g1", _appraisal("pay.io", 200))
+    assert cache.get(["cloud.com", False], "g1")["result"]["estimated_price"] == 100
+    cache.put(["shop.ai", False], "g1", _appraisal("shop.ai", 300))  # يطرد pay.io (الأقل استخداماً)
+    assert cache.get(["pay.io", False], "g1") is None
+    assert cache.get(["cloud.com", True], "g1") is None  # use_ai جزء من المفتاح
+
+    # جيل بيانات جديد: كل المدخلات القديمة غير صالحة
+    assert cache.get(["cloud.com", False], "g2") is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["evictions"], stats["invalidations"]) == (1, 3, 1, 1)
+    assert stats["entries"] == 0 and stats["generation"] == "g2" and stats["hit_ratio"] == 0.25
+
+
+def test_memory_hits_are_sub_millisecond():
+    cache = ResponseCache()
+    cache.put(["cloud.com", False], "g1", _appraisal("cloud.com", 100))
+    started = time.perf_counter()
+    for _ in range(10000):
+        cache.get(["cloud.com", False], "g1")
+    assert (time.perf_counter() - started) / 10000 < 0.0001
+
+
+def test_evicted_entries_spill_to_disk(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(max_entries=1, spill_path=path, max_spill_entries=2)
+    for i, domain in enumerate(["a.com", "b.com", "c.com", "d.com"]):
+        cache.put([domain, False], "g1", _appraisal(domain, i))
+
+    spilled = cache.get(["b.com", False], "g1")
+    assert spilled["result"] == {"domain": "b.com", "estimated_price": 1, "confidence": 0.5}
+    assert cache.get(["a.com", False], "g1") is None  # تجاوز حد القرص
+    stats = cache.stats()
+    assert stats["spill_hits"] == 1 and stats["spilled"] >= 3
+
+    # تغير الجيل يمسح القرص أيضاً
+    assert cache.get(["b.com", False], "g2") is None
+    assert ResponseCache(spill_path=path).get(["c.com", False], "g1") is None
+
+
+def test_async_spill_io_runs_off_the_event_loop(tmp_path, monkeypatch):
+    cache = ResponseCache(max_entries=1, spill_path=str(tmp_path / "responses.db"))
+    threads = []
+    for name in ("_lookup_spill", "_write_spill"):
+        original = getattr(cache, name)
+
+        def tracking(*args, _original=original):
+            threads.append(threading.get_ident())
+            return _original(*args)
+        monkeypatch.setattr(cache, name, tracking)
+
+    async def run():
+        await cache.aput(["a.com", False], "g1", _appraisal("a.com", 1))  # أول جيل: مسح الأجيال السابقة من القرص
+        await cache.aput(["b.com", False], "g1", _appraisal("b.com", 2))  # يطرد a.com إلى القرص
+        hit = await cache.aget(["b.com", False], "g1")  # من الذاكرة: بدون threadpool
+        spilled = await cache.aget(["a.com", False], "g1")
+        return threading.get_ident(), hit, spilled
+
+    loop_thread, hit, spilled = asyncio.run(run())
+    assert hit["result"]["estimated_price"] == 2 and spilled["result"]["estimated_price"] == 1
+    # مسح القرص، تسريب a.com، ثم قراءته (التي تطرد b.com إلى القرص من نفس الـ thread)
+    assert len(threads) == 3 and loop_thread not in threads
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["spill_hits"], stats["misses"]) == (1, 1, 0)
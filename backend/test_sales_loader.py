@@ -0,0 +1,371 @@
+# backend/test_sales_loader.py
+import os
+import sys
+import re
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pytest
+
+import sales_loader
+import atom_loader
+import data_snapshot
+import data_sources
+import sheets_client
+from snapshot_cache import SnapshotCache
+from deadline import Deadline
+
+SALES_HEADERS = ["Domain", "Price", "Date", "Venue", "Source", "Source_Url"]
+
+
+class FakeSheetsService:
+    """بديل محلي لخدمة Google Sheets (spreadsheets().values().get().execute())"""
+
+    def __init__(self, values_by_range, delay=0.0):
+        self.values_by_range = values_by_range
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.fail = False
+        self.requested = []
+        self.batch_calls = 0
+        self._lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        self._range = range
+        self.requested.append(range)
+        return self
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.batch_calls += 1
+        return _FakeBatchRequest(self, ranges)
+
+    def execute(self, http=None):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError("sheets unavailable")
+            # نطاق جزئي مثل 'Domains'!A3:F يعيد الصفوف بدءاً من الصف 3
+            match = re.match(r"^(.*)!A(\d*):(\w+)$", self._range)
+            rows = self.values_by_range[f"{match.group(1)}!A:{match.group(3)}"]
+            start = int(match.group(2) or 1) - 1
+            result = [list(row) for row in rows[start:]]
+            return {"values": result} if result else {}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class _FakeBatchRequest:
+    def __init__(self, service, ranges):
+        self.service, self.ranges = service, ranges
+
+    def execute(self, http=None):
+        value_ranges = []
+        for range_name in self.ranges:
+            self.service.get(None, range_name)
+            value_ranges.append({"range": range_name, **self.service.execute()})
+        return {"valueRanges": value_ranges}
+
+
+def _use_fake(monkeypatch, fake):
+    monkeypatch.setattr(sheets_client, "get_service", lambda: fake)
+
+
+@pytest.fixture(autouse=True)
+def isolated_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(sales_loader, "_disk_restore_attempted", False)
+    monkeypatch.setattr(atom_loader, "_disk_restore_attempted", False)
+    monkeypatch.setattr(sales_loader, "_sync_state", {})
+    monkeypatch.setattr(sheets_client, "_prefetched", {})
+
+
+def _sales_rows(*domains):
+    return [SALES_HEADERS] + [[d, "$1,000", "2024-01-0%d" % (i + 1), "Sedo", "NameBio", ""]
+                              for i, d in enumerate(domains)]
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_stale_sales_served_immediately_and_refreshed_once(monkeypatch):
+    fake = FakeSheetsService({"'Domains'!A:F": _sales_rows("cloud.com", "pay.io")})
+    _use_fake(monkeypatch, fake)
+    cache = SnapshotCache("sales")
+    monkeypatch.setattr(sales_loader, "_sales_cache", cache)
+
+    # بدء بارد: تحميل متزامن
+    sales = sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60)
+    assert [s["domain"] for s in sales] == ["pay.io", "cloud.com"]
+    assert len(sales_loader.get_sales_matrix()) == 2
+
+    # بيانات قديمة: تُعاد فوراً ويبدأ تحديث واحد في الخلفية
+    fake.values_by_range["'Domains'!A:F"] = _sales_rows("cloud.com", "pay.io", "shop.ai")
+    fake.delay = 0.2
+    cache.timestamp -= 120
+    started = time.perf_counter()
+    results = [sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60) for _ in range(5)]
+    assert time.perf_counter() - started < 0.15
+    assert all(len(r) == 2 for r in results)
+
+    assert _wait_for(lambda: cache.generation == 2)
+    assert fake.calls == 2 and fake.max_active == 1
+    assert len(sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60)) == 3
+    metrics = sales_loader.get_refresh_metrics()
+    assert metrics["refreshes"] == 2 and metrics["failures"] == 0
+    assert metrics["last_duration_seconds"] >= 0.2
+
+
+def test_failed_refresh_keeps_snapshot_and_counts_failure(monkeypatch):
+    fake = FakeSheetsService({"'Atom'!A:D": [["Category", "Domain", "Price", "PageURL"],
+                                             ["Bots & AI", "aibot.com", "2500", "https://atom.com/aibot"]]})
+    _use_fake(monkeypatch, fake)
+    cache = SnapshotCache("atom")
+    monkeypatch.setattr(atom_loader, "_atom_cache", cache)
+
+    assert len(atom_loader.load_atom_listings("sheet", "Atom", cache_ttl=60)) == 1
+    fake.fail = True
+    cache.timestamp -= 120
+    assert len(atom_loader.load_atom_listings("sheet", "Atom", cache_ttl=60)) == 1
+    assert _wait_for(lambda: atom_loader.get_refresh_metrics()["failures"] == 1)
+    assert not cache.refreshing or _wait_for(lambda: not cache.refreshing)
+    assert atom_loader.get_atom_index().partition("Bots & AI").records[0]["domain"] == "aibot.com"
+
+
+def test_cold_start_failure_returns_empty(monkeypatch):
+    fake = FakeSheetsService({})
+    fake.fail = True
+    _use_fake(monkeypatch, fake)
+    monkeypatch.setattr(sales_loader, "_sales_cache", SnapshotCache("sales"))
+    assert sales_loader.load_sales_from_google_sheets("sheet", "Domains") == []
+    assert sales_loader.get_sales_matrix() is None
+
+
+def test_warm_start_from_disk_snapshot(monkeypatch):
+    fake = FakeSheetsService({"'Domains'!A:F": _sales_rows("cloud.com", "pay.io")})
+    _use_fake(monkeypatch, fake)
+    monkeypatch.setattr(sales_loader, "_sales_cache", SnapshotCache("sales"))
+    first = sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60)
+
+    # "إعادة تشغيل": كاش فارغ و Sheets غير متاح
+    fake.fail = True
+    cache = SnapshotCache("sales")
+    monkeypatch.setattr(sales_loader, "_sales_cache", cache)
+    monkeypatch.setattr(sales_loader, "_disk_restore_attempted", False)
+    assert sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60) == first
+    assert fake.calls == 1  # اللقطة حديثة: لا حاجة للتحديث
+
+    # لقطة قديمة: تُستخدم فوراً لكن يبدأ تحديث في الخلفية
+    cache.timestamp -= 120
+    assert sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60) == first
+    assert _wait_for(lambda: fake.calls == 2)
+
+    # لقطة من مصدر آخر لا يتم الوثوق بها
+    assert data_snapshot.load_snapshot("sales", sales_loader.SALES_COLUMNS, "other:Domains") is None
+
+
+def test_snapshot_strings_are_stored_as_utf8_bytes(tmp_path):
+    columns = {"domain": str, "price": float, "source_url": str}
+    records = [{"domain": f"d{i}.com", "price": float(i), "source_url": ""} for i in range(1000)]
+    records[0]["source_url"] = "https://example.com/" + "x" * 5000
+    records[1]["domain"] = "نطاق.com"
+    data_snapshot.save_snapshot("strings", records, columns, "src", snapshot_dir=str(tmp_path))
+
+    loaded, meta = data_snapshot.load_snapshot("strings", columns, "src", snapshot_dir=str(tmp_path))
+    assert loaded == records and meta["rows"] == 1000
+    # قيمة طويلة واحدة لا توسّع بقية الصفوف: حجم العمود = مجموع أطوال القيم
+    with np.load(data_snapshot.snapshot_path("strings", str(tmp_path)), allow_pickle=False) as data:
+        assert data["source_url__bytes"].dtype == np.uint8 and len(data["source_url__bytes"]) == 5020
+        assert data["source_url__offsets"][-1] == 5020
+
+
+def test_incremental_sync_fetches_only_new_rows(monkeypatch):
+    rows = _sales_rows("cloud.com", "pay.io", "shop.ai")
+    fake = FakeSheetsService({"'Domains'!A:F": rows})
+    ranges = fake.requested
+    _use_fake(monkeypatch, fake)
+    monkeypatch.setattr(sales_loader, "_sales_cache", SnapshotCache("sales"))
+
+    def refresh():
+        sales_loader._sales_cache.refresh(
+            lambda: sales_loader._fetch_sales_snapshot("sheet", "Domains", incremental=True))
+        return sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60)
+
+    assert len(refresh()) == 3
+    # صفوف جديدة (بعضها بنفس تاريخ صفوف قديمة) تُدمج بنفس ترتيب التحميل الكامل
+    rows += [["new.com", "$50", "2024-01-02", "Sedo", "", ""], ["bad", "1", "2024-01-09", "", "", ""],
+             ["late.io", "700", "01/05/2024", "Dan", "", ""]]
+    merged = refresh()
+    assert ranges[-1] == "'Domains'!A4:F"
+    assert merged == sales_loader._fetch_sales("sheet", "Domains")
+    matrix = sales_loader.get_sales_matrix()
+    assert [r["domain"] for r in matrix.records] == [s["domain"] for s in merged]
+    from appraisal_engine import AppraisalEngine
+    engine = AppraisalEngine(load_model=False)
+    assert engine.find_comparable_sales_enhanced("cloudshop.com", merged, top_k=10, sales_matrix=matrix) == \
+        engine.find_comparable_sales_enhanced("cloudshop.com", merged, top_k=10)
+
+    # لا صفوف جديدة (أو صفوف غير صالحة فقط): نفس اللقطة بدون إعادة بناء ولا جيل جديد
+    snapshot = sales_loader._sales_cache.snapshot
+    generation = sales_loader._sales_cache.generation
+    refresh()
+    assert sales_loader.get_sales_matrix() is snapshot[1]
+    rows.append(["", "", "", "", "", ""])
+    refresh()
+    assert sales_loader._sales_cache.snapshot is snapshot and sales_loader._sales_cache.generation == generation
+    assert ranges[-1] == "'Domains'!A7:F"
+
+    # حذف صف سابق يزيح الصف المرجعي: تحميل كامل
+    del rows[2]
+    refresh()
+    assert ranges[-1] == "'Domains'!A:F"
+    assert "pay.io" not in [s["domain"] for s in sales_loader.load_sales_from_google_sheets("sheet", "Domains")]
+
+    # التحميل الكامل الدوري بعد مزامنات تزايدية: نفس بصمة المحتوى، فلا لقطة جديدة ولا جيل جديد
+    def full_refresh():
+        sales_loader._sales_cache.refresh(
+            lambda: sales_loader._fetch_sales_snapshot("sheet", "Domains", incremental=True, full_sync_interval=0))
+
+    rows.append(["more.net", "$80", "2024-01-03", "Sedo", "", ""])
+    refresh()
+    assert ranges[-1] == "'Domains'!A7:F"
+    snapshot, generation = sales_loader._sales_cache.snapshot, sales_loader._sales_cache.generation
+    full_refresh()
+    assert ranges[-1] == "'Domains'!A:F"
+    assert sales_loader._sales_cache.snapshot is snapshot and sales_loader._sales_cache.generation == generation
+
+    # تعديل في منتصف الجدول يُلتقط بالتحميل الكامل الدوري
+    rows[1] = ["edited.com", "900", "2024-02-01", "Sedo", "", ""]
+    full_refresh()
+    assert ranges[-1] == "'Domains'!A:F"
+    assert sales_loader._sales_cache.generation != generation
+    assert "edited.com" in [s["domain"] for s in sales_loader.load_sales_from_google_sheets("sheet", "Domains")]
+
+
+def test_stale_sources_refresh_together_with_one_batch_get(monkeypatch):
+    fake = FakeSheetsService({
+        "'Domains'!A:F": _sales_rows("cloud.com", "pay.io"),
+        "'Atom'!A:D": [["Category", "Domain", "Price", "PageURL"], ["Payment", "paybot.com", "900", "u"]],
+    })
+    _use_fake(monkeypatch, fake)
+    monkeypatch.setattr(sales_loader, "_sales_cache", SnapshotCache("sales"))
+    monkeypatch.setattr(atom_loader, "_atom_cache", SnapshotCache("atom"))
+    settings = {"google_sheets_spreadsheet_id": "book", "atom_spreadsheet_id": "book"}
+
+    # بدء بارد: طلب batchGet واحد للمصدرين
+    sales, listings = data_sources.load_all(settings)
+    assert (len(sales), len(listings)) == (2, 1)
+    assert fake.batch_calls == 1 and fake.calls == 2
+
+    # انتهاء صلاحية المصدرين معاً: تحديث خلفي واحد مجمّع
+    fake.values_by_range["'Domains'!A:F"].append(["shop.ai", "500", "2024-03-01", "Sedo", "", ""])
+    sales_loader.get_cache().timestamp -= 10**6
+    atom_loader.get_cache().timestamp -= 10**6
+    sales, listings = data_sources.load_all(settings)
+    assert len(sales) == 2
+    assert _wait_for(lambda: len(sales_loader.load_sales_from_google_sheets("book", "Domains")) == 3)
+    assert _wait_for(lambda: not atom_loader.get_cache().refreshing)
+    assert fake.batch_calls == 2
+    assert fake.requested[-2:] == ["'Domains'!A3:F", "'Atom'!A:D"]
+
+
+def test_cold_start_waits_only_for_the_deadline(monkeypatch):
+    fake = FakeSheetsService({
+        "'Domains'!A:F": _sales_rows("cloud.com", "pay.io"),
+        "'Atom'!A:D": [["Category", "Domain", "Price", "PageURL"], ["Payment", "paybot.com", "900", "u"]],
+    }, delay=0.3)
+    _use_fake(monkeypatch, fake)
+    monkeypatch.setattr(sales_loader, "_sales_cache", SnapshotCache("sales"))
+    monkeypatch.setattr(atom_loader, "_atom_cache", SnapshotCache("atom"))
+    settings = {"google_sheets_spreadsheet_id": "book", "atom_spreadsheet_id": "book"}
+
+    deadline = Deadline(0.1)
+    started = time.perf_counter()
+    assert data_sources.load_all(settings, deadline) == ([], [])
+    assert time.perf_counter() - started < 0.25
+    assert deadline.degraded_reasons == ["data"]
+
+    # التحميل يكتمل في الخلفية ويستفيد منه الطلب التالي
+    assert _wait_for(lambda: not sales_loader.get_cache().refreshing)
+    deadline = Deadline(5)
+    sales, listings = data_sources.load_all(settings, deadline)
+    assert (len(sales), len(listings)) == (2, 1) and not deadline.degraded
+    assert fake.batch_calls == 1
+
+
+def test_concurrent_cold_loads_share_one_download(monkeypatch):
+    fake = FakeSheetsService({"'Domains'!A:F": _sales_rows("cloud.com", "pay.io")}, delay=0.1)
+    _use_fake(monkeypatch, fake)
+    monkeypatch.setattr(sales_loader, "_sales_cache", SnapshotCache("sales"))
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        sales_loader.load_sales_from_google_sheets("sheet", "Domains", cache_ttl=60))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 8 and all(len(r) == 2 for r in results)
+    assert fake.calls == 1
+
+
+def test_background_refresh_threads_reuse_pooled_http_connections(monkeypatch):
+    created, used = [], []
+
+    class FakeHttp:
+        def __init__(self, credentials):
+            self.credentials = credentials
+            created.append(self)
+
+    class FakeRequest:
+        def execute(self, http=None):
+            used.append(http)
+            return {"values": []}
+
+    credentials = object()
+    monkeypatch.setattr(sheets_client, "_credentials", credentials)
+    monkeypatch.setattr(sheets_client, "_idle_http", [])
+    monkeypatch.setattr(sheets_client, "_new_http", FakeHttp)
+
+    # كل تحديث خلفي في thread جديد: نفس الاتصال يُعاد استخدامه
+    for _ in range(5):
+        thread = threading.Thread(target=sheets_client._execute, args=(FakeRequest(),))
+        thread.start()
+        thread.join()
+    assert len(created) == 1 and all(http is created[0] for http in used)
+
+    # طلبات متزامنة لا تتشارك اتصالاً، والمجمع محدود
+    barrier = threading.Barrier(6)
+
+    class BlockingRequest(FakeRequest):
+        def execute(self, http=None):
+            barrier.wait(timeout=2)
+            return super().execute(http)
+
+    threads = [threading.Thread(target=sheets_client._execute, args=(BlockingRequest(),)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(http) for http in used[-6:]}) == 6
+    assert len(sheets_client._idle_http) == sheets_client.MAX_IDLE_HTTP
@@ -0,0 +1,58 @@
+# backend/test_singleflight.py
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from singleflight import AsyncSingleFlight
+
+
+def test_identical_keys_share_one_execution():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def appraise(domain):
+        calls.append(domain)
+        await asyncio.sleep(0.05)
+        return {"domain": domain, "estimated_price": len(calls)}
+
+    async def run():
+        results = await asyncio.gather(*(flights.do(d, lambda d=d: appraise(d))
+                                         for d in ["cloud.com"] * 5 + ["pay.io"] * 2))
+        # بعد الانتهاء يبدأ حساب جديد
+        again = await flights.do("cloud.com", lambda: appraise("cloud.com"))
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert calls == ["cloud.com", "pay.io", "cloud.com"]
+    assert all(r is results[0] for r in results[:5]) and results[5] is results[6]
+    assert again["estimated_price"] == 3
+    assert flights.stats() == {"executions": 3, "coalesced": 5, "in_flight": 0}
+
+
+def test_errors_are_shared_and_cancelled_waiter_does_not_cancel_others():
+    flights = AsyncSingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.02)
+        raise ValueError("sheets down")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        errors = await asyncio.gather(*(flights.do("bad", failing) for _ in range(3)), return_exceptions=True)
+        first = asyncio.ensure_future(flights.do("k", slow))
+        second = asyncio.ensure_future(flights.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return errors, await second, first
+
+    errors, result, first = asyncio.run(run())
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert result == "done" and first.cancelled()
+    with pytest.raises(asyncio.CancelledError):
+        first.result()
@@ -0,0 +1,60 @@
+# backend/test_training_pipeline.py
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from appraisal_engine import FEATURE_COLUMNS
+from model_backends import read_manifest
+from sales_loader import _is_valid_domain, _parse_price
+from sample_data import random_sales
+from train_model import fit_and_save, prepare_training_data
+from training_pipeline import StageTimer, load_training_arrays
+
+
+def _write_dump(path, count=600):
+    rows = [{"Domain": s["domain"].upper() if i % 7 == 0 else s["domain"], "Price": f"${s['price']:,.0f}",
+             "Venue": s["venue"]} for i, s in enumerate(random_sales(count))]
+    rows += [{"Domain": "not-a-domain", "Price": "100", "Venue": "Sedo"},
+             {"Domain": "free.com", "Price": "", "Venue": "Sedo"},
+             {"Domain": "comma.io", "Price": "1,5", "Venue": "Sedo"}]
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return rows
+
+
+def test_chunked_features_match_row_by_row_preparation(tmp_path):
+    path = str(tmp_path / "sales.csv")
+    rows = _write_dump(path)
+    # نفس قواعد التحقق في _parse_sales_rows
+    expected_sales = []
+    for row in rows:
+        domain, price = str(row["Domain"]).strip().lower(), _parse_price(row["Price"])
+        if price and _is_valid_domain(domain):
+            expected_sales.append({"domain": domain, "price": price})
+    expected = prepare_training_data(expected_sales)
+
+    for workers in (1, 2):
+        X, y, stats = load_training_arrays([path], chunk_rows=97, workers=workers)
+        assert stats["rows_read"] == len(rows) and stats["rows_valid"] == len(expected_sales)
+        np.testing.assert_array_equal(X, expected.drop("price", axis=1).to_numpy(dtype=np.float32))
+        np.testing.assert_array_equal(y, expected["price"].to_numpy())
+
+
+def test_max_rows_keeps_a_bounded_sample_and_trains(tmp_path):
+    path = str(tmp_path / "sales.csv")
+    _write_dump(path, count=1500)
+    X_all, y_all, _ = load_training_arrays([path], chunk_rows=200, workers=1)
+    X, y, stats = load_training_arrays([path], chunk_rows=200, workers=1, max_rows=500)
+    assert len(y) == 500 and stats["rows_valid"] == len(y_all)
+    # كل صف في العينة صف حقيقي من البيانات، والعينة ثابتة لنفس البذرة
+    all_rows = {tuple(r) + (p,) for r, p in zip(X_all.tolist(), y_all.tolist())}
+    assert all(tuple(r) + (p,) in all_rows for r, p in zip(X.tolist(), y.tolist()))
+    np.testing.assert_array_equal(load_training_arrays([path], chunk_rows=200, workers=1, max_rows=500)[0], X)
+
+    timer = StageTimer()
+    manifest = fit_and_save(X, y, list(FEATURE_COLUMNS), model_dir=str(tmp_path / "model"), timer=timer)
+    assert read_manifest(str(tmp_path / "model")) == manifest
+    assert {"split", "random_forest", "flat_export", "xgboost", "save"} <= set(timer.stages)
+    assert all(seconds >= 0 and peak > 0 for seconds, peak in timer.stages.values())
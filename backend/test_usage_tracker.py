@@ -0,0 +1,130 @@
+# backend/test_usage_tracker.py
+import os
+import sys
+import sqlite3
+import threading
+import time
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from usage_tracker import UsageTracker
+
+
+def test_limit_is_exact_under_concurrency(tmp_path):
+    tracker = UsageTracker(str(tmp_path / "usage.db"), pool_size=4)
+    results = []
+    barrier = threading.Barrier(20)
+
+    def hit():
+        barrier.wait()
+        results.append(tracker.can_make_request("1.2.3.4", "agent"))
+
+    threads = [threading.Thread(target=hit) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    allowed = [r for r in results if r["allowed"]]
+    assert len(allowed) == 3
+    assert sorted(r["remaining"] for r in allowed) == [0, 1, 2]
+    assert tracker.get_usage_stats("1.2.3.4", "agent")["today_usage"] == 3
+    assert tracker.can_make_request("5.6.7.8", "agent")["remaining"] == 2
+    tracker.close()
+
+
+def test_wal_mode_and_legacy_duplicates_migrated(tmp_path):
+    path = str(tmp_path / "usage.db")
+    today = datetime.now().strftime("%Y-%m-%d")
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE usage_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_hash TEXT NOT NULL, date TEXT NOT NULL,
+            request_count INTEGER DEFAULT 0, last_request TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_user_date ON usage_records(user_hash, date)')
+    user_hash = UsageTracker._get_user_hash(None, "1.2.3.4", "agent")
+    conn.executemany('INSERT INTO usage_records (user_hash, date, request_count) VALUES (?, ?, ?)',
+                     [(user_hash, today, 1), (user_hash, today, 2)])
+    conn.commit()
+    conn.close()
+
+    tracker = UsageTracker(path)
+    with tracker._connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT COUNT(*) FROM usage_records").fetchone()[0] == 1
+        indexes = {row[1]: row[2] for row in conn.execute("PRAGMA index_list('usage_records')")}
+    assert indexes.get("idx_user_date_unique") == 1 and "idx_user_date" not in indexes
+
+    assert tracker.can_make_request("1.2.3.4", "agent")["remaining"] == 0
+    assert not tracker.can_make_request("1.2.3.4", "agent")["allowed"]
+    tracker.reset_all()
+    assert tracker.get_usage_stats("1.2.3.4", "agent")["today_usage"] == 0
+    tracker.close()
+
+
+def test_sqlite_limiter_is_exact_under_concurrency(tmp_path):
+    tracker = UsageTracker(str(tmp_path / "usage.db"), pool_size=4, limiter="sqlite")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tracker.can_make_request("1.2.3.4", "agent")))
+               for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(r["allowed"] for r in results) == 3
+    tracker.close()
+
+
+def test_memory_counters_flush_in_batches_and_rebuild(tmp_path):
+    path = str(tmp_path / "usage.db")
+    tracker = UsageTracker(path, flush_interval=0)
+    for ip in ("1.1.1.1", "2.2.2.2", "2.2.2.2"):
+        tracker.can_make_request(ip, "agent")
+
+    # لا كتابة في مسار الطلب
+    with tracker._connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM usage_records").fetchone()[0] == 0
+    assert tracker.flush() == 2
+    assert tracker.flush() == 0
+    tracker.can_make_request("2.2.2.2", "agent")
+    tracker.close()  # حفظ أخير عند الإغلاق
+
+    rebuilt = UsageTracker(path, flush_interval=0)
+    assert rebuilt.get_usage_stats("1.1.1.1", "agent")["today_usage"] == 1
+    assert rebuilt.get_usage_stats("2.2.2.2", "agent")["today_usage"] == 3
+    assert not rebuilt.can_make_request("2.2.2.2", "agent")["allowed"]
+    rebuilt.close()
+
+
+def test_background_flush_thread_persists_counters(tmp_path):
+    path = str(tmp_path / "usage.db")
+    tracker = UsageTracker(path, flush_interval=0.05)
+    tracker.can_make_request("1.2.3.4", "agent")
+    user_hash = UsageTracker._get_user_hash(None, "1.2.3.4", "agent")
+    deadline = time.time() + 2
+    row = None
+    while row is None and time.time() < deadline:
+        time.sleep(0.05)
+        with tracker._connection() as conn:
+            row = conn.execute("SELECT request_count FROM usage_records WHERE user_hash = ?", (user_hash,)).fetchone()
+    assert row == (1,)
+    tracker.close()
+
+
+def test_configure_limiter_switches_backend_without_losing_counts(tmp_path):
+    tracker = UsageTracker(str(tmp_path / "usage.db"), flush_interval=0)
+    tracker.can_make_request("1.2.3.4", "agent")
+    tracker.can_make_request("1.2.3.4", "agent")
+
+    # عدة workers: المحدد المشترك يرى العدادات التي حفظها محدد الذاكرة
+    tracker.configure_limiter("sqlite")
+    assert tracker.limiter_kind == "sqlite"
+    assert tracker.get_usage_stats("1.2.3.4", "agent")["today_usage"] == 2
+    assert tracker.can_make_request("1.2.3.4", "agent")["allowed"]
+    assert not tracker.can_make_request("1.2.3.4", "agent")["allowed"]
+
+    tracker.configure_limiter("memory")
+    assert tracker.get_usage_stats("1.2.3.4", "agent")["today_usage"] == 3
+    tracker.close()
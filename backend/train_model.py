@@ -1,25 +1,29 @@
 import os
+import argparse
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, r2_score
 import joblib
-from appraisal_engine import AppraisalEngine
+from appraisal_engine import FEATURE_COLUMNS, AppraisalEngine
+from config_loader import get_settings
+from feature_store import FEATURE_STORE_DIR, FeatureStore
+from flat_forest import FlatForest
+from model_backends import BACKEND_FILES, write_manifest
+from training_pipeline import DEFAULT_CHUNK_ROWS, StageTimer, load_training_arrays
 
 # مسارات المشروع
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MODEL_DIR = os.path.join(BASE_DIR, "model")
-CONFIG_PATH = os.path.join(BASE_DIR, "config", "app_settings.json")
 
-def load_settings():
-    """تحميل إعدادات Google Sheets."""
-    import json
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+# حد عينة bootstrap لكل شجرة عند التدريب على ملايين الصفوف
+RF_MAX_SAMPLES = 1_000_000
 
-def prepare_training_data(sales_data):
-    """تحضير بيانات التدريب من قائمة المبيعات."""
+def prepare_training_data(sales_data, feature_store=None):
+    """تحضير بيانات التدريب من قائمة المبيعات (من مخزن الميزات إذا مُرر)."""
+    if feature_store is not None:
+        return _prepare_training_data_from_store(sales_data, feature_store)
     engine = AppraisalEngine()
     features_list = []
     prices = []
@@ -46,67 +50,187 @@ def prepare_training_data(sales_data):
         numeric_columns.append('price')
     
     return df[numeric_columns]
-def train_and_save_model():
-    """تدريب النموذج وحفظه."""
+
+def _prepare_training_data_from_store(sales_data, feature_store):
+    """نفس أعمدة prepare_training_data، لكن الميزات تُقرأ من المخزن ولا يُحسب إلا الجديد"""
+    engine = AppraisalEngine(load_model=False, feature_store=feature_store)
+    sales = [s for s in sales_data if isinstance(s, dict) and 'price' in s and isinstance(s.get('domain'), str)]
+    values, _, valid = engine.feature_rows([s['domain'] for s in sales])
+    skipped = len(sales_data) - int(valid.sum())
+    if skipped:
+        print(f"تخطي {skipped} سجل بدون نطاق أو سعر صالح")
+    df = pd.DataFrame(values[valid], columns=list(FEATURE_COLUMNS))
+    df['price'] = [s['price'] for s, ok in zip(sales, valid) if ok]
+    return df
+
+def _atomic_dump(obj, path):
+    """حفظ الملف في مسار مؤقت ثم استبداله دفعة واحدة"""
+    tmp_path = f"{path}.tmp"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+def export_flat_forest(model, X_test, expected, rtol: float = 1e-9, atol: float = 1e-6) -> FlatForest:
+    """تسطيح الغابة ورفض التصدير إذا اختلفت تنبؤاتها عن sklearn"""
+    flat = FlatForest.from_sklearn(model)
+    predicted = flat.predict(np.asarray(X_test, dtype=np.float64))
+    max_diff = float(np.max(np.abs(predicted - expected))) if len(expected) else 0.0
+    if not np.allclose(predicted, expected, rtol=rtol, atol=atol):
+        raise ValueError(f"النموذج المسطح لا يطابق sklearn (أقصى فرق {max_diff})")
+    print(f"النموذج المسطح: {flat.n_trees} شجرة، {flat.n_nodes} عقدة، أقصى فرق عن sklearn {max_diff:.2e}")
+    return flat
+
+def train_xgboost(X_train, y_train):
+    """تدريب XGBoost وإرجاع الـ booster (يُحفظ بصيغة JSON المستقلة عن إصدار بايثون)"""
+    import xgboost as xgb
+    model = xgb.XGBRegressor(
+        n_estimators=400,
+        max_depth=6,
+        learning_rate=0.05,
+        subsample=0.8,
+        colsample_bytree=0.8,
+        tree_method="hist",
+        random_state=42,
+        n_jobs=-1
+    )
+    model.fit(X_train, y_train)
+    return model.get_booster()
+
+def _evaluate(y_test, y_pred):
+    return {"mae": float(mean_absolute_error(y_test, y_pred)), "r2": float(r2_score(y_test, y_pred))}
+
+def save_models(model_dir, feature_names, model, flat, booster, metrics):
+    """حفظ كل الـ backends ثم manifest أخيراً (الخادم يعيد التحميل عند تغيّره)"""
+    os.makedirs(model_dir, exist_ok=True)
+    _atomic_dump(feature_names, os.path.join(model_dir, "feature_names.pkl"))
+    _atomic_dump(model, os.path.join(model_dir, BACKEND_FILES["sklearn"]))
+    flat.save(os.path.join(model_dir, BACKEND_FILES["flat"]))
+    files = {"sklearn": BACKEND_FILES["sklearn"], "flat": BACKEND_FILES["flat"]}
+    if booster is not None:
+        xgb_path = os.path.join(model_dir, BACKEND_FILES["xgboost"])
+        booster.save_model(f"{xgb_path}.tmp.json")
+        os.replace(f"{xgb_path}.tmp.json", xgb_path)
+        files["xgboost"] = BACKEND_FILES["xgboost"]
+    # الغابة تُخدم بالمسار المسطح؛ XGBoost فقط إذا كان أدق على بيانات الاختبار
+    best = "flat"
+    if "xgboost" in metrics and metrics["xgboost"]["mae"] < metrics["flat"]["mae"]:
+        best = "xgboost"
+    return write_manifest(model_dir, feature_names, best, files, metrics)
+
+def fit_and_save(X, y, feature_names, model_dir=MODEL_DIR, timer=None):
+    """تدريب الغابة و XGBoost على مصفوفة ميزات جاهزة وحفظ كل الـ backends."""
+    timer = timer or StageTimer()
+    if not isinstance(X, pd.DataFrame):
+        # بدون نسخ: أسماء الأعمدة فقط (feature_names_in_ كما في مسار DataFrame)
+        X = pd.DataFrame(X, columns=feature_names, copy=False)
+    
+    # تقسيم البيانات
+    with timer.stage("split"):
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42
+        )
+    
+    print(f"جارٍ تدريب النموذج على {len(X_train):,} صف...")
+    with timer.stage("random_forest"):
+        model = RandomForestRegressor(
+            n_estimators=200,
+            max_depth=12,
+            min_samples_split=5,
+            # عينة bootstrap محدودة لكل شجرة: الذاكرة والزمن لا يكبران مع ملايين الصفوف
+            max_samples=RF_MAX_SAMPLES if len(X_train) > RF_MAX_SAMPLES else None,
+            random_state=42,
+            n_jobs=-1
+        )
+        model.fit(X_train, y_train)
+    
+        # تقييم الأداء
+        y_pred = model.predict(X_test)
+    metrics = {"sklearn": _evaluate(y_test, y_pred)}
+    
+    print(f"متوسط الخطأ المطلق (MAE): ${metrics['sklearn']['mae']:,.0f}")
+    print(f"معامل التحديد (R²): {metrics['sklearn']['r2']:.3f}")
+    
+    # تصدير الغابة كمصفوفات مسطحة مع التحقق من تطابقها مع sklearn على بيانات الاختبار
+    with timer.stage("flat_export"):
+        flat = export_flat_forest(model, X_test, y_pred)
+    metrics["flat"] = dict(metrics["sklearn"])
+    
+    print("جارٍ تدريب XGBoost...")
+    with timer.stage("xgboost"):
+        booster = train_xgboost(X_train, y_train)
+        metrics["xgboost"] = _evaluate(y_test, booster.inplace_predict(np.asarray(X_test, dtype=np.float32)))
+    print(f"XGBoost MAE: ${metrics['xgboost']['mae']:,.0f}  R²: {metrics['xgboost']['r2']:.3f}")
+    
+    # حفظ النماذج وأسماء الميزات (كتابة ذرية حتى لا يقرأ الخادم ملفاً ناقصاً أثناء إعادة التحميل)
+    with timer.stage("save"):
+        manifest = save_models(model_dir, feature_names, model, flat, booster, metrics)
+    
+    print(f"تم حفظ النموذج في: {model_dir} (backend الافتراضي: {manifest['backend']})")
+    return manifest
+
+def _load_sheets_training_data(timer):
+    """بيانات التدريب من Google Sheets (نفس مصدر الخادم) عبر مخزن الميزات"""
     print("جارٍ تحميل الإعدادات...")
-    settings = load_settings()
+    settings = get_settings()
     
     print("جارٍ تحميل بيانات المبيعات من Google Sheets...")
     from sales_loader import load_sales_from_google_sheets
-    sales = load_sales_from_google_sheets(
-        settings['google_sheets_csv_url'],
-        cache_ttl=0  # لا تستخدم التخزين المؤقت للتدريب
-    )
+    with timer.stage("load_sales"):
+        sales = load_sales_from_google_sheets(
+            settings['google_sheets_spreadsheet_id'],
+            settings.get('google_sheets_sheet_name', 'Sheet1'),
+            cache_ttl=0,  # لا تستخدم التخزين المؤقت للتدريب
+            incremental=False
+        )
     
     if len(sales) < 100:
         raise ValueError(f"بيانات غير كافية للتدريب. العدد الحالي: {len(sales)}")
     
     print(f"تم تحميل {len(sales)} سجل مبيعات.")
     
-    # تحضير البيانات
-    df = prepare_training_data(sales)
+    # الميزات المحسوبة سابقاً (من الخادم أو تدريب سابق) تُقرأ من المخزن
+    store = None
+    if settings.get('feature_store_enabled', True):
+        store = FeatureStore(settings.get('feature_store_path') or FEATURE_STORE_DIR)
+    with timer.stage("features"):
+        df = prepare_training_data(sales, feature_store=store)
+    if store is not None:
+        print(f"مخزن الميزات: {store.stats['hits']} من المخزن، {store.stats['computed']} محسوبة")
     if df.empty:
         raise ValueError("فشل في استخراج الميزات من البيانات.")
-    
-    # فصل الميزات عن الهدف
-    X = df.drop('price', axis=1)
-    y = df['price']
-    
-    # حفظ أسماء الميزات
-    feature_names = list(X.columns)
-    
-    # تقسيم البيانات
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
-    
-    print("جارٍ تدريب النموذج...")
-    model = RandomForestRegressor(
-        n_estimators=200,
-        max_depth=12,
-        min_samples_split=5,
-        random_state=42,
-        n_jobs=-1
-    )
-    model.fit(X_train, y_train)
-    
-    # تقييم الأداء
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"متوسط الخطأ المطلق (MAE): ${mae:,.0f}")
-    print(f"معامل التحديد (R²): {r2:.3f}")
-    
-    # إنشاء مجلد النموذج إذا لم يكن موجودًا
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    
-    # حفظ النموذج وأسماء الميزات
-    joblib.dump(model, os.path.join(MODEL_DIR, "domain_valuation_model.pkl"))
-    joblib.dump(feature_names, os.path.join(MODEL_DIR, "feature_names.pkl"))
-    
-    print(f"تم حفظ النموذج في: {MODEL_DIR}")
+    return df.drop('price', axis=1), df['price']
+
+def train_and_save_model(data_paths=None, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None, max_rows=None):
+    """
+    تدريب النموذج وحفظه.
+    مع data_paths (ملفات CSV/Parquet محلية) تُقرأ البيانات على دفعات وتُحسب الميزات بشكل متجه،
+    وإلا تُحمّل المبيعات من Google Sheets.
+    """
+    timer = StageTimer()
+    if data_paths:
+        with timer.stage("load_features"):
+            X, y, stats = load_training_arrays(data_paths, chunk_rows=chunk_rows, workers=workers, max_rows=max_rows)
+        print(f"تمت قراءة {stats['rows_read']:,} صف ({stats['rows_valid']:,} صالح) في {stats['chunks']} دفعة: "
+              f"قراءة {stats['read_seconds']:.1f}s، ميزات {stats['feature_seconds']:.1f}s")
+        if len(y) < 100:
+            raise ValueError(f"بيانات غير كافية للتدريب. العدد الحالي: {len(y)}")
+        feature_names = list(FEATURE_COLUMNS)
+    else:
+        X, y = _load_sheets_training_data(timer)
+        # حفظ أسماء الميزات
+        feature_names = list(X.columns)
+    
+    fit_and_save(X, y, feature_names, timer=timer)
+    timer.report()
     print("التدريب اكتمل بنجاح!")
 
+def main():
+    parser = argparse.ArgumentParser(description="تدريب نموذج تقييم النطاقات")
+    parser.add_argument("--data", nargs="+", help="ملفات مبيعات محلية (CSV أو Parquet) بدل Google Sheets")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="عدد الصفوف في كل دفعة قراءة")
+    parser.add_argument("--workers", type=int, default=None, help="عدد عمليات حساب الميزات (الافتراضي عدد الأنوية)")
+    parser.add_argument("--max-rows", type=int, default=None, help="عينة عشوائية بهذا الحجم بدل كل الصفوف")
+    args = parser.parse_args()
+    train_and_save_model(args.data, chunk_rows=args.chunk_rows, workers=args.workers, max_rows=args.max_rows)
+
 if __name__ == "__main__":
-    train_and_save_model()
\ No newline at end of file
+    main()
@@ -0,0 +1,231 @@
+# backend/training_pipeline.py
+import os
+import sys
+import time
+import resource
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from appraisal_engine import (FEATURE_COLUMNS, KEYWORD_CATEGORY_MAP, AppraisalEngine, get_keyword_matcher,
+                              reload_keyword_map)
+from sales_loader import DOMAIN_PATTERN, _parse_price
+
+# عدد الصفوف المقروءة في كل دفعة (الذاكرة تتناسب معه لا مع حجم الملف)
+DEFAULT_CHUNK_ROWS = 200_000
+
+
+def peak_rss_mb() -> float:
+    """ذروة استهلاك الذاكرة للعملية وعملياتها الفرعية المنتهية (MB)"""
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss بالبايت على macOS وبالـ KB على Linux
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * scale / (1024 * 1024)
+
+
+class StageTimer:
+    """زمن كل مرحلة من التدريب وذروة الذاكرة عند نهايتها"""
+
+    def __init__(self):
+        self.stages: Dict[str, Tuple[float, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.stages[name] = (seconds, peak_rss_mb())
+            print(f"[{name}] {seconds:.2f}s، ذروة الذاكرة {self.stages[name][1]:,.0f}MB")
+
+    def report(self) -> None:
+        print(f"{'stage':<16} {'seconds':>9} {'peak RSS':>10}")
+        for name, (seconds, peak) in self.stages.items():
+            print(f"{name:<16} {seconds:9.2f} {peak:8,.0f}MB")
+        print(f"{'total':<16} {sum(s for s, _ in self.stages.values()):9.2f}")
+
+
+def _sales_columns(names: List[str]) -> List[str]:
+    """عمودا النطاق والسعر: بالاسم إن وُجد، وإلا أول عمودين (نفس ترتيب جدول المبيعات)"""
+    lower = {str(name).strip().lower(): name for name in names}
+    if "domain" in lower and "price" in lower:
+        return [lower["domain"], lower["price"]]
+    if len(names) < 2:
+        raise ValueError(f"Sales dump needs domain and price columns, got {list(names)}")
+    return list(names[:2])
+
+
+def iter_sales_chunks(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """قراءة ملف CSV (أو csv.gz) أو Parquet على دفعات: DataFrame بعمودي domain و price"""
+    if path.endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Reading Parquet dumps requires pyarrow (pip install -r requirements.txt)")
+        parquet = pq.ParquetFile(path)
+        columns = _sales_columns(parquet.schema_arrow.names)
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()[columns].set_axis(["domain", "price"], axis=1)
+        return
+
+    columns = _sales_columns(list(pd.read_csv(path, nrows=0).columns))
+    for chunk in pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        yield chunk[columns].set_axis(["domain", "price"], axis=1)
+
+
+def clean_sales_chunk(chunk: pd.DataFrame) -> Tuple[pd.Series, np.ndarray]:
+    """نسخة متجهة من تحقق _parse_sales_rows: (النطاقات الصالحة، أسعارها)"""
+    domains = chunk["domain"].astype(str).str.strip().str.lower()
+    raw = chunk["price"]
+    if pd.api.types.is_numeric_dtype(raw):
+        prices = raw.astype(np.float64)
+    else:
+        # نفس قواعد _parse_price: إزالة الرموز، والفاصلة عشرية فقط إذا لم توجد نقطة
+        cleaned = raw.astype(str).str.replace(r"[^\d.,]", "", regex=True)
+        has_comma, has_dot = cleaned.str.contains(",", regex=False), cleaned.str.contains(".", regex=False)
+        cleaned = cleaned.where(~(has_comma & ~has_dot), cleaned.str.replace(",", ".", regex=False))
+        cleaned = cleaned.where(~(has_comma & has_dot), cleaned.str.replace(",", "", regex=False))
+        prices = pd.to_numeric(cleaned, errors="coerce")
+        # أرقام غير ASCII وما شابه: المسار البطيء لصفوف قليلة
+        retry = prices.isna() & cleaned.ne("")
+        if retry.any():
+            prices[retry] = raw[retry].map(_parse_price).astype(np.float64)
+    valid = domains.str.match(DOMAIN_PATTERN) & prices.notna() & prices.ne(0)
+    return domains[valid].reset_index(drop=True), prices[valid].to_numpy(dtype=np.float64)
+
+
+def vectorized_features(domains: pd.Series, engine: Optional[AppraisalEngine] = None) -> pd.DataFrame:
+    """
+    نفس ميزات AppraisalEngine._build_features لنطاقات صالحة (أحرف صغيرة وفيها نقطة) بعمليات نصية متجهة.
+    درجة الكلمات المفتاحية فقط تمر على المطابق، مرة لكل اسم فريد.
+    """
+    if domains.empty:
+        return pd.DataFrame({name: pd.Series(dtype=np.float64) for name in FEATURE_COLUMNS})
+    engine = engine or AppraisalEngine(load_model=False)
+    parts = domains.str.rsplit(".", n=1, expand=True)
+    names, tlds = parts[0], parts[1]
+    length = names.str.len()
+    digit_count = names.str.count(r"\d")
+    matcher = get_keyword_matcher()
+    unique_names = pd.unique(names)
+    keyword_scores = dict(zip(unique_names, (matcher.analyze(name)[2] for name in unique_names)))
+    return pd.DataFrame({
+        "length": length,
+        "tld_score": tlds.map(engine.get_realistic_tld_scores()).fillna(0.1),
+        "has_hyphen": names.str.contains("-", regex=False).astype(np.int64),
+        "has_digits": (digit_count > 0).astype(np.int64),
+        "digit_count": digit_count,
+        "vowel_ratio": names.str.count("[aeiou]") / length.clip(lower=1),
+        "keyword_score": names.map(keyword_scores),
+        "is_brandable": (length.between(5, 12) & ~names.str.isdigit()).astype(np.int64),
+    }, columns=list(FEATURE_COLUMNS))
+
+
+def _chunk_arrays(chunk: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, int, float]:
+    """(X float32، y، عدد الصفوف الخام، زمن الحساب) لدفعة واحدة"""
+    started = time.perf_counter()
+    domains, prices = clean_sales_chunk(chunk)
+    # float32 هو ما تستخدمه الغابة و XGBoost داخلياً: نصف الذاكرة بدون تغيير النموذج
+    # النطاقات تتكرر في المبيعات: الميزات تُحسب مرة لكل نطاق فريد ثم تُوزع على الصفوف
+    codes, unique_domains = pd.factorize(domains)
+    features = vectorized_features(pd.Series(unique_domains)).to_numpy(dtype=np.float32)[codes]
+    return features, prices, len(chunk), time.perf_counter() - started
+
+
+def _init_worker(keyword_map: Dict[str, str]) -> None:
+    # عمليات spawn تبدأ بالخريطة الافتراضية: نستخدم نفس خريطة العملية الرئيسية
+    if keyword_map != KEYWORD_CATEGORY_MAP:
+        reload_keyword_map(keyword_map)
+
+
+class _Reservoir:
+    """عينة عشوائية منتظمة بحجم ثابت من كل الصفوف (Algorithm R على دفعات)"""
+
+    def __init__(self, max_rows: int, n_features: int, seed: int):
+        self.X = np.empty((max_rows, n_features), dtype=np.float32)
+        self.y = np.empty(max_rows, dtype=np.float64)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, X: np.ndarray, y: np.ndarray) -> None:
+        capacity = len(self.y)
+        fill = max(0, min(capacity - self.seen, len(y)))
+        self.X[self.seen:self.seen + fill], self.y[self.seen:self.seen + fill] = X[:fill], y[:fill]
+        if fill < len(y):
+            # الصف رقم i يحل محل موضع عشوائي j < capacity باحتمال capacity / (i + 1)
+            targets = self.rng.integers(0, np.arange(self.seen + fill, self.seen + len(y)) + 1)
+            keep = targets < capacity
+            self.X[targets[keep]], self.y[targets[keep]] = X[fill:][keep], y[fill:][keep]
+        self.seen += len(y)
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        size = min(self.seen, len(self.y))
+        return self.X[:size], self.y[:size]
+
+
+def load_training_arrays(paths: Sequence[str], chunk_rows: int = DEFAULT_CHUNK_ROWS, workers: Optional[int] = None,
+                         max_rows: Optional[int] = None, seed: int = 42) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """
+    قراءة ملفات المبيعات على دفعات وحساب ميزات FEATURE_COLUMNS لكل دفعة.
+    مع workers > 1 تُحسب الدفعات في عمليات منفصلة (بحد أقصى دفعتين قيد التنفيذ لكل عملية)،
+    ومع max_rows تُحفظ عينة عشوائية بهذا الحجم بدل كل الصفوف. الترتيب ثابت مهما كان عدد العمليات.
+    """
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    stats = {"files": len(paths), "chunks": 0, "rows_read": 0, "rows_valid": 0,
+             "read_seconds": 0.0, "feature_seconds": 0.0}
+    parts: List[Tuple[np.ndarray, np.ndarray]] = []
+    reservoir = _Reservoir(max_rows, len(FEATURE_COLUMNS), seed) if max_rows else None
+
+    def consume(result):
+        X, y, rows, seconds = result
+        stats["chunks"] += 1
+        stats["rows_read"] += rows
+        stats["rows_valid"] += len(y)
+        stats["feature_seconds"] += seconds
+        if reservoir is not None:
+            reservoir.add(X, y)
+        else:
+            parts.append((X, y))
+
+    def chunks():
+        for path in paths:
+            iterator = iter_sales_chunks(path, chunk_rows)
+            while True:
+                started = time.perf_counter()
+                chunk = next(iterator, None)
+                stats["read_seconds"] += time.perf_counter() - started
+                if chunk is None:
+                    break
+                yield chunk
+
+    if workers <= 1:
+        for chunk in chunks():
+            consume(_chunk_arrays(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker,
+                                 initargs=(dict(KEYWORD_CATEGORY_MAP),)) as pool:
+            pending = deque()
+            for chunk in chunks():
+                pending.append(pool.submit(_chunk_arrays, chunk))
+                if len(pending) >= workers * 2:
+                    consume(pending.popleft().result())
+            while pending:
+                consume(pending.popleft().result())
+
+    if reservoir is not None:
+        X, y = reservoir.result()
+    elif parts:
+        X = np.concatenate([p[0] for p in parts])
+        y = np.concatenate([p[1] for p in parts])
+    else:
+        X, y = np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32), np.empty(0, dtype=np.float64)
+    stats["read_seconds"] = round(stats["read_seconds"], 3)
+    stats["feature_seconds"] = round(stats["feature_seconds"], 3)
+    return X, y, stats
@@ -1,12 +1,19 @@
 # backend/usage_tracker.py
 import sqlite3
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import hashlib
 
+from rate_limiter import create_limiter
+
 class UsageTracker:
-    def __init__(self, db_path: str = "usage.db"):
+    def __init__(self, db_path: str = "usage.db", pool_size: int = 8,
+                 limiter: str = "memory", flush_interval: float = 2.0):
         # تأكد من أن المسار مطلق أو في المجلد الحالي
         if not os.path.isabs(db_path):
             # استخدم المسار الحالي للمشروع
@@ -14,9 +21,91 @@ class UsageTracker:
             self.db_path = os.path.join(base_dir, db_path)
         else:
             self.db_path = db_path
-        
+
+        # اتصالات طويلة العمر يُعاد استخدامها بدل فتح اتصال جديد لكل طلب
+        self.pool_size = pool_size
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._pool_lock = threading.Lock()
+
         self._init_db()
-    
+
+        self.flush_interval = flush_interval
+        self.limiter_kind = limiter
+        self.limiter = self._create_limiter(limiter)
+
+    def _create_limiter(self, kind: str):
+        # "memory": عدادات في الذاكرة تُحفظ على دفعات، "sqlite": UPSERT لكل طلب (عدة workers)
+        limiter_kwargs = {"flush_interval": self.flush_interval} if kind == "memory" else {}
+        return create_limiter(kind, self._connection, **limiter_kwargs)
+
+    def configure_limiter(self, kind: str) -> None:
+        """
+        تبديل نوع المحدد (إعداد rate_limiter). المحدد "memory" يعد الطلبات داخل العملية فقط:
+        مع عدة workers/عمليات يحصل كل منها على حده اليومي الخاص، فاستخدم "sqlite".
+        """
+        if kind == self.limiter_kind:
+            return
+        new_limiter = self._create_limiter(kind)
+        old_limiter, self.limiter, self.limiter_kind = self.limiter, new_limiter, kind
+        # حفظ عدادات المحدد القديم المعلقة حتى يراها الجديد في usage_records
+        try:
+            old_limiter.close()
+        except Exception as e:
+            print(f"⚠️ فشل حفظ عدادات الاستخدام: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit: كل عبارة (مثل UPSERT) ذرية بذاتها
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        if self.db_path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """اتصال من المجمع (يُنشأ عند الحاجة حتى pool_size ثم ينتظر اتصالاً حراً)"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._pool_lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def flush(self) -> int:
+        """حفظ العدادات المعلقة في قاعدة البيانات"""
+        return self.limiter.flush()
+
+    def close(self):
+        """حفظ العدادات المعلقة ثم إغلاق كل الاتصالات في المجمع"""
+        limiter = getattr(self, "limiter", None)
+        if limiter is not None:
+            try:
+                limiter.close()
+            except Exception as e:
+                print(f"⚠️ فشل حفظ عدادات الاستخدام: {e}")
+        with self._pool_lock:
+            while True:
+                try:
+                    self._pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
     def _init_db(self):
         """تهيئة قاعدة البيانات"""
         try:
@@ -24,96 +113,86 @@ class UsageTracker:
             db_dir = os.path.dirname(self.db_path)
             if db_dir and not os.path.exists(db_dir):
                 os.makedirs(db_dir, exist_ok=True)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS usage_records (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_hash TEXT NOT NULL,
-                    date TEXT NOT NULL,
-                    request_count INTEGER DEFAULT 0,
-                    last_request TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_user_date 
-                ON usage_records(user_hash, date)
-            ''')
-            
-            conn.commit()
-            conn.close()
+
+            with self._connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS usage_records (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_hash TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        request_count INTEGER DEFAULT 0,
+                        last_request TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                self._ensure_unique_user_date(conn)
             print(f"✅ قاعدة بيانات الاستخدام جاهزة: {self.db_path}")
-            
+
         except Exception as e:
             print(f"❌ خطأ في تهيئة قاعدة البيانات: {e}")
-            # استخدم قاعدة بيانات في الذاكرة كبديل
+            # استخدم قاعدة بيانات في الذاكرة كبديل (اتصال واحد: كل اتصال بالذاكرة قاعدة منفصلة)
+            self.close()
             self.db_path = ":memory:"
-    
+            self.pool_size = 1
+
+    def _ensure_unique_user_date(self, conn: sqlite3.Connection):
+        """
+        سجل واحد لكل (مستخدم، يوم): شرط UPSERT الذري.
+        قواعد البيانات القديمة قد تحتوي على سجلات مكررة فنبقي السجل الأعلى عداً.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute('''
+                DELETE FROM usage_records WHERE id NOT IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (
+                            PARTITION BY user_hash, date ORDER BY request_count DESC, id
+                        ) AS rank
+                        FROM usage_records
+                    ) WHERE rank = 1
+                )
+            ''')
+            conn.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_user_date_unique
+                ON usage_records(user_hash, date)
+            ''')
+            # الفهرس القديم غير الفريد أصبح زائداً
+            conn.execute('DROP INDEX IF EXISTS idx_user_date')
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
     def _get_user_hash(self, ip: str, user_agent: str) -> str:
         """إنشاء hash فريد للمستخدم"""
         unique_string = f"{ip}-{user_agent}"
         return hashlib.md5(unique_string.encode()).hexdigest()
-    
+
     def can_make_request(self, ip: str, user_agent: str, daily_limit: int = 3) -> Dict[str, Any]:
-        """التحقق مما إذا كان يمكن للمستخدم إجراء طلب"""
+        """التحقق مما إذا كان يمكن للمستخدم إجراء طلب (الفحص والزيادة عملية ذرية واحدة)"""
         try:
             user_hash = self._get_user_hash(ip, user_agent)
             today = datetime.now().strftime("%Y-%m-%d")
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # البحث عن السجل اليومي
-            cursor.execute('''
-                SELECT request_count, last_request 
-                FROM usage_records 
-                WHERE user_hash = ? AND date = ?
-            ''', (user_hash, today))
-            
-            result = cursor.fetchone()
-            
-            if result:
-                request_count, last_request = result
-                remaining = daily_limit - request_count
-                
-                if request_count >= daily_limit:
-                    conn.close()
-                    return {
-                        "allowed": False,
-                        "remaining": 0,
-                        "reset_time": "tomorrow",
-                        "message": "You have used all your daily requests (3/3). Please come back tomorrow."
-                    }
-                
-                # تحديث العداد
-                cursor.execute('''
-                    UPDATE usage_records 
-                    SET request_count = request_count + 1, last_request = ?
-                    WHERE user_hash = ? AND date = ?
-                ''', (datetime.now().isoformat(), user_hash, today))
-                
-            else:
-                # إنشاء سجل جديد
-                cursor.execute('''
-                    INSERT INTO usage_records (user_hash, date, request_count, last_request)
-                    VALUES (?, ?, 1, ?)
-                ''', (user_hash, today, datetime.now().isoformat()))
-                remaining = daily_limit - 1
-            
-            conn.commit()
-            conn.close()
-            
+
+            # زيادة العداد فقط إذا كان تحت الحد
+            count = self.limiter.hit(user_hash, today, daily_limit, datetime.now().isoformat())
+
+            if count is None:
+                return {
+                    "allowed": False,
+                    "remaining": 0,
+                    "reset_time": "tomorrow",
+                    "message": "You have used all your daily requests (3/3). Please come back tomorrow."
+                }
+
+            remaining = max(0, daily_limit - count)
             return {
                 "allowed": True,
                 "remaining": remaining,
                 "reset_time": "tomorrow",
                 "message": f"Your remaining requests today: {remaining}/3"
             }
-            
+
         except Exception as e:
             print(f"⚠️ خطأ في تتبع الاستخدام: {e}")
             # في حالة الخطأ، اسمح بالطلب لتجنب تعطيل الخدمة
@@ -123,25 +202,15 @@ class UsageTracker:
                 "reset_time": "unknown",
                 "message": "Usage tracking is temporarily disabled"
             }
-    
+
     def get_usage_stats(self, ip: str, user_agent: str) -> Dict[str, Any]:
         """الحصول على إحصائيات الاستخدام"""
         try:
             user_hash = self._get_user_hash(ip, user_agent)
             today = datetime.now().strftime("%Y-%m-%d")
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT request_count, last_request 
-                FROM usage_records 
-                WHERE user_hash = ? AND date = ?
-            ''', (user_hash, today))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
+
+            result = self.limiter.usage(user_hash, today)
+
             if result:
                 request_count, last_request = result
                 return {
@@ -157,7 +226,7 @@ class UsageTracker:
                     "last_request": None,
                     "limit": 3
                 }
-                
+
         except Exception as e:
             print(f"⚠️ خطأ في جلب إحصائيات الاستخدام: {e}")
             return {
@@ -166,26 +235,49 @@ class UsageTracker:
                 "last_request": None,
                 "limit": 3
             }
-    
-    def cleanup_old_records(self, days: int = 30):
-        """تنظيف السجلات القديمة"""
+
+    def cleanup_old_records(self, days: int = 30, batch_size: int = 500, pause_seconds: float = 0.01) -> int:
+        """تنظيف السجلات القديمة على دفعات صغيرة حتى لا يُحجز قفل الكتابة طويلاً"""
+        removed = 0
         try:
             cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                DELETE FROM usage_records 
-                WHERE date < ?
-            ''', (cutoff_date,))
-            
-            conn.commit()
-            conn.close()
-            print(f"✅ تم تنظيف السجلات الأقدم من {days} يوم")
-            
+            self.limiter.forget_before(cutoff_date)
+
+            while True:
+                with self._connection() as conn:
+                    deleted = conn.execute('''
+                        DELETE FROM usage_records WHERE id IN (
+                            SELECT id FROM usage_records WHERE date < ? LIMIT ?
+                        )
+                    ''', (cutoff_date, batch_size)).rowcount
+                removed += deleted
+                if deleted < batch_size:
+                    break
+                # إفساح المجال لطلبات الكتابة الحقيقية بين الدفعات
+                time.sleep(pause_seconds)
+            print(f"✅ تم تنظيف السجلات الأقدم من {days} يوم ({removed} سجل)")
+
         except Exception as e:
             print(f"⚠️ خطأ في تنظيف السجلات القديمة: {e}")
+        return removed
+
+    def optimize(self, vacuum: bool = False) -> Dict[str, Any]:
+        """تحديث إحصائيات المخطط (ANALYZE) واختيارياً ضغط الملف (VACUUM)"""
+        with self._connection() as conn:
+            conn.execute("ANALYZE")
+            if vacuum:
+                conn.execute("VACUUM")
+            if self.db_path != ":memory:":
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {"vacuum": vacuum, "size_bytes": pages * page_size}
+
+    def reset_all(self):
+        """حذف كل سجلات الاستخدام"""
+        self.limiter.reset()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM usage_records")
 
 # إنشاء instance عالمي
-usage_tracker = UsageTracker()
\ No newline at end of file
+usage_tracker = UsageTracker()